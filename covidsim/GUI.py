@@ -13,19 +13,92 @@ Used by simulation.py.
 # External modules
 from tkinter import *
 from tkinter import ttk
+from tkinter import messagebox
 from matplotlib.backends.backend_tkagg import (FigureCanvasTkAgg, NavigationToolbar2Tk)
 from matplotlib.backend_bases import key_press_handler
 from matplotlib.figure import Figure
-import numpy as np
-import pickle
-import os
-import time
+import queue
+import threading
+import traceback
 from PIL import ImageTk, Image
 # Directory modules
 from covidsim.office import Office
+from covidsim.export import RasterRenderer
+from covidsim.instrumentation import Instrumentation
 import covidsim.simulation as simulation
+import covidsim.frames as frames
 import gc
 
+# Time between checks for frames and progress from the background worker in milliseconds, which is also the time each
+# frame is shown for
+POLL_INTERVAL = 33
+# Number of frames and progress messages the background worker may get ahead of the GUI
+QUEUE_SIZE = 60
+# Frame store that the display frames of the last simulation are recorded to, for replay and saving
+FRAME_DIRECTORY = './gui_files/frames'
+
+
+class TaskCancelled(Exception):
+    """Raised in the background worker when its task is cancelled from the GUI"""
+
+
+class BackgroundWorker:
+    """Runs a task of the GUI, e.g. a simulation, in a background thread so that the GUI keeps responding while it runs.
+    The task is called with the worker, which it passes frames and progress to through a queue that the GUI polls:
+
+        ('frame', frame, timestamp)     A display frame to show. The worker can be given to simulation.main as its
+                                        exporter, so that frames are shown as they are produced.
+        ('progress', done, total)       Progress of a task without frames.
+        ('done', result)                The task has finished, or failed ('error', message).
+
+    The worker stops its task at the next frame or progress message once it is cancelled. Every message is dropped once
+    the task is cancelled, so the worker never waits on a GUI that has stopped polling it, and a cancelled task has
+    ended once its thread has.
+
+    """
+
+    def __init__(self, task):
+        """Start a task in a background thread"""
+        self.messages = queue.Queue(QUEUE_SIZE)
+        self.cancel_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(task,), daemon=True)
+        self.thread.start()
+
+    def run(self, task):
+        """Run the task and pass on how it ended, unless it is cancelled"""
+        try:
+            message = ('done', task(self))
+        except TaskCancelled:
+            return
+        except SystemExit:
+            # Inputs are checked by simulation.py, which prints why they are invalid
+            message = ('error', 'Invalid simulation inputs, see the command window for details.')
+        except Exception:
+            message = ('error', traceback.format_exc())
+        try:
+            self.put(*message)
+        except TaskCancelled:
+            pass
+
+    def put(self, *message):
+        """Pass a message to the GUI, waiting while the GUI is behind, unless the task is cancelled"""
+        while True:
+            if self.cancel_event.is_set():
+                raise TaskCancelled
+            try:
+                self.messages.put(message, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def add(self, frame, timestamp):
+        """Pass a display frame to the GUI"""
+        self.put('frame', frame, timestamp)
+
+    def cancel(self):
+        """Cancel the task"""
+        self.cancel_event.set()
+
 
 # Main body
 def GUI():
@@ -49,10 +122,15 @@ def GUI():
         Once the user has specified their parameters they  can begin the simulation by pressing the "Begin Simulation"
         button - This passes on the parameters to simulation.py.
 
-        The simulated office space is then shown for each discrete time event.
+        The simulated office space is then shown for each discrete time event, as the simulation runs. The simulation,
+        replays and saving run in a background worker (see BackgroundWorker), so the GUI keeps responding while they
+        run: their progress is shown below the buttons, and they can be stopped with the "Cancel" button.
 
         Additionally there is a button to save the Animation which saves the Matplotlib frames as a GIF
 
+        If the "Record timings" box is ticked, a report of where the time of the simulation went is shown once it has
+        been played, and the timings of each time step are saved to ./gui_files/profile_trace.jsonl
+
         The function is seperated into the following subsections:
 
             - (1) Functions which handle callbacks *Note: These fuctions must be nested within GUI for the widget
@@ -182,29 +260,13 @@ def GUI():
 
     def update_plot(frame, timestamp):
         """Update the GUI office plot"""
-        # Get number of people who are infected or contagious based on number of
-        # array cells in red and orange
-        infected_no = np.count_nonzero(frame == 177) + np.count_nonzero(frame == 237)
-        # Add number of healthy people to infected and contagious people to get
-        # total population.
-        # This is necessary as the simulation only outputs display frames without
-        # explicit infection data
-        people_no = infected_no + np.count_nonzero(frame == 22)
-        # Create infection plot from display frame
-        test_plot = Figure(figsize=(6, 7), dpi=100, )
-        new_plot = test_plot.add_subplot()
-        new_plot.imshow(frame)
-        new_plot.axis('off')
-        new_plot.title.set_text('Time: ' + str(timestamp)
-                                    + '          Number of Infected: '
-                                    + str(infected_no)
-                                    + '/' + str(people_no))
-
-        # Create a new canvas which the updated frame is plotted onto
-        newcanvas = FigureCanvasTkAgg(test_plot, master=figframe)
-        newcanvas.get_tk_widget().grid(column=0, row=1, sticky='we')
-        newcanvas.draw_idle()
-        figframe.update()
+        # Render the display frame with its title, and show it on the existing canvas rather than a new one
+        image = renderer.render(frame, timestamp)
+        office_image.set_data(image)
+        office_image.set_extent((-0.5, image.shape[1] - 0.5, image.shape[0] - 0.5, -0.5))
+        office_plot.set_xlim(-0.5, image.shape[1] - 0.5)
+        office_plot.set_ylim(image.shape[0] - 0.5, -0.5)
+        canvas.draw_idle()
 
     def inc_lb_inf_people():
         """Increase the number of infected label if applicable and check that it doesnt exceed the number of people or
@@ -244,8 +306,9 @@ def GUI():
         parameters.update({"Virality": virality})  # Update virality in parameters
 
     def switch_on_begin_sim_button_state():
-        """Switch on the begin button state (such that it can be pressed)"""
-        begin_sim_button.state(['!disabled'])
+        """Switch on the begin button state (such that it can be pressed), unless a task is running in the background"""
+        if worker is None or not worker.thread.is_alive():
+            begin_sim_button.state(['!disabled'])
 
     def switch_off_begin_sim_button_state():
         """Switch off the begin button state (such that it cannot be pressed)"""
@@ -254,64 +317,131 @@ def GUI():
         else:
             begin_sim_button.state(['disabled'])
 
+    def set_task_running(running):
+        """Disable the simulation buttons and enable the cancel button while a task runs in the background, and the
+        reverse once it has ended. Replay and save are only enabled once a simulation has been saved."""
+        begin_sim_button.state(['disabled'] if running else ['!disabled'])
+        saved = frames.frame_store_exists(FRAME_DIRECTORY)
+        save_sim_button.state(['disabled'] if running or not saved else ['!disabled'])
+        replay_animation_button.state(['disabled'] if running or not saved else ['!disabled'])
+        cancel_button.state(['!disabled'] if running else ['disabled'])
+
+    def start_task(task, description, total, on_done=None):
+        """Run a task in a background worker, showing its frames and progress as it runs. on_done is called with the
+        result of the task if it finishes"""
+        nonlocal worker
+        set_task_running(True)
+        progress_bar.config(maximum=total, value=0)
+        progress_label['text'] = description + '...'
+        worker = BackgroundWorker(task)
+        root.after(POLL_INTERVAL, poll_worker, description, on_done)
+
+    def poll_worker(description, on_done):
+        """Show the next frame and any progress passed by the background worker, until its task ends"""
+        while True:
+            try:
+                message = worker.messages.get_nowait()
+            except queue.Empty:
+                if worker.cancel_event.is_set() and not worker.thread.is_alive():
+                    # A cancelled worker passes on no message of how it ended
+                    end_task(description, ('cancelled', None), on_done)
+                    return
+                break
+            if message[0] == 'frame':
+                if worker.cancel_event.is_set():
+                    continue  # skip frames that are left once cancelled
+                frame, timestamp = message[1:]
+                update_plot(frame, timestamp + 1)
+                progress_bar.config(value=timestamp + 1)
+                progress_label['text'] = description + ': ' + str(timestamp + 1) + ' of ' + str(
+                    int(progress_bar['maximum']))
+                break  # show one frame each poll
+            elif message[0] == 'progress':
+                done, total = message[1:]
+                progress_bar.config(maximum=total, value=done)
+                progress_label['text'] = description + ': ' + str(done) + ' of ' + str(total)
+            else:
+                end_task(description, message, on_done)
+                return
+        root.after(POLL_INTERVAL, poll_worker, description, on_done)
+
+    def end_task(description, message, on_done):
+        """Re-enable the GUI once the task of the background worker has ended, and report how it ended"""
+        set_task_running(False)
+        status, result = message
+        if status == 'done':
+            progress_label['text'] = description + ' finished'
+            if on_done is not None:
+                on_done(result)
+        elif status == 'cancelled':
+            progress_label['text'] = description + ' cancelled'
+        else:
+            progress_label['text'] = description + ' failed'
+            messagebox.showerror(description + ' Failed', result)
+
     def begin_sim():
-        """Begin the simulation upon button press """
-        gc.collect()  # remove previous simulations from RAM     
-        begin_sim_button.state(['disabled'])  # Disable the save simulation button
-        save_sim_button.state(['disabled'])  # Disable the save simulation button
-        replay_animation_button.state(['disabled'])  # Disable the save simulation button
-        display_frames = simulation.main(parameters)
-        with open('./gui_files/frames.p', "wb") as f:
-            pickle.dump(display_frames, f)
-        timestamp = 1
-
-        for frame in display_frames:
-            update_plot(frame, timestamp)
-            time.sleep(1 / 30)
-            timestamp += 1
-
-        save_sim_button.state(['!disabled'])  # Reenable the save simulation button
-        replay_animation_button.state(['!disabled'])  # Reenable the save simulation button
-        begin_sim_button.state(['!disabled']) # Reenable the begin simulation button
+        """Begin the simulation upon button press, in a background worker which shows each frame as it is produced"""
+        gc.collect()  # remove previous simulations from RAM
+        # Record timings of the simulation if the profile box is ticked
+        instrumentation = Instrumentation() if profile_var.get() else None
+        simulation_parameters = dict(parameters)  # parameters may be changed while the simulation runs
+
+        def simulate(task_worker):
+            """Run the simulation, passing its frames to the GUI and recording them to the frame store for replay"""
+            simulation.main(simulation_parameters, task_worker, instrumentation=instrumentation,
+                            frame_directory=FRAME_DIRECTORY)
+
+        def show_timings(result):
+            """Show where the time of the simulation went and save the timings of each time step"""
+            if instrumentation is not None:
+                instrumentation.save_trace('./gui_files/profile_trace.jsonl')
+                messagebox.showinfo('Simulation Timings', instrumentation.get_report())
+
+        start_task(simulate, 'Simulating', simulation_parameters['Simulation Duration'], show_timings)
 
     def replay_animation():
         """Replay animation of simulation that has just been run"""
-        begin_sim_button.state(['disabled'])  # Disable the begin simulation button
-        save_sim_button.state(['disabled'])  # Disable the save simulation button
-        replay_animation_button.state(['disabled'])  # Reenable the save simulation button
-        # Load in frames
-        with open('./gui_files/frames.p', "rb") as f:
-            display_frames = pickle.load(f)
-        timestamp = 1
-        # Display frames
-        for frame in display_frames:
-            update_plot(frame, timestamp)
-            time.sleep(1 / 30)
-            timestamp += 1
-
-        save_sim_button.state(['!disabled'])  # Reenable the save simulation button
-        replay_animation_button.state(['!disabled'])  # Reenable the save simulation button
-        begin_sim_button.state(['!disabled']) # Reenable the begin simulation button
+        def replay(task_worker):
+            """Read frames from the frame store as they are needed and pass them to the GUI"""
+            display_frames = frames.load_frames(FRAME_DIRECTORY)
+            task_worker.put('progress', 0, len(display_frames))
+            for timestamp, frame in enumerate(display_frames):
+                task_worker.add(frame, timestamp)
 
+        start_task(replay, 'Replaying', 1)
 
     def save_sim():
-        """Save the simulation as a GIF upon button press"""
-        begin_sim_button.state(['disabled'])  # Disable the begin simulation button
-        save_sim_button.state(['disabled'])  # Disable the save simulation button
-        replay_animation_button.state(['disabled'])  # Reenable the save simulation button
-        # Load in frames
-        with open('./gui_files/frames.p', "rb") as f:
-            display_frames = pickle.load(f)
-        # Save frames
-        simulation.save_outputs(display_frames)
-        save_sim_button.state(['!disabled'])  # Reenable the save simulation button
-        replay_animation_button.state(['!disabled'])  # Reenable the save simulation button
-        begin_sim_button.state(['!disabled']) # Reenable the begin simulation button
+        """Save the simulation as a GIF upon button press, in a background worker"""
+        def save(task_worker):
+            """Read frames from the frame store as they are needed and save them, passing progress to the GUI"""
+            display_frames = frames.load_frames(FRAME_DIRECTORY)
+            simulation.save_outputs(display_frames, progress=lambda done, total: task_worker.put('progress', done,
+                                                                                                 total))
+
+        start_task(save, 'Saving animation', 1)
+
+    def cancel_task():
+        """Cancel the task running in the background upon button press"""
+        if worker is not None:
+            worker.cancel()
 
     def quit_sim():
         """Quit the GUI upon button press"""
-        if os.path.exists('./gui_files/frames.p'):
-            os.remove('./gui_files/frames.p')
+        cancel_task()
+        if worker is not None:
+            # Let the worker stop using the frame store before it is deleted, which it does at its next frame or
+            # progress message, taking any messages left so that it is not kept waiting on a full queue
+            while worker.thread.is_alive():
+                try:
+                    while True:
+                        worker.messages.get_nowait()
+                except queue.Empty:
+                    pass
+                worker.thread.join(POLL_INTERVAL / 1000)
+        try:
+            frames.delete_frame_store(FRAME_DIRECTORY)
+        except OSError:
+            pass  # e.g. frames still memory-mapped on Windows, so the frame store is deleted when the GUI next starts
         root.quit()
 
     ### (2) Initialising the parameters dictionary
@@ -324,6 +454,9 @@ def GUI():
                   'Number of People': 15,
                   'Number of Infected': 2,
                   'Simulation Duration': 100}
+    worker = None  # Background worker of the simulation, replay or save that is running, if any
+    # Delete the frame store of the last session, if it could not be deleted when the GUI quit
+    frames.delete_frame_store(FRAME_DIRECTORY)
 
     # (2) Setup of the GUI window, frames and figure and toolbar.
     # Main frame setup - GUI Controls
@@ -349,7 +482,8 @@ def GUI():
     office_plot = figure_plot.add_subplot()  # Add subplot
     office = Office(parameters['Office Plan'])  # Get the initial office layout from parameters
     display_array = simulation.input2disp(office.input_array)  # Convert office plan into RGB matrix
-    office_plot.imshow(display_array)  # Show office plan
+    renderer = RasterRenderer(legend=False)  # Renders display frames with a title, as the key is shown above
+    office_image = office_plot.imshow(renderer.render(display_array, 0))  # Show office plan
     office_plot.axis('off')  # Remove axis
     canvas = FigureCanvasTkAgg(figure_plot, master=figframe)  # Create new canvas to plot onto
     canvas.get_tk_widget().grid(column=0, row=1, sticky='we')  # Position canvas in figure frame
@@ -493,10 +627,26 @@ def GUI():
     replay_animation_button.grid(column=0, row=20, sticky='we')
     replay_animation_button.state(['disabled'])
 
+    # Profile simulation check box
+    profile_var = BooleanVar(value=False)  # Setup Tkinter BooleanVar() value which reflects whether the box is ticked
+    profile_check = ttk.Checkbutton(mainframe, text='Record timings', variable=profile_var)
+    profile_check.grid(column=0, row=23, sticky='we')
+
     # Quit application button
     quit_app_button = ttk.Button(master=mainframe, text="Quit App", command=quit_sim)
     quit_app_button.grid(column=0, row=22, sticky='we')
 
+    # Cancel button, for the simulation, replay or save running in the background
+    cancel_button = ttk.Button(master=mainframe, text="Cancel", command=cancel_task)
+    cancel_button.grid(column=0, row=24, sticky='we')
+    cancel_button.state(['disabled'])
+
+    # Progress bar and label of the simulation, replay or save running in the background
+    progress_bar = ttk.Progressbar(mainframe, orient='horizontal', length=200, mode='determinate')
+    progress_bar.grid(column=0, row=25, sticky='we')
+    progress_label = ttk.Label(mainframe, text='')
+    progress_label.grid(column=0, row=26, sticky='we')
+
     # Scalling to add space around widgets
     for child in mainframe.winfo_children():
         child.grid_configure(padx=5, pady=5)
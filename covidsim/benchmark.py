@@ -0,0 +1,328 @@
+"""
+
+benchmark.py
+
+This script benchmarks how the simulation scales, on each office plan and on generated floorplans larger than those
+in office_array.xls (see generator.py). For each floor, the number of people, social distancing adherence and
+simulation duration are swept one at a time around a base case, and the setup time, ticks per second and peak memory
+of each run are recorded.
+
+The hot paths of the simulation (update_location, record_interactions, build_social_distancing_array,
+update_social_distancing_array, step_transmission and save_outputs) are also timed per call on each floor, and the
+pathfinders people can use (A*, Jump Point Search and the zone graph) are compared, per path search and over a whole
+run. Growth curves are fitted to the results and written to a scaling report.
+
+Results are saved as .json files, so that the results of an optimised version of the simulation can be compared with
+those of a baseline run on the same machine.
+
+Used by run_covid_simulation.py.
+"""
+
+# External modules
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+# Directory modules
+from covidsim.office import Office
+from covidsim.floorplan import load_floorplan
+from covidsim.generator import generate_floorplan
+from covidsim.streams import RandomStreams
+from covidsim.export import FrameExporter
+from covidsim.person import A_STAR, JUMP_POINT_SEARCH, ZONE_GRAPH
+import covidsim.jump_point as jump_point
+import covidsim.simulation as simulation
+import covidsim.transmission as transmission
+
+BASE_PARAMETERS = {'Maximum Age': 65,
+                   'Minimum Age': 20,
+                   'Mask Adherence': 50,
+                   'Social Distancing Adherence': 50,
+                   'Virality': 30,
+                   'Number of Infected': 2,
+                   'Simulation Duration': 100,
+                   'Seed': 0}
+PEOPLE = [4, 8, 16, 32, 64, 128, 256]
+SOCIAL_DISTANCING_ADHERENCES = [0, 50, 100]
+DURATIONS = [50, 100, 200]
+GENERATED_FLOORS = [(64, 64, 'open'), (96, 96, 'cellular'), (128, 128, 'open')]
+PATH_SEARCHES = 20
+QUICK_SETTINGS = {'people': [4, 8, 16], 'adherences': [0, 100], 'durations': [25, 50],
+                  'generated': [(64, 64, 'open')], 'searches': 5}
+PATHFINDERS = {'A*': A_STAR, 'Jump Point Search': JUMP_POINT_SEARCH, 'Zone Graph': ZONE_GRAPH}
+
+
+def get_floors(generated=None):
+    """Returns a dictionary of the floorplans of each office plan and of generated offices, given as a list of (rows,
+    columns, layout) tuples, keyed by name"""
+    floors = {'Office Plan ' + str(sheet): load_floorplan(sheet) for sheet in range(4)}
+    for rows, columns, layout in GENERATED_FLOORS if generated is None else generated:
+        name = 'Generated ' + layout + ' ' + str(rows) + 'x' + str(columns)
+        floors[name] = generate_floorplan(rows, columns, layout, seed=0)
+    return floors
+
+
+def get_people_counts(floorplan, people):
+    """Returns the numbers of people that fit a floor. At most half of the desks are filled, so that people can always
+    move out of the way of each other."""
+    return [number for number in people if number <= floorplan.desk_count // 2]
+
+
+def get_base_people(floorplan, people):
+    """Returns the number of people of the base case of a floor"""
+    counts = get_people_counts(floorplan, people)
+    return counts[len(counts) // 2]
+
+
+def setup_run(params, floorplan):
+    """Returns an office and people ready to simulate. Flow fields are left to be built when they are first used, as
+    in simulation.py, so their cost is part of the run."""
+    office = Office(floorplan)
+    people = simulation.instantiate_people(params, office, RandomStreams(params['Seed']))
+    return office, people
+
+
+def run_case(params, floorplan):
+    """Run a simulation without display and return its setup time and speed, and its peak memory from a second traced
+    run"""
+    start = time.perf_counter()
+    office, people = setup_run(params, floorplan)
+    setup_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    simulation.run_simulation(params, office, people, display=False)
+    seconds = time.perf_counter() - start
+    # Memory is traced in a separate run, as tracing slows the simulation down
+    tracemalloc.start()
+    try:
+        office, people = setup_run(params, floorplan)
+        simulation.run_simulation(params, office, people, display=False)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'Setup Seconds': setup_seconds,
+            'Seconds': seconds,
+            'Ticks per Second': params['Simulation Duration'] / seconds,
+            'Peak Memory (MB)': peak_memory / 2 ** 20}
+
+
+@contextlib.contextmanager
+def timed_functions(targets, timings):
+    """Within the context, time every call of each function in a list of (owner, function name) targets, adding the
+    number of calls and total seconds to a dictionary of timings keyed by function name"""
+    originals = [(owner, name, getattr(owner, name)) for owner, name in targets]
+
+    def get_timed(name, function):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                timing = timings.setdefault(name, [0, 0.0])
+                timing[0] += 1
+                timing[1] += time.perf_counter() - start
+        return timed
+
+    for owner, name, function in originals:
+        setattr(owner, name, get_timed(name, function))
+    try:
+        yield timings
+    finally:
+        for owner, name, function in originals:
+            setattr(owner, name, function)
+
+
+def time_hot_paths(params, floorplan):
+    """Returns the mean milliseconds per call of each hot path of a simulation on a floor"""
+    office, people = setup_run(params, floorplan)
+    timings = {}
+    # Time the functions called by a displayed run, which also records the frames to export
+    targets = [(simulation, 'update_location'), (simulation, 'record_interactions'),
+               (transmission, 'step_transmission'), (office, 'build_social_distancing_array'),
+               (office, 'update_social_distancing_array')]
+    with timed_functions(targets, timings), contextlib.redirect_stdout(io.StringIO()):
+        display_frames = simulation.run_simulation(params, office, people)
+    milliseconds = {name: 1000 * seconds / max(calls, 1) for name, (calls, seconds) in timings.items()}
+    # Export of every frame of the run to an animation, per frame
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        with FrameExporter(directory=os.path.join(directory, 'Plots')) as exporter:
+            for timestamp, frame in enumerate(display_frames):
+                exporter.add(frame, timestamp)
+        milliseconds['save_outputs (per frame)'] = 1000 * (time.perf_counter() - start) / len(display_frames)
+    return milliseconds
+
+
+def compare_pathfinders(params, floorplan, searches=PATH_SEARCHES):
+    """Returns the mean milliseconds per path search of each pathfinder, searching from the desks of random people to
+    random tasks around everyone else at their desks, whether every full path found by each pathfinder was as short
+    as those found by the others, and the ticks per second of a run using each pathfinder. The zone graph only finds
+    the first part of each path (see zones.py), so its paths are not compared, and it is built before timing."""
+    office, people = setup_run(params, floorplan)
+    start = time.perf_counter()
+    office.get_zone_graph()
+    zone_graph_milliseconds = 1000 * (time.perf_counter() - start)
+    rng = np.random.default_rng(0)
+    milliseconds = dict.fromkeys(PATHFINDERS, 0.0)
+    equal_lengths = True
+    for _ in range(searches):
+        person = people[int(rng.integers(len(people))) + 1]
+        task = office.task_locations[rng.integers(len(office.task_locations))]
+        # Free the cell of the person searching, as when they move
+        array = office.pathfinding_array.copy()
+        array[person.current_location] = 1
+        lengths = []
+        for name, pathfinder in PATHFINDERS.items():
+            people.pathfinder = pathfinder
+            start = time.perf_counter()
+            if pathfinder == ZONE_GRAPH:
+                office.get_zone_graph().find_path(array, person.current_location, task)
+                milliseconds[name] += 1000 * (time.perf_counter() - start) / searches
+                continue
+            path = person.get_path(array, end_location=task)
+            milliseconds[name] += 1000 * (time.perf_counter() - start) / searches
+            lengths.append(sum(jump_point.octile(row - next_row, column - next_column)
+                               for (column, row), (next_column, next_row) in zip(path[:-1], path[1:])))
+        equal_lengths &= bool(np.allclose(lengths, lengths[0]))
+    comparison = {name + ' (ms per search)': milliseconds[name] for name in PATHFINDERS}
+    comparison['Equal Lengths'] = equal_lengths
+    comparison['Zone Graph Build (ms)'] = zone_graph_milliseconds
+    for name, pathfinder in PATHFINDERS.items():
+        comparison[name + ' (ticks per second)'] = run_case(dict(params, Pathfinder=pathfinder),
+                                                            floorplan)['Ticks per Second']
+    return comparison
+
+
+def fit_power_law(x, y):
+    """Fit y = a * x ** b to samples, returning a and b"""
+    b, log_a = np.polyfit(np.log(x), np.log(y), 1)
+    return float(np.exp(log_a)), float(b)
+
+
+def fit_line(x, y):
+    """Fit y = a * x + c to samples, returning a and c"""
+    a, c = np.polyfit(x, y, 1)
+    return float(a), float(c)
+
+
+def get_fits(results):
+    """Returns growth curves fitted to the sweeps of each floor: the seconds per tick and peak memory against the
+    number of people as power laws, and the total seconds against duration as a line"""
+    fits = {}
+    for floor in sorted(set(result['Floor'] for result in results)):
+        floor_results = [result for result in results if result['Floor'] == floor]
+        people = [result for result in floor_results if result['Sweep'] == 'Number of People']
+        durations = [result for result in floor_results if result['Sweep'] == 'Simulation Duration']
+        fit = {}
+        if len(people) >= 2:
+            x = [result['Number of People'] for result in people]
+            fit['Seconds per Tick vs People'] = fit_power_law(x, [1 / result['Ticks per Second'] for result in people])
+            fit['Peak Memory (MB) vs People'] = fit_power_law(x, [result['Peak Memory (MB)'] for result in people])
+        if len(durations) >= 2:
+            fit['Seconds vs Duration'] = fit_line([result['Simulation Duration'] for result in durations],
+                                                  [result['Seconds'] for result in durations])
+        fits[floor] = fit
+    return fits
+
+
+def run_benchmarks(label='baseline', quick=False, floors=None):
+    """Run the benchmark suite and return its results. The quick suite runs smaller sweeps on one generated floor"""
+    settings = QUICK_SETTINGS if quick else {'people': PEOPLE, 'adherences': SOCIAL_DISTANCING_ADHERENCES,
+                                             'durations': DURATIONS, 'generated': GENERATED_FLOORS,
+                                             'searches': PATH_SEARCHES}
+    if floors is None:
+        floors = get_floors(settings['generated'])
+    results, hot_paths, pathfinders = [], {}, {}
+    for floor, floorplan in floors.items():
+        print('Benchmarking', floor, '(' + str(floorplan.desk_count) + ' desks)')
+        base = dict(BASE_PARAMETERS, **{'Number of People': get_base_people(floorplan, settings['people'])})
+        base['Simulation Duration'] = settings['durations'][len(settings['durations']) // 2]
+        cases = ([('Number of People', number) for number in get_people_counts(floorplan, settings['people'])]
+                 + [('Social Distancing Adherence', adherence) for adherence in settings['adherences']]
+                 + [('Simulation Duration', duration) for duration in settings['durations']])
+        for sweep, value in cases:
+            params = dict(base, **{sweep: value})
+            result = {'Floor': floor, 'Sweep': sweep, 'Desks': floorplan.desk_count}
+            result.update({name: params[name] for name in ['Number of People', 'Social Distancing Adherence',
+                                                            'Simulation Duration']})
+            result.update(run_case(params, floorplan))
+            results.append(result)
+        hot_paths[floor] = time_hot_paths(base, floorplan)
+        pathfinders[floor] = compare_pathfinders(base, floorplan, settings['searches'])
+    return {'Label': label,
+            'Date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'Machine': {'Platform': platform.platform(), 'Processor': platform.processor(),
+                        'Python': platform.python_version(), 'Numpy': np.__version__, 'CPUs': os.cpu_count()},
+            'Results': results,
+            'Hot Paths (ms per call)': hot_paths,
+            'Pathfinders': pathfinders,
+            'Fits': get_fits(results)}
+
+
+def save_benchmarks(benchmarks, file_name='benchmark_results.json'):
+    """Save benchmark results to a .json file"""
+    with open(file_name, 'w') as file:
+        json.dump(benchmarks, file, indent=1)
+
+
+def load_benchmarks(file_name='benchmark_results.json'):
+    """Load benchmark results from a .json file"""
+    with open(file_name) as file:
+        return json.load(file)
+
+
+def get_report(benchmarks, baseline=None):
+    """Returns a scaling report of benchmark results, comparing their speed with those of a baseline if given"""
+    lines = ['Scaling report: ' + benchmarks['Label'] + ' (' + benchmarks['Date'] + ')']
+    if baseline is not None:
+        lines.append('Compared with: ' + baseline['Label'] + ' (' + baseline['Date'] + ')')
+        baseline_speeds = {(result['Floor'], result['Sweep'], result['Number of People'],
+                            result['Social Distancing Adherence'], result['Simulation Duration']):
+                           result['Ticks per Second'] for result in baseline['Results']}
+    for floor, fit in benchmarks['Fits'].items():
+        lines += ['', floor]
+        if 'Seconds per Tick vs People' in fit:
+            a, b = fit['Seconds per Tick vs People']
+            lines.append('    seconds per tick = %.3g * people ^ %.2f' % (a, b))
+            a, b = fit['Peak Memory (MB) vs People']
+            lines.append('    peak memory (MB) = %.3g * people ^ %.2f' % (a, b))
+        if 'Seconds vs Duration' in fit:
+            a, c = fit['Seconds vs Duration']
+            lines.append('    seconds = %.3g * duration + %.3g' % (a, c))
+        for result in benchmarks['Results']:
+            if result['Floor'] != floor:
+                continue
+            line = '    %-28s people %4d  distancing %3d%%  duration %4d: %6.2f s setup %8.1f ticks/s %8.1f MB' % (
+                result['Sweep'], result['Number of People'], result['Social Distancing Adherence'],
+                result['Simulation Duration'], result['Setup Seconds'], result['Ticks per Second'],
+                result['Peak Memory (MB)'])
+            if baseline is not None:
+                key = (floor, result['Sweep'], result['Number of People'], result['Social Distancing Adherence'],
+                       result['Simulation Duration'])
+                if key in baseline_speeds:
+                    line += '  x%.2f' % (result['Ticks per Second'] / baseline_speeds[key])
+            lines.append(line)
+        for name, milliseconds in benchmarks['Hot Paths (ms per call)'].get(floor, {}).items():
+            line = '    %-36s %10.4f ms per call' % (name, milliseconds)
+            if baseline is not None and name in baseline['Hot Paths (ms per call)'].get(floor, {}):
+                line += '  x%.2f' % (baseline['Hot Paths (ms per call)'][floor][name] / milliseconds)
+            lines.append(line)
+        comparison = benchmarks.get('Pathfinders', {}).get(floor)
+        if comparison is not None:
+            lines.append('    pathfinders: A* %.2f ms, Jump Point Search %.2f ms per search (x%.2f), %s' % (
+                comparison['A* (ms per search)'], comparison['Jump Point Search (ms per search)'],
+                comparison['A* (ms per search)'] / comparison['Jump Point Search (ms per search)'],
+                'equally short paths' if comparison['Equal Lengths'] else 'PATH LENGTHS DIFFER'))
+            lines.append('    pathfinders: Zone Graph %.2f ms per search (x%.2f), built in %.1f ms' % (
+                comparison['Zone Graph (ms per search)'],
+                comparison['A* (ms per search)'] / comparison['Zone Graph (ms per search)'],
+                comparison['Zone Graph Build (ms)']))
+            lines.append('    pathfinders: A* %.1f, Jump Point Search %.1f, Zone Graph %.1f ticks/s' % tuple(
+                comparison[name + ' (ticks per second)'] for name in PATHFINDERS))
+    return '\n'.join(lines)
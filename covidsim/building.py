@@ -0,0 +1,350 @@
+"""
+
+building.py
+
+This script simulates a building of several office floors, each a sheet of office_array.xls, where people can leave
+their own floor to visit a shared floor such as a canteen. It:
+
+    1. Assigns people to floors
+
+        The number of people on each floor is given by the inputs, and everyone is given a random desk on their own
+        floor. One task location of each floor is a lift, which is only used to move between floors.
+
+    2. Steps floors in parallel
+
+        Each floor is an office stepped by a worker process of its own, with random number streams of its own, so the
+        wall time of a time step is that of the largest floor rather than of the whole building. People leaving their
+        desk go to the lift instead of a task on their floor with the 'Shared Visit Chance', and ride it to the shared
+        floor, where they do one task and then ride the lift back to their desk.
+
+    3. Exchanges people between floors at the end of each time step
+
+        Only the people leaving each floor by lift and the infections on each floor are sent back from the workers.
+        People riding the lift in the same time step interact with each other, and are then sent, with their infection
+        status, to the floor they are going to. They step off the lift at its cell, or a free cell beside it, or wait
+        in the lift until one is free.
+
+The time series and infection events of the whole building are returned in the same format as metrics.py.
+
+Used by run_covid_simulation.py.
+"""
+
+# External modules
+import copy
+import itertools
+import multiprocessing
+import traceback
+import numpy as np
+
+# Directory modules
+from covidsim.office import Office
+from covidsim.population import Population
+from covidsim.floorplan import load_floorplan
+from covidsim.streams import RandomStreams
+import covidsim.simulation as simulation
+import covidsim.transmission as transmission
+import covidsim.metrics as metrics
+
+# Office plans of office_array.xls that can be used as floors
+FLOOR_PLANS = range(4)
+# Percentage chance that someone leaving their desk visits the shared floor, if not given
+DEFAULT_VISIT_CHANCE = 10
+# Distance between people riding the lift together
+LIFT_DISTANCE = 1
+
+
+def input_error(message):
+    """Print an input error and exit"""
+    print('Error:', message)
+    print('See README.txt for valid input formatting.')
+    raise SystemExit
+
+
+def check_building_inputs(params):
+    """Inputs are checked to exist in the right format. Building inputs have the parameters of a simulation, with
+    'Floors' and 'People per Floor' lists in place of 'Office Plan' and 'Number of People', and optionally a 'Shared
+    Floor' and 'Shared Visit Chance'"""
+    for parameter in ['Floors', 'People per Floor']:
+        if not isinstance(params.get(parameter), list) or not all(type(value) == int for value in params[parameter]):
+            input_error(parameter + ' must be included as a list of integers.')
+    if not 1 <= len(params['Floors']) == len(params['People per Floor']):
+        input_error('Floors and People per Floor must be lists of the same length.')
+    for plan, people in zip(params['Floors'], params['People per Floor']):
+        if plan not in FLOOR_PLANS:
+            input_error('Floors must be office plans between 0 and ' + str(FLOOR_PLANS[-1]) + '.')
+        if not 1 <= people <= load_floorplan(plan).desk_count:
+            input_error('People per Floor of office plan ' + str(plan) + ' must be between 1 and '
+                        + str(load_floorplan(plan).desk_count) + '.')
+    if 'Shared Floor' in params and params['Shared Floor'] not in FLOOR_PLANS:
+        input_error('Shared Floor must be an office plan between 0 and ' + str(FLOOR_PLANS[-1]) + '.')
+    if type(params.get('Shared Visit Chance', 0)) != int or not 0 <= params.get('Shared Visit Chance', 0) <= 100:
+        input_error('Shared Visit Chance must be an integer between 0 and 100.')
+    if type(params.get('Number of Infected')) != int or not 1 <= params['Number of Infected'] <= sum(
+            params['People per Floor']):
+        input_error('Number of Infected must be an integer between 1 and the number of people in the building.')
+    # Check the remaining parameters as those of a simulation of the first floor
+    floor_params = {name: value for name, value in params.items()
+                    if name not in ['Floors', 'People per Floor', 'Shared Floor', 'Shared Visit Chance']}
+    floor_params.update({'Office Plan': params['Floors'][0], 'Number of People': params['People per Floor'][0],
+                         'Number of Infected': 1})
+    simulation.check_inputs(floor_params, quiet=True)
+
+
+class Floor(Office):
+    """A floor of a building, stepped on its own. The people of the whole building are stored in the population of
+    every floor, so that everyone keeps their ID, but only the people present on the floor move and interact on it.
+
+    The first task location of the floor is its lift. On the floors where people have their desks, people leaving
+    their desk go to the lift instead of their task with the visit chance, and leave the floor when they reach it. On
+    the shared floor, visitors have the cell they stepped off the lift at as their desk, so that they go back to it and
+    leave after each task.
+
+    """
+
+    def __init__(self, floorplan, params, people, residents, seed, shared=False, visit_chance=0):
+        """Initialise an office floor with the people who have their desks on it, and random number streams of its
+        own spawned from a seed"""
+        super().__init__(floorplan)
+        self.params = params
+        self.people = people
+        self.people.streams = RandomStreams(seed)
+        self.shared = shared
+        self.visit_chance = visit_chance / 100
+        self.present = np.zeros(len(people), bool)
+        self.leaving = np.zeros(len(people), bool)
+        self.waiting = []  # IDs of people in the lift, waiting for a free cell to step off at
+        self.interactions = []
+        self.infection_events = []
+        # The lift is only used to leave the floor, unless it is the only task location
+        self.lift = self.task_locations[0]
+        if len(self.task_locations) > 1:
+            self.task_locations = self.task_locations[1:]
+        for ID in people.IDs[residents].tolist():
+            self.enter(ID, people[ID].desk_location)
+
+    def assign_task(self, person):
+        """Assign the next task of a person, sending them to the lift if they are leaving the floor"""
+        person.get_task(self.task_locations)
+        if self.shared:
+            # Visitors leave once they return to the cell they stepped off the lift at
+            self.leaving[person.index] = person.task_location == person.desk_location
+        elif person.task_location != person.desk_location:
+            if person.population.streams.movement.random() < self.visit_chance:
+                person.task_location = self.lift
+                self.leaving[person.index] = True
+
+    def enter(self, ID, location):
+        """Place a person on the floor at a location"""
+        self.people[ID].current_location = location
+        self.people[ID].path = []
+        self.present[ID - 1] = True
+        simulation.set_array_value(location[0], location[1], self.pathfinding_array, - ID)
+        self.people_locations[ID] = location
+
+    def leave(self, ID):
+        """Take a person off the floor"""
+        location = self.people[ID].current_location
+        simulation.set_array_value(location[0], location[1], self.pathfinding_array, 1)
+        del self.people_locations[ID]
+        self.present[ID - 1] = False
+        self.leaving[ID - 1] = False
+
+    def step_off_lift(self):
+        """Place the people waiting in the lift at the lift, or at free cells beside it, in the order they arrived.
+        Everyone placed has finished their task where they stand, so they start moving to their next task."""
+        free_cells = [self.lift] if self.pathfinding_array[self.lift] > 0 else []
+        free_cells += self.adj_finder(self.pathfinding_array, self.lift)
+        for ID, location in zip(self.waiting, free_cells):
+            person = self.people[ID]
+            self.enter(ID, location)
+            if self.shared:
+                person.desk_location = location
+            person.task_location = location
+            person.task_progress = person.task_duration
+        self.waiting = self.waiting[len(free_cells):]
+
+    def step(self, time, arrivals):
+        """Advance the floor by one time step, after adding people arriving by lift, given as [ID, infected, infector
+        ID] lists, to the lift. Returns the IDs of the people leaving the floor by lift, the number of interactions on
+        the floor and the infection events of the time step."""
+        for ID, infected, infector_ID in arrivals:
+            self.people.infected[ID - 1] = infected
+            self.people.infector_ID[ID - 1] = infector_ID
+            self.waiting.append(ID)
+        self.step_off_lift()
+        events = len(self.infection_events)
+        simulation.step_people(self.params, self, self.people, time, self.present)
+        departures = self.people.IDs[self.present & self.leaving & self.people.at_task()].tolist()
+        for ID in departures:
+            self.leave(ID)
+        return departures, len(self.interactions), self.infection_events[events:]
+
+
+def run_floor(connection, floor_arguments):
+    """Step a floor in a worker process each time a time step and its arrivals are received through a connection,
+    sending back the result of each step, until None is received. The traceback is sent back if the floor fails."""
+    try:
+        floor = Floor(*floor_arguments)
+        message = connection.recv()
+        while message is not None:
+            connection.send(floor.step(*message))
+            message = connection.recv()
+    except Exception:
+        connection.send(traceback.format_exc())
+    finally:
+        connection.close()
+
+
+class FloorWorker:
+    """Steps a floor of a building in a worker process of its own, or in the current process if not parallel. Steps
+    are sent to every worker before any result is received, so that the floors of a building step at the same time."""
+
+    def __init__(self, floor_arguments, parallel=True):
+        """Start a worker for a floor, given the arguments of the floor"""
+        self.parallel = parallel
+        if parallel:
+            self.connection, worker_connection = multiprocessing.Pipe()
+            self.process = multiprocessing.Process(target=run_floor, args=(worker_connection, floor_arguments),
+                                                   daemon=True)
+            self.process.start()
+            worker_connection.close()  # so that a failed worker cannot leave the connection waiting
+        else:
+            self.floor = Floor(*floor_arguments)
+            self.result = None
+
+    def send(self, time, arrivals):
+        """Start a time step of the floor"""
+        if self.parallel:
+            self.connection.send((time, arrivals))
+        else:
+            self.result = self.floor.step(time, arrivals)
+
+    def receive(self):
+        """Returns the result of the time step of the floor"""
+        if not self.parallel:
+            return self.result
+        result = self.connection.recv()
+        if isinstance(result, str):
+            raise RuntimeError('A floor of the building failed:\n' + result)
+        return result
+
+    def close(self):
+        """Stop the worker"""
+        if not self.parallel:
+            return
+        try:
+            self.connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass  # worker has already stopped
+        self.process.join()
+        self.connection.close()
+
+
+class Building:
+    """A building of office floors, with an optional shared floor that people visit from every other floor. The
+    building holds the population of everyone in it and their infection status between time steps, while the floors
+    are stepped by workers (see Floor and FloorWorker).
+
+    The number of infected and contagious people and of interactions at each time step, including interactions in the
+    lift, are recorded in the building along with a [tick, ID, infector ID] event for each infection, in the same way
+    as they are recorded in an office by run_simulation.
+
+    """
+
+    def __init__(self, params):
+        """Initialise the floors of a building and assign everyone in it a desk on their floor, based on building
+        inputs (see check_building_inputs)"""
+        self.params = params
+        self.floor_plans = list(params['Floors'])
+        people_per_floor = params['People per Floor']
+        self.shared_floor = len(self.floor_plans) if 'Shared Floor' in params else None
+        if self.shared_floor is not None:
+            self.floor_plans.append(params['Shared Floor'])
+        self.visit_chance = params.get('Shared Visit Chance', DEFAULT_VISIT_CHANCE) if 'Shared Floor' in params else 0
+        streams = RandomStreams(params.get('Seed'))
+
+        # Assign people to floors in order of ID, each with a random desk on their floor
+        desks = []
+        for plan, number in zip(params['Floors'], people_per_floor):
+            floor_desks = load_floorplan(plan).desk_locations
+            desks += [floor_desks[index] for index in streams.population.permutation(len(floor_desks))[:number]]
+        number_of_people = sum(people_per_floor)
+        self.people = Population(dict(params, **{'Number of People': number_of_people}), desks, streams)
+        self.home_floors = np.repeat(np.arange(len(people_per_floor)), people_per_floor)
+        infected_indices = streams.population.choice(number_of_people, params['Number of Infected'], replace=False)
+        self.people.infected[infected_indices] = True
+        self.people.contagious[infected_indices] = True
+        # Each floor draws random numbers from streams of its own, so that floors can step independently
+        self.floor_seeds = streams.seed_sequence.spawn(len(self.floor_plans))
+
+        self.infected_counts = []
+        self.contagious_counts = []
+        self.interaction_counts = []
+        self.floor_interaction_counts = [[] for _ in self.floor_plans]
+        self.lift_interaction_counts = []
+        self.infection_events = []
+
+    def get_floor_arguments(self):
+        """Returns the arguments of each Floor of the building, each with a copy of the population"""
+        return [(load_floorplan(plan), self.params, copy.deepcopy(self.people), self.home_floors == number,
+                 self.floor_seeds[number], number == self.shared_floor, self.visit_chance)
+                for number, plan in enumerate(self.floor_plans)]
+
+    def ride_lift(self, time, IDs):
+        """Simulate transmission between the people riding the lift together in a time step. Returns the number of
+        interactions in the lift."""
+        interactions = np.array([[ID_1, ID_2, LIFT_DISTANCE] for ID_1, ID_2 in itertools.combinations(sorted(IDs), 2)],
+                                float).reshape(-1, 3)
+        was_infected = self.people.infected.copy()
+        transmission.step_transmission(self.people, interactions, self.params['Virality'])
+        for ID in self.people.IDs[self.people.infected & ~was_infected].tolist():
+            self.infection_events.append([time + 1, ID, int(self.people.infector_ID[ID - 1])])
+        return len(interactions)
+
+    def run(self, parallel=True):
+        """Run the simulation of the building, stepping each floor in a worker process of its own if parallel, and
+        returns a dictionary of metrics (see metrics.py) with the interactions on each floor and in the lift"""
+        people = self.people
+        workers = [FloorWorker(arguments, parallel) for arguments in self.get_floor_arguments()]
+        arrivals = [[] for _ in workers]
+        try:
+            for time in range(self.params['Simulation Duration']):
+                for worker, floor_arrivals in zip(workers, arrivals):
+                    worker.send(time, floor_arrivals)
+                riders = []
+                for number, worker in enumerate(workers):
+                    departures, interaction_count, events = worker.receive()
+                    # Record infections on the floor, so that the infection status of everyone is up to date
+                    for tick, ID, infector_ID in events:
+                        people.infected[ID - 1] = True
+                        people.infector_ID[ID - 1] = infector_ID
+                    self.infection_events += events
+                    self.floor_interaction_counts[number].append(interaction_count)
+                    riders += [(ID, number) for ID in departures]
+                self.lift_interaction_counts.append(self.ride_lift(time, [ID for ID, number in riders]))
+
+                # Send people to the shared floor, or back to their own floor from the shared floor
+                arrivals = [[] for _ in workers]
+                for ID, number in riders:
+                    destination = self.home_floors[ID - 1] if number == self.shared_floor else self.shared_floor
+                    arrivals[destination].append([ID, bool(people.infected[ID - 1]),
+                                                  int(people.infector_ID[ID - 1])])
+
+                # record number of infected and contagious people, and of interactions
+                self.interaction_counts.append(sum(counts[-1] for counts in self.floor_interaction_counts)
+                                               + self.lift_interaction_counts[-1])
+                self.infected_counts.append(people.get_total_infected())
+                self.contagious_counts.append(people.get_total_contagious())
+        finally:
+            for worker in workers:
+                worker.close()
+        building_metrics = metrics.get_metrics(self.params, self, people)
+        building_metrics['Floor Interactions'] = self.floor_interaction_counts
+        building_metrics['Lift Interactions'] = self.lift_interaction_counts
+        return building_metrics
+
+
+def main(parameters, parallel=True):
+    """Entry point from command line interface. Returns the metrics of a simulation of a building"""
+    check_building_inputs(parameters)  # Validate inputs o.k.
+    return Building(parameters).run(parallel)
@@ -0,0 +1,208 @@
+"""
+
+contacts.py
+
+This script contains a class that stores every contact between people over a simulation, i.e. the interactions of each
+time step, as a temporal contact graph in a few flat numpy columns rather than as an array of interactions for each
+time step. Contacts can then be traced after the simulation, to answer queries such as:
+
+    1. Who was within a distance of a person in a range of time steps
+    2. How many time steps each pair of people spent in contact
+    3. Who was exposed to a person through a chain of one, two or more contacts, in time order
+
+Contacts are stored in time step order, with the start of each time step's contacts kept as an offset into the
+columns, so the contacts of a range of time steps are a single slice. The first time a person is traced, an index of
+the contacts of each person, in time step order, is built in the same way, so the contacts of a person are also a
+slice. Each contact takes 9 bytes: the IDs of the two people as 32 bit integers and a code for the distance between
+them.
+
+Used by simulation.py and snapshot.py.
+"""
+
+# External modules
+import numpy as np
+
+# Directory modules
+from covidsim.office import INTERACTION_DISTANCES
+
+# Distances between people in contact, which contacts store as a code i.e. an index into this array
+CONTACT_DISTANCES = np.unique(INTERACTION_DISTANCES)
+
+
+class ContactStore:
+    """Stores the contacts of each time step of a simulation, in columns of the lower ID, higher ID and distance code of
+    each contact, and answers queries about them. Time steps are numbered from 1, as in metrics.py."""
+
+    def __init__(self, number_of_people):
+        """Initialise a store with no contacts for a number of people"""
+        self.number_of_people = number_of_people
+        # Start of the contacts of each time step, where the contacts of time step t are offsets[t - 1]:offsets[t],
+        # with spare capacity at its end for time steps still to be added
+        self.ticks = 0
+        self.offsets = np.zeros(1024, np.int64)
+        # Columns, with spare capacity at their end for contacts still to be added
+        self.size = 0
+        self.first = np.zeros(1024, np.int32)
+        self.second = np.zeros(1024, np.int32)
+        self.distance_codes = np.zeros(1024, np.uint8)
+        # Index of the contacts of each person, built when first needed
+        self.person_offsets = self.person_contacts = self.person_ticks = None
+
+    @classmethod
+    def from_columns(cls, number_of_people, offsets, first, second, distance_codes):
+        """Returns a store of the contacts in columns, e.g. loaded from a snapshot"""
+        store = cls(number_of_people)
+        store.ticks = len(offsets) - 1
+        store.offsets = np.array(offsets, np.int64)
+        store.size = len(first)
+        store.first = np.array(first, np.int32)
+        store.second = np.array(second, np.int32)
+        store.distance_codes = np.array(distance_codes, np.uint8)
+        return store
+
+    def __len__(self):
+        return self.size
+
+    def get_ticks(self):
+        """Returns the number of time steps stored"""
+        return self.ticks
+
+    def get_columns(self):
+        """Returns the offsets of each time step and the columns of every contact stored, without spare capacity"""
+        return (self.offsets[:self.ticks + 1], self.first[:self.size], self.second[:self.size],
+                self.distance_codes[:self.size])
+
+    def compact(self):
+        """Free the spare capacity of the store e.g. once a simulation is finished"""
+        self.offsets, self.first, self.second, self.distance_codes = [column.copy() for column in self.get_columns()]
+
+    def get_nbytes(self):
+        """Returns the number of bytes of memory used by the store, including its index if built"""
+        index = [self.person_offsets, self.person_contacts, self.person_ticks]
+        return sum(array.nbytes for array in [self.offsets, self.first, self.second, self.distance_codes] + index
+                   if array is not None)
+
+    def add(self, tick, interactions, ticks=1):
+        """Add the interactions of a time step of the office (see office.find_all_interactions), where each row holds
+        the negative IDs of the people interacting and the distance between them, or the same interactions for a
+        number of time steps from it. Time steps with no interactions between the last time step added and this one
+        are stored as empty."""
+        if tick <= self.ticks:
+            raise ValueError('Contacts must be added in time step order, after time step ' + str(self.ticks))
+        interactions = np.asarray(interactions, float).reshape(-1, 3)
+        last_tick = tick + ticks - 1
+        end = self.size + ticks * len(interactions)
+        # Double the capacity of the offsets and columns when full, so adding contacts takes amortised constant time
+        if last_tick + 1 > len(self.offsets):
+            self.offsets = np.resize(self.offsets, max(2 * len(self.offsets), last_tick + 1))
+        if end > len(self.first):
+            capacity = max(2 * len(self.first), end)
+            self.first = np.resize(self.first, capacity)
+            self.second = np.resize(self.second, capacity)
+            self.distance_codes = np.resize(self.distance_codes, capacity)
+        # NOTE: people are represented by their negative ID in interactions
+        IDs = -interactions[:, :2].astype(np.int32)
+        self.first[self.size:end] = np.tile(IDs.min(axis=1), ticks)
+        self.second[self.size:end] = np.tile(IDs.max(axis=1), ticks)
+        distance_codes = np.abs(interactions[:, 2, None] - CONTACT_DISTANCES).argmin(axis=1)
+        self.distance_codes[self.size:end] = np.tile(distance_codes, ticks)
+        self.offsets[self.ticks + 1:tick] = self.size
+        self.offsets[tick:last_tick + 1] = self.size + len(interactions) * np.arange(1, ticks + 1)
+        self.size = end
+        self.ticks = last_tick
+        self.person_offsets = self.person_contacts = self.person_ticks = None  # index is out of date
+
+    def get_interactions(self, tick):
+        """Returns the interactions of a time step, in the format they were added in"""
+        start, end = self.offsets[tick - 1], self.offsets[tick]
+        return np.column_stack((-self.first[start:end], -self.second[start:end],
+                                CONTACT_DISTANCES[self.distance_codes[start:end]])).astype(float)
+
+    def get_window(self, start=1, end=None):
+        """Returns the slice of contacts of the time steps from start to end inclusive (the last time step stored if no
+        end is given)"""
+        if end is None:
+            end = self.ticks
+        start, end = max(start, 1), min(end, self.ticks)
+        if end < start:
+            return slice(0, 0)
+        return slice(int(self.offsets[start - 1]), int(self.offsets[end]))
+
+    def build_index(self):
+        """Build the index of the contacts of each person, sorted by time step, if it is out of date"""
+        if self.person_offsets is not None:
+            return
+        first, second, _ = self.get_columns()[1:]
+        # Both people of each contact in turn, so that a stable sort by person keeps each person's contacts in order
+        people = np.column_stack((first, second)).ravel()
+        # NOTE: numpy sorts 16 bit integers with a radix sort, which is several times faster
+        order = np.argsort(people.astype(np.uint16) if self.number_of_people < 2 ** 16 else people, kind='stable')
+        self.person_contacts = (order // 2).astype(np.int32 if self.size < 2 ** 31 else np.int64)
+        contact_counts = np.bincount(people, minlength=self.number_of_people + 1)[1:]
+        self.person_offsets = np.concatenate(([0], np.cumsum(contact_counts)))
+        # Time step of each contact of each person
+        ticks = np.repeat(np.arange(1, self.ticks + 1, dtype=np.int32), np.diff(self.offsets[:self.ticks + 1]))
+        self.person_ticks = ticks[self.person_contacts]
+
+    def get_person_contacts(self, ID, start=1, end=None):
+        """Returns the contacts of a person in the time steps from start to end inclusive, as positions in the columns
+        in time step order, and the time step of each contact"""
+        self.build_index()
+        if end is None:
+            end = self.ticks
+        first, last = self.person_offsets[ID - 1], self.person_offsets[ID]
+        ticks = self.person_ticks[first:last]
+        window = slice(first + np.searchsorted(ticks, start), first + np.searchsorted(ticks, end, 'right'))
+        return self.person_contacts[window], self.person_ticks[window]
+
+    def get_contacts(self, ID, start=1, end=None, max_distance=None):
+        """Returns the IDs of everyone who was within a distance (any distance of an interaction if not given) of a
+        person in the time steps from start to end inclusive"""
+        contacts, _ = self.get_person_contacts(ID, start, end)
+        if max_distance is not None:
+            contacts = contacts[CONTACT_DISTANCES[self.distance_codes[contacts]] <= max_distance]
+        return np.unique(self.first[contacts] + self.second[contacts] - ID)
+
+    def get_contact_times(self, start=1, end=None, max_distance=None):
+        """Returns every pair of people in contact in the time steps from start to end inclusive, as an array of rows
+        of the lower and higher ID, and the number of time steps each pair spent within a distance of each other (any
+        distance of an interaction if not given)"""
+        window = self.get_window(start, end)
+        first, second = self.first[window].astype(np.int64), self.second[window].astype(np.int64)
+        if max_distance is not None:
+            close = CONTACT_DISTANCES[self.distance_codes[window]] <= max_distance
+            first, second = first[close], second[close]
+        pairs, times = np.unique(first * (self.number_of_people + 1) + second, return_counts=True)
+        return np.column_stack(np.divmod(pairs, self.number_of_people + 1)), times
+
+    def get_exposure_sets(self, ID, hops, start=1, end=None, max_distance=None):
+        """Returns the people exposed to a person through chains of up to a number of contacts in the time steps from
+        start to end inclusive, as a list of arrays of the IDs of the people first reached in 1, 2, ... hops. Chains
+        follow time order: each contact in a chain is in the same time step as the one before it or later."""
+        if end is None:
+            end = self.ticks
+        # Earliest time step from which each person was exposed, and the number of hops needed to reach them
+        reached = np.full(self.number_of_people + 1, np.iinfo(np.int64).max)
+        reached[ID] = start
+        hop_counts = np.zeros(self.number_of_people + 1, int)
+        frontier = [ID]
+        for hop in range(1, hops + 1):
+            exposures = []
+            for person in frontier:
+                contacts, ticks = self.get_person_contacts(person, reached[person], end)
+                if max_distance is not None:
+                    close = CONTACT_DISTANCES[self.distance_codes[contacts]] <= max_distance
+                    contacts, ticks = contacts[close], ticks[close]
+                exposures.append((self.first[contacts] + self.second[contacts] - person, ticks))
+            if not exposures:
+                break
+            others = np.concatenate([others for others, _ in exposures])
+            ticks = np.concatenate([ticks for _, ticks in exposures])
+            # Keep the earliest exposure of each person, and carry on from people exposed earlier than before
+            earliest = np.full(self.number_of_people + 1, np.iinfo(np.int64).max)
+            np.minimum.at(earliest, others, ticks)
+            improved = np.nonzero(earliest < reached)[0]
+            reached[improved] = earliest[improved]
+            hop_counts[improved[hop_counts[improved] == 0]] = hop
+            frontier = improved.tolist()
+        return [np.nonzero(hop_counts == hop)[0] for hop in range(1, hops + 1)]
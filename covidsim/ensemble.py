@@ -0,0 +1,139 @@
+"""
+
+ensemble.py
+
+This script runs an ensemble of replicas of a simulation with the same input parameters but different random seeds, to
+estimate the spread of outcomes of a set of parameters rather than relying on a single noisy run. Replicas are run in
+parallel, without display frames, and their results are aggregated as they finish so that no replica is kept in memory.
+
+For each time step, the mean, variance and quantiles of the number of infected and contagious people are found, along
+with those of the final attack rate i.e. the fraction of initially healthy people who were infected.
+
+Used by run_covid_simulation.py.
+"""
+
+# External modules
+import numpy as np
+from joblib import Parallel, delayed
+
+# Directory modules
+from covidsim.office import Office
+import covidsim.simulation as simulation
+from covidsim.streams import RandomStreams, spawn_seeds
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def get_attack_rate(params, infected):
+    """Convert a number of people infected by the end of a simulation to an attack rate"""
+    susceptible = params['Number of People'] - params['Number of Infected']
+    if susceptible == 0:
+        return 0.0
+    return (infected - params['Number of Infected']) / susceptible
+
+
+def get_attack_rate_variance(params, variance):
+    """Convert the variance of the number of people infected by the end of a simulation to the variance of its attack
+    rate"""
+    susceptible = params['Number of People'] - params['Number of Infected']
+    if susceptible == 0:
+        return 0.0
+    return variance / susceptible ** 2
+
+
+class RunningStatistics:
+    """Aggregates integer samples of a fixed shape, each between 0 and a maximum value, one sample at a time. The mean
+    and variance are updated using Welford's algorithm and quantiles are found from a histogram of the values."""
+
+    def __init__(self, shape, maximum):
+        """Initialise statistics of samples with no samples added"""
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.sum_of_squares = np.zeros(shape)  # sum of squared differences from the mean
+        self.histogram = np.zeros(shape + (maximum + 1,), int)
+
+    def add(self, sample):
+        """Add a sample to the statistics"""
+        sample = np.asarray(sample)
+        self.count += 1
+        difference = sample - self.mean
+        self.mean += difference / self.count
+        self.sum_of_squares += difference * (sample - self.mean)
+        bins = self.histogram.reshape(-1, self.histogram.shape[-1])
+        bins[np.arange(sample.size), sample.ravel()] += 1
+
+    def variance(self):
+        """Returns the sample variance"""
+        if self.count < 2:
+            return np.zeros(self.mean.shape)
+        return self.sum_of_squares / (self.count - 1)
+
+    def quantile(self, q):
+        """Returns the q quantile i.e. the smallest value that at least a fraction q of the samples do not exceed"""
+        cumulative = np.cumsum(self.histogram, axis=-1)
+        return np.argmax(cumulative >= max(np.ceil(q * self.count), 1), axis=-1)
+
+
+class EnsembleStatistics:
+    """Aggregates the results of replicas of a simulation"""
+
+    def __init__(self, params):
+        """Initialise statistics for the duration and number of people of the simulation"""
+        duration = params['Simulation Duration']
+        self.params = params
+        self.number_of_people = params['Number of People']
+        self.infected = RunningStatistics((duration,), self.number_of_people)
+        self.contagious = RunningStatistics((duration,), self.number_of_people)
+        self.final_infected = RunningStatistics((), self.number_of_people)
+
+    def add(self, infected_counts, contagious_counts):
+        """Add the number of infected and contagious people at each time step of a replica"""
+        self.infected.add(infected_counts)
+        self.contagious.add(contagious_counts)
+        self.final_infected.add(infected_counts[-1])
+
+    def summary(self):
+        """Returns a dictionary of the attack rate statistics of the ensemble"""
+        summary = {'Replicas': self.final_infected.count,
+                   'Attack Rate Mean': get_attack_rate(self.params, float(self.final_infected.mean)),
+                   'Attack Rate Variance': get_attack_rate_variance(self.params,
+                                                                    float(self.final_infected.variance()))}
+        for q in QUANTILES:
+            summary['Attack Rate Q' + str(int(q * 100))] = get_attack_rate(self.params,
+                                                                           int(self.final_infected.quantile(q)))
+        return summary
+
+    def save(self, file_name):
+        """Save the statistics of each time step to a .csv file"""
+        columns = {'Tick': np.arange(1, len(self.infected.mean) + 1)}
+        for name, statistics in [('Infected', self.infected), ('Contagious', self.contagious)]:
+            columns[name + ' Mean'] = statistics.mean
+            columns[name + ' Variance'] = statistics.variance()
+            for q in QUANTILES:
+                columns[name + ' Q' + str(int(q * 100))] = statistics.quantile(q)
+        np.savetxt(file_name, np.column_stack(list(columns.values())), delimiter=',', fmt='%g',
+                   header=','.join(columns.keys()), comments='')
+
+
+def run_replica(params, seed):
+    """Run a replica of a simulation without display and return the number of infected and contagious people at each
+    time step"""
+    office = Office(simulation.get_floorplan(params))
+    people = simulation.instantiate_people(params, office, RandomStreams(seed))
+    simulation.run_simulation(params, office, people, display=False)
+    return np.array(office.infected_counts), np.array(office.contagious_counts)
+
+
+def run_ensemble(params, replicas, seed=None, n_jobs=-1):
+    """Run replicas of a simulation in parallel using n_jobs processes (all cpu cores by default), aggregating their
+    results as each replica finishes. Each replica is seeded from a seed spawned from the seed given, or the 'Seed'
+    parameter if no seed is given, so that ensembles with the same seed are identical"""
+    simulation.check_inputs(params, quiet=True)  # Validate inputs o.k.
+    if seed is None:
+        seed = params.get('Seed')
+    statistics = EnsembleStatistics(params)
+    results = Parallel(n_jobs=n_jobs, return_as='generator')(delayed(run_replica)(params, replica_seed)
+                                                             for replica_seed in spawn_seeds(seed, replicas))
+    for infected_counts, contagious_counts in results:
+        statistics.add(infected_counts, contagious_counts)
+    return statistics
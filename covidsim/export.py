@@ -0,0 +1,261 @@
+"""
+
+export.py
+
+This script contains classes that export display frames as an animation while they are being produced, e.g. by a
+running simulation or by replaying one, without saving a plot of every frame and reading the plots back.
+
+Each frame is rendered and encoded straight into an animated .gif or .mp4 file, so only the frame being encoded is held
+in memory. Frames are rendered by upscaling them with numpy and overlaying a title and legend made from pre-rasterized
+text, which is much faster than plotting them with matplotlib. Matplotlib plots remain available for stills. GIFs are
+encoded with a fixed palette that contains every display colour, and consecutive duplicate frames are merged by
+lengthening the previous frame. Saving a .png plot of each frame is optional.
+
+Used by simulation.py and run_covid_simulation.py.
+"""
+
+# External modules
+import os
+import shutil
+import numpy as np
+import imageio
+from PIL import Image, ImageDraw, ImageFont, GifImagePlugin
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+def get_fixed_palette():
+    """Returns a flat list of 256 RGB palette colours containing the display colours of the office, the grey levels of
+    plot text and a 6x6x6 colour cube for any other colours"""
+    colours = [[200, 200, 200], [110, 124, 154], [139, 61, 123],  # floor, tasks and desks
+               [22, 152, 66], [237, 71, 5], [177, 0, 30]]  # healthy, infected and contagious people
+    colours += [[level, level, level] for level in range(0, 256, 8)] + [[255, 255, 255]]
+    levels = [0, 51, 102, 153, 204, 255]
+    colours += [[red, green, blue] for red in levels for green in levels for blue in levels]
+    colours = colours[:256] + [[0, 0, 0]] * (256 - len(colours))
+    return [value for colour in colours for value in colour]
+
+
+FIXED_PALETTE = get_fixed_palette()
+FRAMES_PER_SECOND = 10
+# Legend of raster frames, matching ./gui_files/plot_key.png
+LEGEND = [('Contagious', [177, 0, 30]), ('Infected', [237, 71, 5]), ('Healthy', [22, 152, 66]),
+          ('Desk', [139, 61, 123]), ('Task', [110, 124, 154])]
+
+
+def get_plot_title(frame, timestamp):
+    """Returns the title of a plot of a display frame, showing the timestamp and number of infected people"""
+    # Get number of people who are infected or contagious based on number of
+    # array cells in red and orange
+    infected_no = np.count_nonzero(frame == 177) + np.count_nonzero(frame == 237)
+    # Add number of healthy people to infected and contagious people to get
+    # total population.
+    people_no = infected_no + np.count_nonzero(frame == 22)
+    return ('Time: ' + str(timestamp)
+            + '          Number of Infected: '
+            + str(infected_no)
+            + '/' + str(people_no))
+
+
+class PlotRenderer:
+    """Renders display frames as matplotlib plots into RGB images, reusing one figure for every frame"""
+
+    def __init__(self):
+        """Create the figure that frames are plotted on"""
+        self.figure = Figure()
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_subplot()
+        self.axes.axis('off')
+        self.image = None
+
+    def render(self, frame, timestamp):
+        """Returns a plot of a display frame as an RGB image array"""
+        if self.image is None or self.image.get_array().shape != frame.shape:
+            self.axes.clear()
+            self.axes.axis('off')
+            self.image = self.axes.imshow(frame.astype(np.uint8))
+        else:
+            self.image.set_data(frame.astype(np.uint8))
+        self.axes.set_title(get_plot_title(frame, timestamp))
+        self.canvas.draw()
+        return np.asarray(self.canvas.buffer_rgba())[:, :, :3].copy()
+
+    def save(self, frame, timestamp, file_name):
+        """Save a plot of a display frame to a file, in any format matplotlib supports e.g. .png or .pdf"""
+        self.render(frame, timestamp)
+        self.figure.savefig(file_name)
+
+
+def get_font(size):
+    """Returns the default PIL font at a size, or at its only size if the PIL version cannot resize it"""
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+class RasterRenderer:
+    """Renders display frames into RGB images using numpy alone. Each cell of a frame is upscaled to a square of pixels,
+    with a title above and a legend below. Text is drawn from glyphs that are rasterized once and reused, and the
+    legend is drawn once for each size of frame, so rendering a frame only copies arrays."""
+
+    def __init__(self, scale=None, font_size=14, legend=True):
+        """Set up a renderer that upscales each cell to scale x scale pixels, or to fit a height of about 400 pixels if
+        no scale is given. The legend can be left out e.g. where a key is shown separately."""
+        self.scale = scale
+        self.legend = legend
+        self.font = get_font(font_size)
+        ascent, descent = self.font.getmetrics()
+        self.text_height = ascent + descent
+        self.glyphs = {}  # rasterized text mask of each character
+        self.layouts = {}  # background image and office position for each frame shape
+
+    def get_glyph(self, character):
+        """Returns a mask of a character, rasterizing it the first time it is used"""
+        if character not in self.glyphs:
+            glyph = Image.new('L', (max(int(np.ceil(self.font.getlength(character))), 1), self.text_height))
+            ImageDraw.Draw(glyph).text((0, 0), character, font=self.font, fill=255)
+            self.glyphs[character] = np.asarray(glyph)
+        return self.glyphs[character]
+
+    def get_text(self, text):
+        """Returns a mask of a line of text from the glyphs of its characters"""
+        return np.hstack([self.get_glyph(character) for character in text])
+
+    def get_legend(self):
+        """Returns the legend as an RGB image on a white background"""
+        square = self.text_height - 4
+        parts = []
+        for label, colour in LEGEND:
+            # Coloured square and label of each entry, followed by a gap
+            key = np.full((self.text_height, square + 4, 3), 255, np.uint8)
+            key[2:2 + square, :square] = colour
+            text = self.get_text(label)
+            parts += [key, np.repeat(255 - text[:, :, None], 3, axis=2),
+                      np.full((self.text_height, 12, 3), 255, np.uint8)]
+        return np.hstack(parts[:-1])
+
+    def get_layout(self, shape):
+        """Returns the background image for frames of a shape, and the scale and position of the office in it"""
+        if shape not in self.layouts:
+            rows, columns = shape[:2]
+            scale = self.scale if self.scale is not None else max(400 // max(rows, columns), 1)
+            legend = self.get_legend() if self.legend else None
+            # Wide enough for the office, the legend and a title with large numbers
+            widest_title = self.get_text('Time: 00000          Number of Infected: 0000/0000')
+            width = max(columns * scale, widest_title.shape[1], legend.shape[1] if self.legend else 0) + 8
+            top = self.text_height + 8
+            height = top + rows * scale + (self.text_height + 8 if self.legend else 4)
+            background = np.full((height, width, 3), 255, np.uint8)
+            if self.legend:
+                left = (width - legend.shape[1]) // 2
+                background[height - self.text_height - 4:height - 4, left:left + legend.shape[1]] = legend
+            self.layouts[shape] = background, scale, top, (width - columns * scale) // 2
+        return self.layouts[shape]
+
+    def render(self, frame, timestamp):
+        """Returns an image of a display frame, with a title showing the timestamp and number of infected people"""
+        background, scale, top, left = self.get_layout(frame.shape)
+        image = background.copy()
+        # Upscale each cell of the frame to a square of pixels
+        office = np.repeat(np.repeat(frame.astype(np.uint8), scale, axis=0), scale, axis=1)
+        image[top:top + office.shape[0], left:left + office.shape[1]] = office
+        # Draw the title in black, centred above the office
+        title = self.get_text(get_plot_title(frame, timestamp))[:, :image.shape[1]]
+        title_left = (image.shape[1] - title.shape[1]) // 2
+        image[4:4 + self.text_height, title_left:title_left + title.shape[1]] = 255 - title[:, :, None]
+        return image
+
+
+class GifWriter:
+    """Streams RGB images into an animated .gif file with a fixed palette, one frame at a time. Consecutive duplicate
+    frames are written once, shown for longer. Frames are encoded with the frame by frame GIF functions of PIL, as the
+    GIF writers of imageio either give every frame the same duration or hold every frame until they are closed."""
+
+    def __init__(self, file_name, fps=FRAMES_PER_SECOND):
+        """Open a .gif file to write frames to"""
+        self.file = open(file_name, 'wb')
+        self.duration = 1000 / fps  # duration of each frame in milliseconds
+        self.palette = Image.new('P', (1, 1))
+        self.palette.putpalette(FIXED_PALETTE)
+        self.previous_frame = None  # frame waiting to be written, until it is known how long it is shown for
+        self.previous_duration = 0
+
+    def append_data(self, image):
+        """Add an RGB image array to the animation"""
+        frame = Image.fromarray(np.asarray(image, np.uint8)).quantize(palette=self.palette, dither=Image.Dither.NONE)
+        if self.previous_frame is None:
+            # Header with the fixed palette as the global palette of every frame, looping the animation forever
+            self.file.write(b''.join(GifImagePlugin.getheader(frame, info={'loop': 0})[0]))
+        elif frame.tobytes() == self.previous_frame.tobytes():
+            self.previous_duration += self.duration
+            return
+        self.write_previous_frame()
+        self.previous_frame = frame
+        self.previous_duration = self.duration
+
+    def write_previous_frame(self):
+        """Write the frame waiting to be written, shown for its duration"""
+        if self.previous_frame is not None:
+            duration = min(int(round(self.previous_duration)), 655350)  # longest GIF frame delay
+            self.file.write(b''.join(GifImagePlugin.getdata(self.previous_frame, duration=duration)))
+
+    def close(self):
+        """Write the last frame and close the file"""
+        self.write_previous_frame()
+        self.file.write(b';')  # GIF trailer
+        self.file.close()
+
+
+def get_animation_writer(file_name, fps=FRAMES_PER_SECOND):
+    """Returns a writer that streams frames into a .gif or .mp4 file, depending on the file extension. Writing .mp4
+    files requires the imageio-ffmpeg module."""
+    if file_name.endswith('.gif'):
+        return GifWriter(file_name, fps)
+    try:
+        return imageio.get_writer(file_name, fps=fps, macro_block_size=1)
+    except (ImportError, RuntimeError, ValueError):
+        print('Error: saving ' + os.path.splitext(file_name)[1] + ' files requires the imageio-ffmpeg module.')
+        raise SystemExit
+
+
+class FrameExporter:
+    """Renders display frames and streams them into an animation as they are added, optionally saving a plot of each
+    frame. Existing plots and animations in the output directory are deleted when the first frame is added."""
+
+    def __init__(self, directory='./Plots', file_name='animation.gif', save_plots=False, renderer=None):
+        """Set up an exporter, which renders frames using a RasterRenderer if no renderer is given. A PlotRenderer may
+        be given instead to render matplotlib plots, at a much slower speed."""
+        self.directory = directory
+        self.file_name = file_name
+        self.save_plots = save_plots
+        self.renderer = renderer if renderer is not None else RasterRenderer()
+        self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def add(self, frame, timestamp):
+        """Render a display frame and add it to the animation"""
+        if self.writer is None:
+            # Delete existing plots and animation
+            if os.path.exists(self.directory):
+                shutil.rmtree(self.directory)
+            os.mkdir(self.directory)
+            self.writer = get_animation_writer(os.path.join(self.directory, self.file_name))
+        image = self.renderer.render(frame, timestamp)
+        if self.save_plots:
+            Image.fromarray(image).save(os.path.join(self.directory, str(timestamp) + '.png'))
+        self.writer.append_data(image)
+
+    def close(self):
+        """Finish the animation and print its location"""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            # Print output location in command window
+            output_path = os.path.dirname(os.path.realpath(os.path.join(self.directory, self.file_name)))
+            print('Plots and animation saved to ' + output_path)
@@ -0,0 +1,111 @@
+"""
+
+floorplan.py
+
+This script contains a class that defines a floorplan compiled from a sheet of the excel office input file, and a
+loader that caches compiled floorplans in memory and on disk so that the excel file is only parsed once.
+
+Compiled floorplans are stored as .npz files keyed by a hash of the excel file and the sheet number, so editing the
+excel file automatically invalidates them.
+
+Used by office.py and simulation.py.
+"""
+
+# External modules
+import hashlib
+import os
+import numpy as np
+
+# Codes of each type of cell in a compiled floorplan grid
+WALL = 0
+FLOOR = 1
+TASK = 2
+DESK = 3
+# Value of each cell code in the excel input file
+CELL_VALUES = np.array([0, 1, 'T', 'D'], dtype=object)
+
+CACHE_DIRECTORY = './floorplan_cache'
+
+# Floorplans compiled or loaded from disk during this session, keyed by file hash and sheet
+loaded_floorplans = {}
+# Hashes of excel files, keyed by path, modification time and size so files are only rehashed when they change
+file_hashes = {}
+
+
+class Floorplan:
+    """A floorplan stores a typed grid of cell codes, the coordinates of desks and tasks and the number of desks. Only
+    codes are stored so that a floorplan can be saved and loaded with numpy alone."""
+
+    def __init__(self, grid, desk_locations=None, task_locations=None):
+        """Generate a floorplan from a grid of cell codes, finding desk and task locations if not given"""
+        self.grid = grid
+        if desk_locations is None:
+            desk_locations = np.argwhere(grid == DESK)
+        if task_locations is None:
+            task_locations = np.argwhere(grid == TASK)
+        # Store locations in the same format as the office, a list of coordinate tuples
+        self.desk_locations = [tuple(location) for location in np.asarray(desk_locations).reshape(-1, 2)]
+        self.task_locations = [tuple(location) for location in np.asarray(task_locations).reshape(-1, 2)]
+        self.desk_count = len(self.desk_locations)
+
+    def get_input_array(self):
+        """Returns the floorplan in the format of the excel input file i.e. an array of 0, 1, 'T' and 'D' values"""
+        return CELL_VALUES[self.grid]
+
+    def save(self, file_name):
+        """Save the floorplan to a .npz file"""
+        np.savez(file_name, grid=self.grid, desk_locations=np.array(self.desk_locations, int).reshape(-1, 2),
+                 task_locations=np.array(self.task_locations, int).reshape(-1, 2), desk_count=self.desk_count)
+
+
+def read_floorplan(file_name):
+    """Load a floorplan saved to a .npz file"""
+    with np.load(file_name) as data:
+        return Floorplan(data['grid'], data['desk_locations'], data['task_locations'])
+
+
+def compile_floorplan(file_name, sheet):
+    """Parse a sheet of an excel floorplan into a floorplan of cell codes"""
+    # NOTE: pandas is only imported when a floorplan must be compiled, as importing and parsing excel files is slow
+    import pandas as pd
+
+    input_array = pd.read_excel(file_name, sheet).values.transpose()
+    grid = np.full(input_array.shape, FLOOR, np.uint8)
+    grid[input_array == 0] = WALL
+    grid[input_array == 'T'] = TASK
+    grid[input_array == 'D'] = DESK
+    return Floorplan(grid)
+
+
+def get_file_hash(file_name):
+    """Returns a hash of the contents of a file, only reading the file if it has changed since it was last hashed"""
+    status = os.stat(file_name)
+    key = (os.path.realpath(file_name), status.st_mtime_ns, status.st_size)
+    if key not in file_hashes:
+        with open(file_name, 'rb') as file:
+            file_hashes[key] = hashlib.sha1(file.read()).hexdigest()
+    return file_hashes[key]
+
+
+def load_floorplan(sheet, file_name='office_array.xls'):
+    """Returns the floorplan of a sheet of an excel file. Floorplans are loaded from memory if already loaded, then from
+    the disk cache if already compiled, and are otherwise compiled from the excel file and saved to the disk cache."""
+    file_hash = get_file_hash(file_name)
+    key = (file_hash, sheet)
+    if key not in loaded_floorplans:
+        cache_file = os.path.join(CACHE_DIRECTORY, file_hash + '_' + str(sheet) + '.npz')
+        if os.path.exists(cache_file):
+            floorplan = read_floorplan(cache_file)
+        else:
+            floorplan = compile_floorplan(file_name, sheet)
+            try:
+                os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+                # Write to a temporary file first so that an interrupted save does not leave a broken cache file
+                temporary_file = cache_file + '.' + str(os.getpid()) + '.tmp'
+                with open(temporary_file, 'wb') as file:
+                    floorplan.save(file)
+                os.replace(temporary_file, cache_file)
+            except OSError:
+                pass  # Floorplan can still be used if the disk cache cannot be written
+        loaded_floorplans[key] = floorplan
+    return loaded_floorplans[key]
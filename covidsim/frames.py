@@ -0,0 +1,131 @@
+"""
+
+frames.py
+
+This script contains classes that record the state of the office at each time step of a simulation and render
+display frames from those records.
+
+Only the locations and health states of people are recorded, as small integer arrays, rather than a full RGB image of
+the office for every time step. Display frames are rendered from the records only when they are accessed, e.g. when
+plotting, saving or replaying a simulation.
+
+Records may be written to a frame store instead of memory: a directory of memory-mapped .npy files that are written
+as each time step is recorded. Frames are read from a frame store on demand, without loading the whole store, so
+memory use does not grow with the duration of a simulation and frames can be replayed as soon as the store is opened.
+
+Used by simulation.py and GUI.py.
+"""
+
+# External modules
+import os
+import shutil
+import numpy as np
+
+# Health state codes of people
+HEALTHY = 0
+INFECTED = 1
+CONTAGIOUS = 2
+# Display colour of each health state code
+STATE_COLOURS = np.array([[22, 152, 66],  # green = healthy
+                          [237, 71, 5],  # orange = infected
+                          [177, 0, 30]])  # red = contagious
+
+
+def get_states(people):
+    """Returns the health state code of each person in a population"""
+    states = np.full(len(people), HEALTHY, np.uint8)
+    states[people.infected] = INFECTED
+    states[people.contagious] = CONTAGIOUS
+    return states
+
+
+# Files of a frame store: the office base frame, the records of each time step and the number of time steps recorded
+BASE_FRAME_FILE = 'base_frame.npy'
+LOCATIONS_FILE = 'locations.npy'
+STATES_FILE = 'states.npy'
+TICKS_FILE = 'ticks.npy'
+
+
+class StateRecorder:
+    """Records the locations and health states of people at each time step of a simulation, in memory or in a frame
+    store"""
+
+    def __init__(self, base_frame, number_of_people, duration, directory=None):
+        """Initialise empty records for the duration of the simulation, to be drawn over the office base frame. If a
+        directory is given, a frame store is created in it, replacing any frame store already there."""
+        self.base_frame = base_frame
+        self.ticks = 0
+        if directory is None:
+            self.locations = np.zeros((duration, number_of_people, 2), np.int16)
+            self.states = np.zeros((duration, number_of_people), np.uint8)
+            self.recorded_ticks = None
+            return
+        delete_frame_store(directory)
+        os.makedirs(directory)
+        np.save(os.path.join(directory, BASE_FRAME_FILE), base_frame)
+        self.locations = np.lib.format.open_memmap(os.path.join(directory, LOCATIONS_FILE), 'w+', np.int16,
+                                                   (duration, number_of_people, 2))
+        self.states = np.lib.format.open_memmap(os.path.join(directory, STATES_FILE), 'w+', np.uint8,
+                                                (duration, number_of_people))
+        # Number of time steps recorded, updated in the store as each one is recorded
+        self.recorded_ticks = np.lib.format.open_memmap(os.path.join(directory, TICKS_FILE), 'w+', np.int64, (1,))
+
+    def record(self, people, ticks=1):
+        """Record the current locations and health states of a population, for a number of time steps in which they
+        do not change"""
+        self.locations[self.ticks:self.ticks + ticks] = people.current_locations
+        self.states[self.ticks:self.ticks + ticks] = get_states(people)
+        self.ticks += ticks
+        if self.recorded_ticks is not None:
+            self.recorded_ticks[0] = self.ticks
+
+    def get_frames(self):
+        """Returns a view of the display frames of the time steps recorded so far"""
+        return FrameView(self.base_frame, self.locations[:self.ticks], self.states[:self.ticks])
+
+
+class FrameView:
+    """A sequence of display frames, each rendered from recorded locations and health states when it is accessed. It
+    can be used in place of a list of display frames e.g. indexed, iterated over, or pickled."""
+
+    def __init__(self, base_frame, locations, states):
+        """Initialise a frame view from the office base frame and the records of each time step"""
+        self.base_frame = base_frame
+        self.locations = locations
+        self.states = states
+
+    def __len__(self):
+        return len(self.states)
+
+    def __getitem__(self, tick):
+        """Render the display frame of a time step, or a frame view of a slice of time steps"""
+        if isinstance(tick, slice):
+            return FrameView(self.base_frame, self.locations[tick], self.states[tick])
+        frame = self.base_frame.copy()
+        frame[self.locations[tick, :, 0], self.locations[tick, :, 1]] = STATE_COLOURS[self.states[tick]]
+        return frame
+
+    def __iter__(self):
+        for tick in range(len(self)):
+            yield self[tick]
+
+
+def frame_store_exists(directory):
+    """Returns whether a directory holds a frame store"""
+    return os.path.exists(os.path.join(directory, TICKS_FILE))
+
+
+def load_frames(directory):
+    """Returns a view of the display frames of the time steps recorded in a frame store. The records are memory-mapped
+    rather than read, so each frame is read from the store only when it is accessed."""
+    ticks = int(np.load(os.path.join(directory, TICKS_FILE))[0])
+    base_frame = np.load(os.path.join(directory, BASE_FRAME_FILE))
+    locations = np.load(os.path.join(directory, LOCATIONS_FILE), mmap_mode='r')
+    states = np.load(os.path.join(directory, STATES_FILE), mmap_mode='r')
+    return FrameView(base_frame, locations[:ticks], states[:ticks])
+
+
+def delete_frame_store(directory):
+    """Delete a frame store, if it exists"""
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
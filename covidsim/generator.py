@@ -0,0 +1,230 @@
+"""
+
+generator.py
+
+This script generates office floorplans procedurally, for testing the simulation on much larger offices than the
+hand-drawn floors of office_array.xls. Floorplans are generated from a size, a layout and a seed, so the same inputs
+always give the same floorplan. Two layouts can be generated:
+
+    1. Open plan
+
+        An open floor with clusters of desks on both sides of shared benches, separated by corridors, with printers
+        against the outer walls and a walled kitchen in one corner.
+
+    2. Cellular
+
+        Horizontal corridors linked by vertical corridors, with rows of walled rooms on both sides of each horizontal
+        corridor. Each room has a door onto its corridor and is an office with desks along its walls, a meeting room,
+        a kitchen or a printer room.
+
+Generated floorplans follow the rules for office_array.xls in the README: walls form a complete perimeter, there are
+no empty cells, and walls are only ever straight, so diagonal walls never need touching faces. Every desk and task can
+be reached from every other one, and every desk has a free cell beside it.
+
+Used by simulation.py and benchmark.py.
+"""
+
+# External modules
+import numpy as np
+from scipy import ndimage
+
+# Directory modules
+from covidsim.floorplan import Floorplan, WALL, FLOOR, TASK, DESK
+
+OPEN_PLAN = 0
+CELLULAR = 1
+LAYOUTS = {'open': OPEN_PLAN, 'cellular': CELLULAR}
+
+
+def add_room(grid, top, left, bottom, right, door_side, rng):
+    """Wall around the cells from (top, left) to (bottom, right) inclusive, leaving a door 2 cells wide in the wall on
+    one side ('top', 'bottom', 'left' or 'right') of the room"""
+    grid[top - 1, left - 1:right + 2] = WALL
+    grid[bottom + 1, left - 1:right + 2] = WALL
+    grid[top - 1:bottom + 2, left - 1] = WALL
+    grid[top - 1:bottom + 2, right + 1] = WALL
+    if door_side in ['top', 'bottom']:
+        door = rng.integers(left, right)  # door cells are door and door + 1, both inside the room
+        grid[top - 1 if door_side == 'top' else bottom + 1, door:door + 2] = FLOOR
+    else:
+        door = rng.integers(top, bottom)
+        grid[door:door + 2, left - 1 if door_side == 'left' else right + 1] = FLOOR
+
+
+def add_desks_along_walls(grid, top, left, bottom, right):
+    """Place desks at every other cell along the inside of the walls of a room, leaving the cells inside doors, and the
+    cells beside them, free"""
+    # Only the room and its walls are searched, as every door and desk of the room is within them
+    window = grid[top - 1:bottom + 2, left - 1:right + 2]
+    doors = np.zeros(window.shape, bool)
+    # Door cells of a room are the floor cells in its walls
+    doors[[0, -1], 1:-1] = window[[0, -1], 1:-1] == FLOOR
+    doors[1:-1, [0, -1]] = window[1:-1, [0, -1]] == FLOOR
+    near_doors = ndimage.binary_dilation(doors, iterations=2)
+    rows, columns = np.indices(window.shape)
+    on_wall = (rows == 1) | (rows == window.shape[0] - 2) | (columns == 1) | (columns == window.shape[1] - 2)
+    inside = (rows >= 1) & (rows <= window.shape[0] - 2) & (columns >= 1) & (columns <= window.shape[1] - 2)
+    # Desks are placed at every other cell, where (row + column) is even in the coordinates of the grid
+    window[inside & on_wall & ((rows + columns + top + left) % 2 == 0) & ~near_doors] = DESK
+
+
+def add_kitchen(grid, row, left, right):
+    """Place a counter of tasks along a row of a room, against its back wall"""
+    grid[row, left + 1:right:2] = TASK
+
+
+def generate_open_plan(rows, columns, rng):
+    """Returns a grid of an open plan office"""
+    grid = np.full((rows, columns), WALL, np.uint8)
+    grid[1:-1, 1:-1] = FLOOR
+    # Kitchen in a corner, with its door facing into the office
+    kitchen_rows = min(int(rng.integers(4, 7)), rows // 3)
+    kitchen_columns = min(int(rng.integers(6, 11)), columns // 3)
+    if rng.random() < 0.5:
+        top, door_side = 1, 'bottom'
+    else:
+        top, door_side = rows - 1 - kitchen_rows, 'top'
+    if rng.random() < 0.5:
+        left = 1
+    else:
+        left = columns - 1 - kitchen_columns
+    bottom, right = top + kitchen_rows - 1, left + kitchen_columns - 1
+    add_room(grid, top, left, bottom, right, door_side, rng)
+    add_kitchen(grid, top if door_side == 'bottom' else bottom, left, right)
+    # Keep a corridor around the kitchen free of desks
+    kitchen = np.zeros(grid.shape, bool)
+    kitchen[max(top - 2, 0):bottom + 3, max(left - 2, 0):right + 3] = True
+
+    # Clusters of desks on both sides of a bench, 3 rows deep, separated by corridors of 2 rows and 3 columns
+    for bench in range(4, rows - 4, 5):
+        column = 4
+        while column < columns - 8:
+            length = int(rng.integers(5, 12))
+            end = min(column + length, columns - 4)
+            # Leave about one in ten clusters out as open space, once there are desks
+            skip = rng.random() < 0.1 and (grid == DESK).any()
+            if not kitchen[bench - 1:bench + 2, column - 1:end + 1].any() and not skip:
+                grid[bench, column:end] = WALL
+                grid[bench - 1, column:end:2] = DESK
+                grid[bench + 1, column:end:2] = DESK
+            column = end + 3
+    if not (grid == DESK).any():
+        # Small offices may have no bench clear of the kitchen, so add one on the side of the office away from it
+        bench = rows - 5 if door_side == 'bottom' else 4
+        grid[bench, 4:columns - 4] = WALL
+        grid[bench - 1, 4:columns - 4:2] = DESK
+        grid[bench + 1, 4:columns - 4:2] = DESK
+
+    # Printers against the outer walls, in the middle of the corridor rows
+    for row in range(6, rows - 2, 10):
+        for column in [1, columns - 2]:
+            if grid[row, column] == FLOOR and not kitchen[row, column]:
+                grid[row, column] = TASK
+    return grid
+
+
+def generate_cellular(rows, columns, rng):
+    """Returns a grid of a cellular office"""
+    grid = np.full((rows, columns), WALL, np.uint8)
+    room_depth = min(int(rng.integers(5, 9)), (rows - 8) // 2)  # at least one strip of rooms must fit
+    strip = 2 * room_depth + 6  # rooms, wall, corridor of 3, wall, rooms, wall
+    # Vertical corridors at both ends and about every 40 columns
+    corridor_columns = np.linspace(1, columns - 4, max(round((columns - 5) / 40), 1) + 1).astype(int).tolist()
+    for column in corridor_columns:
+        grid[1:-1, column:column + 3] = FLOOR
+    rooms = []
+    top = 1
+    while top + strip - 1 <= rows - 1:
+        # Rooms above the corridor, the corridor, then rooms below it, which extend to the bottom wall if no further
+        # strip fits below them
+        corridor = top + room_depth + 1
+        grid[corridor:corridor + 3, 1:-1] = FLOOR
+        bottom = top + strip - 2
+        if bottom + strip >= rows - 1:
+            bottom = rows - 2
+        for band_top, band_bottom, door_side in [(top, corridor - 2, 'bottom'), (corridor + 4, bottom, 'top')]:
+            for start, end in zip(corridor_columns[:-1], corridor_columns[1:]):
+                # Divide the band between vertical corridors into rooms of random widths
+                left = start + 4
+                while left <= end - 6:
+                    width = int(rng.integers(5, 11))
+                    right = min(left + width - 1, end - 2)
+                    if end - 2 - right < 6:
+                        right = end - 2  # stretch the last room rather than leave a room too narrow to use
+                    grid[band_top:band_bottom + 1, left:right + 1] = FLOOR
+                    add_room(grid, band_top, left, band_bottom, right, door_side, rng)
+                    rooms.append((band_top, left, band_bottom, right))
+                    left = right + 2
+        top = bottom + 2
+
+    # Choose what each room is used for, with at least one office, kitchen and printer room if there are enough rooms
+    uses = rng.choice(['office', 'meeting', 'kitchen', 'printer'], size=len(rooms), p=[0.75, 0.1, 0.07, 0.08])
+    if len(rooms) >= 3:
+        chosen = rng.choice(len(rooms), 3, replace=False)
+        uses[chosen] = ['office', 'kitchen', 'printer']
+    else:
+        uses[:] = 'office'
+    for (top, left, bottom, right), use in zip(rooms, uses):
+        if use == 'office':
+            add_desks_along_walls(grid, top, left, bottom, right)
+        elif use == 'kitchen':
+            # Counter against the wall without the door
+            add_kitchen(grid, top if grid[top - 1, left:right + 1].all() else bottom, left, right)
+        elif use == 'printer':
+            grid[(top + bottom) // 2, (left + right) // 2] = TASK
+        else:
+            # Meeting table in the middle of the room, with tasks at its ends
+            middle = (top + bottom) // 2
+            grid[middle, left + 2:right - 1] = WALL
+            grid[middle, left + 1] = TASK
+            grid[middle, right - 1] = TASK
+    # Printers in the vertical corridors, against the outer walls
+    for column in corridor_columns:
+        grid[1, column + 1] = TASK
+    return grid
+
+
+def remove_unreachable(grid):
+    """Turn desks and tasks that cannot be reached from the largest connected area of floor into floor, and desks
+    without a free cell beside them into floor"""
+    floor = grid != WALL
+    labels, count = ndimage.label(floor, structure=np.ones((3, 3)))
+    if count > 1:
+        largest = np.argmax(np.bincount(labels.ravel())[1:]) + 1
+        grid[(labels != largest) & (grid != WALL)] = FLOOR
+    free = ndimage.convolve((grid == FLOOR).astype(int), np.ones((3, 3), int), mode='constant') > 0
+    grid[(grid == DESK) & ~free] = FLOOR
+    return grid
+
+
+def check_floorplan(floorplan):
+    """Raises a ValueError if a floorplan breaks the rules for office floorplans: the walls must form a complete
+    perimeter, and every desk and task must be reachable from every other one"""
+    grid = floorplan.grid
+    perimeter = np.concatenate([grid[0], grid[-1], grid[:, 0], grid[:, -1]])
+    if (perimeter != WALL).any():
+        raise ValueError('Walls must form a complete perimeter around the office.')
+    labels = ndimage.label(grid != WALL, structure=np.ones((3, 3)))[0]
+    locations = floorplan.desk_locations + floorplan.task_locations
+    if len(set(labels[location] for location in locations)) > 1:
+        raise ValueError('Every desk and task must be reachable from every other desk and task.')
+    if not floorplan.desk_locations or not floorplan.task_locations:
+        raise ValueError('Offices must have at least one desk and one task.')
+
+
+def generate_floorplan(rows, columns, layout=OPEN_PLAN, seed=None):
+    """Returns a generated floorplan of a number of rows and columns, with an open plan (0 or 'open') or cellular (1
+    or 'cellular') layout. Floorplans generated with the same seed are identical."""
+    if rows < 16 or columns < 16:
+        raise ValueError('Generated offices must be at least 16 x 16 cells.')
+    layout = LAYOUTS.get(layout, layout)
+    rng = np.random.default_rng(seed)
+    if layout == OPEN_PLAN:
+        grid = generate_open_plan(rows, columns, rng)
+    elif layout == CELLULAR:
+        grid = generate_cellular(rows, columns, rng)
+    else:
+        raise ValueError('Unknown office layout: ' + str(layout))
+    floorplan = Floorplan(remove_unreachable(grid))
+    check_floorplan(floorplan)
+    return floorplan
@@ -0,0 +1,118 @@
+"""
+
+instrumentation.py
+
+This script contains a class that records where the time of a simulation goes, for finding out why a run is slow. It
+is off by default. When enabled, the wall time of each phase of every time step is added up (social distancing,
+tasks, movement, interactions, transmission, recording and export), along with the time spent searching for paths
+with the pathfinder in use (A*, Jump Point Search or the zone graph). Counters are kept of path searches and their
+failures, moves to avoid blockages, interactions and infections.
+
+Phases are timed by taking one clock reading at the end of each phase, so the overhead is a few clock readings per
+time step. The totals can be read as a summary or a report, and the timings and counts of each time step can be saved
+to a trace file.
+
+Used by simulation.py, GUI.py and run_covid_simulation.py.
+"""
+
+# External modules
+import json
+import time
+
+PHASES = ['Social Distancing', 'Tasks', 'Movement', 'Interactions', 'Transmission', 'Recording', 'Export']
+COUNTERS = ['Path Searches', 'Path Failures', 'Skipped Searches', 'Repair Searches', 'Repair Failures',
+            'Move Somewhere Fallbacks', 'Interactions', 'Infections']
+
+
+class Instrumentation:
+    """Records the cumulative wall time of each phase of a simulation and counts of events, for every time step. All
+    methods do nothing if the instrumentation is not enabled."""
+
+    def __init__(self, enabled=True):
+        """Initialise timings and counters of zero"""
+        self.enabled = enabled
+        self.phase_seconds = dict.fromkeys(PHASES, 0.0)
+        self.search_seconds = 0.0  # time spent in path searches, which is part of the movement phase
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.ticks = 0
+        self.trace = []  # timings and counts of each time step
+        self.tick_start = self.lap_start = 0.0
+        self.tick_seconds = {}
+        self.tick_counters = {}
+
+    def start_tick(self):
+        """Start timing a time step"""
+        if not self.enabled:
+            return
+        self.tick_start = self.lap_start = time.perf_counter()
+        self.tick_seconds = {}
+        self.tick_counters = dict(self.counters)
+
+    def lap(self, phase):
+        """Add the time since the last phase ended, or the time step started, to a phase"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.phase_seconds[phase] += now - self.lap_start
+        self.tick_seconds[phase] = self.tick_seconds.get(phase, 0.0) + now - self.lap_start
+        self.lap_start = now
+
+    def count(self, counter, number=1):
+        """Add to a counter"""
+        if self.enabled:
+            self.counters[counter] += number
+
+    def time_search(self, search, array, name='Path'):
+        """Call a path search of a person through an array, timing it and counting it as a search of its name, and as
+        a failure if no path is found. Returns the path found."""
+        if not self.enabled:
+            return search(array)
+        start = time.perf_counter()
+        path = search(array)
+        self.search_seconds += time.perf_counter() - start
+        self.counters[name + ' Searches'] += 1
+        if len(path) == 0:
+            self.counters[name + ' Failures'] += 1
+        return path
+
+    def end_tick(self, tick, ticks=1):
+        """Finish timing a time step, or a number of time steps run at once, and add its timings and counts to the
+        trace"""
+        if not self.enabled:
+            return
+        self.ticks += ticks
+        record = {'Tick': tick + ticks,
+                  'Seconds': time.perf_counter() - self.tick_start,
+                  'Phase Seconds': self.tick_seconds,
+                  'Counters': {name: self.counters[name] - self.tick_counters[name] for name in COUNTERS
+                               if self.counters[name] != self.tick_counters[name]}}
+        if ticks > 1:
+            record['Ticks'] = ticks  # idle time steps skipped by an EventScheduler, see scheduler.py
+        self.trace.append(record)
+
+    def summary(self):
+        """Returns a dictionary of the total time of each phase, the time spent in path searches and the counters"""
+        summary = {'Ticks': self.ticks, 'Total Seconds': sum(self.phase_seconds.values())}
+        summary.update({name + ' Seconds': seconds for name, seconds in self.phase_seconds.items()})
+        summary['Path Search Seconds'] = self.search_seconds
+        summary.update(self.counters)
+        return summary
+
+    def get_report(self):
+        """Returns a report of where the time of the simulation went"""
+        total = max(sum(self.phase_seconds.values()), 1e-12)
+        lines = ['Timings of ' + str(self.ticks) + ' time steps (' + '%.3f' % total + ' s):']
+        for name, seconds in self.phase_seconds.items():
+            lines.append('    %-20s %9.4f s %6.1f%%' % (name, seconds, 100 * seconds / total))
+            if name == 'Movement':
+                lines.append('      %-18s %9.4f s %6.1f%%' % ('of which searches', self.search_seconds,
+                                                               100 * self.search_seconds / total))
+        lines.append('Counts:')
+        lines += ['    %-26s %9d' % (name, count) for name, count in self.counters.items()]
+        return '\n'.join(lines)
+
+    def save_trace(self, file_name='profile_trace.jsonl'):
+        """Save the timings and counts of each time step to a file, one json object per line"""
+        with open(file_name, 'w') as file:
+            for record in self.trace:
+                file.write(json.dumps(record) + '\n')
@@ -0,0 +1,154 @@
+"""
+
+jump_point.py
+
+This script contains a pathfinder that finds shortest paths through the office by Jump Point Search, as an alternative
+to the A* search of the pathfinding package. It works directly on a numpy pathfinding array, where cells with a value
+greater than 0 can be walked through and walls (0) and people (their negative ID) cannot, and it moves diagonally in
+the same way as DiagonalMovement.always.
+
+A* adds every cell next to each cell it visits to its open list, so it visits most of the cells of a large open area
+on its way across it. On a grid where every step costs the same, Jump Point Search instead skips along straight and
+diagonal lines until it reaches a cell next to an obstacle that a shortest path might need to turn at (a jump point),
+and only adds jump points to its open list. Paths found are as short as those found by A*, though where several paths
+are equally short a different one may be chosen.
+
+Paths are returned in the format of the pathfinding package, as a list of (column, row) cells from the start to the
+end, so they can be followed by Person.move.
+
+Used by person.py and benchmark.py.
+"""
+
+# External modules
+import heapq
+import math
+import numpy as np
+
+SQRT2 = math.sqrt(2)
+
+
+def octile(rows, columns):
+    """Returns the length of the shortest path across a number of rows and columns, moving diagonally where possible"""
+    rows, columns = abs(rows), abs(columns)
+    return (SQRT2 - 1) * min(rows, columns) + max(rows, columns)
+
+
+def jump_straight(cell, step, side, walkable, end):
+    """Returns the first jump point reached from a cell moving straight by a step through a flattened grid of walkable
+    cells, or -1 if a blocked cell is reached first. Side is the step at right angles to the direction of movement."""
+    while walkable[cell]:
+        if cell == end:
+            return cell
+        # A cell beside the line that is only reachable around an obstacle makes this a jump point
+        if (walkable[cell + step + side] and not walkable[cell + side]) or \
+                (walkable[cell + step - side] and not walkable[cell - side]):
+            return cell
+        cell += step
+    return -1
+
+
+def jump_diagonal(cell, row_step, column_step, walkable, end):
+    """Returns the first jump point reached from a cell moving diagonally through a flattened grid of walkable cells, or
+    -1 if a blocked cell is reached first. A cell from which a jump point can be reached moving straight along either
+    component of the diagonal is also a jump point."""
+    while walkable[cell]:
+        if cell == end:
+            return cell
+        if (walkable[cell - column_step + row_step] and not walkable[cell - column_step]) or \
+                (walkable[cell + column_step - row_step] and not walkable[cell - row_step]):
+            return cell
+        if jump_straight(cell + column_step, column_step, row_step, walkable, end) >= 0 or \
+                jump_straight(cell + row_step, row_step, column_step, walkable, end) >= 0:
+            return cell
+        cell += row_step + column_step
+    return -1
+
+
+def get_directions(cell, parent, width, walkable):
+    """Returns the directions to search from a cell reached from a parent cell, as (row step, column step) pairs in a
+    flattened grid of a width. Directions that cannot lead to a shorter path than through the parent are pruned,
+    keeping the directions forced by obstacles beside the cell."""
+    if parent < 0:
+        return [(row_step, column_step) for row_step in (-width, 0, width) for column_step in (-1, 0, 1)
+                if row_step or column_step]
+    rows, columns = divmod(cell, width)
+    parent_rows, parent_columns = divmod(parent, width)
+    row_step = width * ((rows > parent_rows) - (rows < parent_rows))
+    column_step = (columns > parent_columns) - (columns < parent_columns)
+    if row_step and column_step:
+        directions = [(row_step, column_step), (row_step, 0), (0, column_step)]
+        if not walkable[cell - column_step]:
+            directions.append((row_step, -column_step))
+        if not walkable[cell - row_step]:
+            directions.append((-row_step, column_step))
+    else:
+        # Moving straight, where side is the step at right angles to the direction of movement
+        side = 1 if row_step else width
+        directions = [(row_step, column_step)]
+        for turn in (side, -side):
+            if not walkable[cell + turn]:
+                directions.append((row_step or turn, column_step or turn))
+    return directions
+
+
+def find_path(array, start_location, end_location):
+    """Returns a shortest path between start and end (row, column) locations through a pathfinding array, as a list of
+    (column, row) cells, or an empty list if there is no path. The start location does not need to be walkable."""
+    # Flatten the walkable cells of the array, padded with a border of blocked cells so that no bounds checks are needed
+    width = array.shape[1] + 2
+    walkable = np.pad(np.asarray(array) > 0, 1).ravel().tolist()
+    start = (int(start_location[0]) + 1) * width + int(start_location[1]) + 1
+    end = (int(end_location[0]) + 1) * width + int(end_location[1]) + 1
+    if start != end and not walkable[end]:
+        return []
+    end_rows, end_columns = divmod(end, width)
+
+    costs = {start: 0.0}
+    parents = {start: -1}
+    open_list = [(0.0, start)]
+    closed = set()
+    while open_list:
+        _, cell = heapq.heappop(open_list)
+        if cell in closed:
+            continue
+        if cell == end:
+            return get_path(parents, end, width)
+        closed.add(cell)
+        rows, columns = divmod(cell, width)
+        for row_step, column_step in get_directions(cell, parents[cell], width, walkable):
+            # Jump along each direction to the next jump point, if there is one before a blocked cell
+            if row_step and column_step:
+                jump_point = jump_diagonal(cell + row_step + column_step, row_step, column_step, walkable, end)
+            elif row_step:
+                jump_point = jump_straight(cell + row_step, row_step, 1, walkable, end)
+            else:
+                jump_point = jump_straight(cell + column_step, column_step, width, walkable, end)
+            if jump_point < 0 or jump_point in closed:
+                continue
+            jump_rows, jump_columns = divmod(jump_point, width)
+            cost = costs[cell] + octile(jump_rows - rows, jump_columns - columns)
+            if cost < costs.get(jump_point, math.inf):
+                costs[jump_point] = cost
+                parents[jump_point] = cell
+                heapq.heappush(open_list, (cost + octile(end_rows - jump_rows, end_columns - jump_columns),
+                                           jump_point))
+    return []
+
+
+def get_path(parents, end, width):
+    """Returns the path to an end cell from the parents of each jump point, filling in the cells between jump points,
+    as (column, row) cells of the unpadded array"""
+    jump_points = [end]
+    while parents[jump_points[-1]] >= 0:
+        jump_points.append(parents[jump_points[-1]])
+    jump_points.reverse()
+    rows, columns = divmod(jump_points[0], width)
+    path = [(columns - 1, rows - 1)]
+    for jump_point in jump_points[1:]:
+        jump_rows, jump_columns = divmod(jump_point, width)
+        # Cells between jump points lie on a straight or diagonal line
+        while (rows, columns) != (jump_rows, jump_columns):
+            rows += (jump_rows > rows) - (jump_rows < rows)
+            columns += (jump_columns > columns) - (jump_columns < columns)
+            path.append((columns - 1, rows - 1))
+    return path
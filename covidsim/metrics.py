@@ -0,0 +1,55 @@
+"""
+
+metrics.py
+
+This script contains functions that collect the time series of a simulation, i.e. the number of infected, contagious
+and susceptible people and the number of interactions at each time step, and every infection with its infector, and
+save them to a compact .csv or .json file.
+
+It is used for headless runs, where no display frames, plots or animations are produced, so that a run costs only the
+simulation itself.
+
+Used by simulation.py and run_covid_simulation.py.
+"""
+
+# External modules
+import json
+import os
+import numpy as np
+
+TICK_COLUMNS = ['Tick', 'Infected', 'Contagious', 'Susceptible', 'Interactions']
+EVENT_COLUMNS = ['Tick', 'ID', 'Infector ID']
+
+
+def get_metrics(params, office, people):
+    """Returns a dictionary of the time series and infection events of a finished simulation. Infection events are
+    [tick, ID, infector ID] lists, where people infected at the start of the simulation have tick and infector ID 0."""
+    infected_counts = np.array(office.infected_counts, int)
+    initial_IDs = people.IDs[people.infected & (people.infector_ID == 0)]
+    initial_events = [[0, ID, 0] for ID in initial_IDs.tolist()]
+    return {'Parameters': dict(params),
+            'Tick': list(range(1, len(infected_counts) + 1)),
+            'Infected': infected_counts.tolist(),
+            'Contagious': [int(count) for count in office.contagious_counts],
+            'Susceptible': (len(people) - infected_counts).tolist(),
+            'Interactions': [int(count) for count in office.interaction_counts],
+            'Infection Events': initial_events + office.infection_events}
+
+
+def get_events_file_name(file_name):
+    """Returns the name of the .csv file that infection events are saved to alongside a .csv file of time series"""
+    root, extension = os.path.splitext(file_name)
+    return root + '_events' + extension
+
+
+def save_metrics(metrics, file_name='metrics.json'):
+    """Save metrics to a .json file, or to a .csv file of time series and a second .csv file of infection events"""
+    if file_name.endswith('.json'):
+        with open(file_name, 'w') as file:
+            json.dump(metrics, file, separators=(',', ':'))
+        return
+    ticks = np.column_stack([metrics[name] for name in TICK_COLUMNS]).reshape(-1, len(TICK_COLUMNS))
+    np.savetxt(file_name, ticks, delimiter=',', fmt='%d', header=','.join(TICK_COLUMNS), comments='')
+    events = np.array(metrics['Infection Events'], int).reshape(-1, len(EVENT_COLUMNS))
+    np.savetxt(get_events_file_name(file_name), events, delimiter=',', fmt='%d', header=','.join(EVENT_COLUMNS),
+               comments='')
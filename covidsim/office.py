@@ -10,9 +10,49 @@ Used by simulation.py.
 """
 
 # External modules
-import pandas as pd
 import numpy as np
+from scipy import ndimage
 from scipy.spatial import distance
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+# Directory modules
+from covidsim.floorplan import Floorplan, load_floorplan, WALL
+from covidsim.instrumentation import Instrumentation
+from covidsim.person import ZONE_GRAPH
+import covidsim.zones as zones
+
+# Offsets of the 8 cells adjacent to a person
+NEIGHBOUR_OFFSETS = np.array([(dx, dy) for dx in range(-1, 2) for dy in range(-1, 2) if (dx, dy) != (0, 0)])
+# Offsets of the 24 cells within 2 cells of a person and the distance to each of them
+INTERACTION_OFFSETS = np.array([(dx, dy) for dx in range(-2, 3) for dy in range(-2, 3) if (dx, dy) != (0, 0)])
+INTERACTION_DISTANCES = np.sqrt((INTERACTION_OFFSETS ** 2).sum(axis=1))
+# Adjacent cells through which each interaction offset can be reached i.e. cells touching both the person and the
+# offset cell (an adjacent offset cell can always be reached through itself)
+INTERACTION_ROUTES = (np.abs(INTERACTION_OFFSETS[:, None, :] - NEIGHBOUR_OFFSETS[None, :, :]).max(axis=2) <= 1)
+
+
+def get_grid_graph(floor):
+    """Returns a graph linking each cell of a boolean array of floor cells to the floor cells adjacent to it, weighted
+    by the distance between them. Cells are numbered in row-major order."""
+    shape = floor.shape
+    cell_numbers = np.arange(floor.size).reshape(shape)
+    starts, ends, weights = [], [], []
+    for (dx, dy) in [(1, 0), (0, 1), (1, 1), (1, -1)]:
+        start_cells = (slice(max(0, -dx), shape[0] - max(0, dx)), slice(max(0, -dy), shape[1] - max(0, dy)))
+        end_cells = (slice(max(0, dx), shape[0] - max(0, -dx)), slice(max(0, dy), shape[1] - max(0, -dy)))
+        linked = floor[start_cells] & floor[end_cells]
+        starts.append(cell_numbers[start_cells][linked])
+        ends.append(cell_numbers[end_cells][linked])
+        weights.append(np.full(np.count_nonzero(linked), np.hypot(dx, dy)))
+    return csr_matrix((np.concatenate(weights), (np.concatenate(starts), np.concatenate(ends))),
+                      shape=(floor.size, floor.size))
+
+
+def sort_interactions(interactions):
+    """Sort interactions by the people interacting and then distance"""
+    order = np.lexsort((interactions[:, 2], interactions[:, 1], interactions[:, 0]))
+    return interactions[order]
 
 
 class Office:
@@ -27,40 +67,128 @@ class Office:
             equal to their negative ID number, to simultaneously track their position and make their location not
             traversable to others.
 
+            As the walls never change, flow fields are also precomputed for desk and task locations, the first time
+            someone heads to each location. These store the next cell on a shortest path to the location from anywhere
+            in the office, so people whose way is not blocked by others can step towards their task without searching
+            for a path.
+
             It repeats this process for those who abide social distancing, making the adjacent cells to people not
             traversable. This social distancing pathfinding array is only obeyed if the route is available: if they
-            cannot social distance, the person will revert to the normal pathfinding array.
+            cannot social distance, the person will revert to the normal pathfinding array. A single social distancing
+            array is shared by everyone: it is rebuilt each time step and updated around people as they move, with
+            the bubble of the person moving removed while they find their path.
 
         2. Detecting interactions
 
             As the pathfinding array stores the locations of people, these can be analysed at each time step to detect
-            interactions that might lead to transmission.
+            interactions that might lead to transmission. Interactions for the whole office are found in a single
+            pass over the people coordinates, using lookup tables of the cells within 2 cells of a person.
 
     """
 
     def __init__(self, floor_no):
         """
         Generate an office object with desk and task locations dictated by an
-        excel input file.
+        excel input file, compiled into a floorplan when first loaded. A
+        Floorplan may be given instead of a floor number e.g. for generated
+        floorplans.
 
         """
-        # Create an array using the excel input file
-        self.input_array = pd.read_excel('office_array.xls', floor_no).values.transpose()
+        # Load the compiled floorplan of the excel input file
+        floorplan = floor_no if isinstance(floor_no, Floorplan) else load_floorplan(floor_no)
+        self.floor_grid = floorplan.grid
+        # Create an array in the format of the excel input file
+        self.input_array = floorplan.get_input_array()
         # Create pathfinding array denoting which cells are traversable
-        self.pathfinding_array = np.where(self.input_array != 0, 1, self.input_array)
+        self.pathfinding_array = np.where(self.floor_grid != WALL, 1, 0)
         # Create array for displaying infection status
         self.display_array = self.pathfinding_array.copy()
         # Find locations of tasks (T in excel) and desks (D in excel)
-        self.desk_locations = list(zip(list(np.where(self.input_array == 'D'))[0],
-                                       list(np.where(self.input_array == 'D'))[1]))
-        self.task_locations = list(zip(list(np.where(self.input_array == 'T'))[0],
-                                       list(np.where(self.input_array == 'T'))[1]))
+        self.desk_locations = list(floorplan.desk_locations)
+        self.task_locations = list(floorplan.task_locations)
         # Create social distancing array from pathfinding array which will be
         # used for people who have the social distancing attribute.
         self.social_dist_array = self.pathfinding_array.copy()
+        # Create array counting the people adjacent to each cell, which make it not traversable when socially distancing
+        self.social_dist_counts = np.zeros(self.pathfinding_array.shape, int)
         # Create people locations dictionary to be populated and updated as
         # people move.
         self.people_locations = {}
+        # Create flow fields dictionary to be populated as people move to each location, and the graph they are found
+        # from
+        self.flow_fields = {}
+        self.flow_graph = None
+        # Create graph of the zones of the office to plan long paths on, built when first needed
+        self.zone_graph = None
+        # Count how paths are found as people move
+        self.path_counts = {'Cache hits': 0, 'Repairs': 0, 'Flow steps': 0, 'Replans': 0}
+        # Whether path searches that cannot succeed are skipped, which is done by event-driven simulations
+        self.skip_unreachable = False
+        # Timings and counters of the simulation, which are not recorded unless enabled
+        self.instrumentation = Instrumentation(enabled=False)
+
+    def get_flow_graph(self):
+        """Returns a graph linking each floor cell to the floor cells adjacent to it, weighted by the distance between
+        them, building it the first time it is needed"""
+        if self.flow_graph is None:
+            self.flow_graph = get_grid_graph(self.floor_grid != WALL)
+        return self.flow_graph
+
+    def build_flow_fields(self, destinations=None, chunk_size=64):
+        """Precompute a flow field for desk and task locations (every desk and task location if none are given). A
+        flow field stores, for each cell, the adjacent cell that is next on a shortest path to the location through
+        the walls of the office, using the same diagonal movement costs as the pathfinding of people. Cells with no
+        next cell store (-1, -1). Flow fields are found for chunks of locations at a time, to limit the memory used on
+        large floors"""
+        if destinations is None:
+            destinations = self.desk_locations + self.task_locations
+        shape = self.floor_grid.shape
+        cell_numbers = np.arange(self.floor_grid.size).reshape(shape)
+        graph = self.get_flow_graph()
+        for start in range(0, len(destinations), chunk_size):
+            chunk = destinations[start:start + chunk_size]
+            # Find the distance from every cell to each destination
+            distances = dijkstra(graph, directed=False, indices=[cell_numbers[location] for location in chunk])
+            distances = distances.reshape((len(chunk),) + shape)
+            # The next cell is the adjacent cell with the shortest distance to the destination through it
+            padded = np.pad(distances, ((0, 0), (1, 1), (1, 1)), constant_values=np.inf)
+            costs = np.stack([padded[:, 1 + dx:1 + dx + shape[0], 1 + dy:1 + dy + shape[1]] + np.hypot(dx, dy)
+                              for (dx, dy) in NEIGHBOUR_OFFSETS], axis=-1)
+            next_cells = (np.indices(shape).transpose(1, 2, 0) + NEIGHBOUR_OFFSETS[costs.argmin(axis=-1)])
+            # Destinations, walls and cells that cannot reach the destination have no next cell
+            next_cells[~np.isfinite(distances) | (distances == 0)] = -1
+            self.flow_fields.update(zip(chunk, next_cells.astype(np.int16)))
+
+    def get_flow_field(self, destination):
+        """Returns the flow field towards a desk or task location, building it if it does not exist"""
+        if destination not in self.flow_fields:
+            self.build_flow_fields([destination])
+        return self.flow_fields[destination]
+
+    def get_zone_graph(self):
+        """Returns the zone graph of the office (see zones.py), building it the first time it is needed"""
+        if self.zone_graph is None:
+            self.zone_graph = zones.ZoneGraph(self.floor_grid)
+        return self.zone_graph
+
+    def is_reachable(self, array, start, end):
+        """Returns whether a path could be found from a start to an end location through an array, i.e. whether they
+        are in the same area of traversable cells, where cells are connected to all 8 cells around them"""
+        traversable = array > 0
+        traversable[start] = True  # as people search from their own cell
+        labels = ndimage.label(traversable, structure=np.ones((3, 3)))[0]
+        return labels[start] == labels[end]
+
+    def get_path(self, person, array):
+        """Generates a path for a person to their task through an array, planned on the zone graph of the office if
+        selected for the population, otherwise searched for by the person"""
+        if person.population.pathfinder == ZONE_GRAPH:
+            return self.get_zone_graph().find_path(array, person.current_location, person.task_location)
+        return person.get_path(array)
+
+    def assign_task(self, person):
+        """Assign the next task of a person, from the task locations of the office"""
+        person.get_task(self.task_locations)
 
     def adj_finder(self, matrix, position, interactions=False):
         """Used to detect if cells adjacent to the one occupied are available for moving into. The optional
@@ -111,15 +239,71 @@ class Office:
                                      distance.euclidean(person_loc, cell)])
         return interactions
 
-    def fill_social_distancing_array(self, current_person_ID, people_locations):
-        """Returns a modified pathfinding array that enlarges the not traversable space around other people"""
-        people = list(people_locations.keys())
-        people.remove(current_person_ID)
-        social_dist_array = self.pathfinding_array.copy()
-        for person in people:
-            bubble = self.adj_finder(self.pathfinding_array, people_locations[person])
-            for location in bubble:
-                # Modifies pathfinding array to have 'walls' in cells adjacent to other people, so socially distant
-                # pathfinding keeps distant
-                social_dist_array[location] = 0
-        return social_dist_array
+    def get_nearby_cells(self, matrix, people_coords):
+        """Returns the values of the cells of people at coordinates in a matrix, the values of the cells within 2 cells
+        of each person, and which of those cells can be reached from the person without passing through a wall"""
+        # Pad the office with walls so that cells within 2 cells of any person can be indexed
+        grid = np.pad(np.asarray(matrix, dtype=int), 2)
+        coords = np.asarray(people_coords, dtype=int).reshape(-1, 2) + 2
+        person_values = grid[coords[:, 0], coords[:, 1]]
+        # Find which of the cells adjacent to each person are not walls...
+        neighbours = coords[:, None, :] + NEIGHBOUR_OFFSETS
+        open_neighbours = grid[neighbours[..., 0], neighbours[..., 1]] != 0
+        # ... and so which cells within 2 cells of each person can be reached without passing through a wall
+        reachable = (open_neighbours.astype(int) @ INTERACTION_ROUTES.T.astype(int)) > 0
+        cells = coords[:, None, :] + INTERACTION_OFFSETS
+        cell_values = grid[cells[..., 0], cells[..., 1]]
+        return person_values, cell_values, reachable
+
+    def find_all_interactions(self, matrix, people_coords):
+        """Return an array of every interaction in the office, where each row holds the people interacting and the
+        distance between them. Rows are unique and sorted, and are equal to those found by calling find_interactions
+        for every person and removing duplicates"""
+        person_values, cell_values, reachable = self.get_nearby_cells(matrix, people_coords)
+        # Record each interaction once, from the person with the lowest ID
+        # NOTE: cells occupied by people are represented by a value equal to their negative id
+        person_index, offset_index = np.nonzero(reachable & (cell_values < 0) & (cell_values < person_values[:, None]))
+        interactions = np.column_stack((person_values[person_index],
+                                        cell_values[person_index, offset_index],
+                                        INTERACTION_DISTANCES[offset_index])).astype(float)
+        return sort_interactions(interactions)
+
+    def find_interactions_near(self, matrix, people_coords):
+        """Return an array of every interaction that involves at least one of the people at the given coordinates, in
+        the same format as find_all_interactions. Interactions between people who have not moved are unchanged, so
+        these are all the interactions that need to be found again after some people have moved."""
+        person_values, cell_values, reachable = self.get_nearby_cells(matrix, people_coords)
+        # Mark the people given by their ID, to record an interaction between two of them once
+        # NOTE: cells occupied by people are represented by a value equal to their negative id
+        given = np.zeros(1 - min(cell_values.min(initial=0), person_values.min(initial=0)), bool)
+        given[-person_values] = True
+        other_given = given[np.where(cell_values < 0, -cell_values, 0)]
+        person_index, offset_index = np.nonzero(reachable & (cell_values < 0)
+                                                & (~other_given | (cell_values < person_values[:, None])))
+        people_values = person_values[person_index]
+        others_values = cell_values[person_index, offset_index]
+        # Record each interaction from the person with the lowest ID
+        interactions = np.column_stack((np.maximum(people_values, others_values),
+                                        np.minimum(people_values, others_values),
+                                        INTERACTION_DISTANCES[offset_index])).astype(float)
+        return sort_interactions(interactions)
+
+    def build_social_distancing_array(self):
+        """Rebuild the social distancing array from the pathfinding array, by dilating the locations of people to count
+        the people adjacent to each cell"""
+        shape = self.pathfinding_array.shape
+        occupied = np.pad(self.pathfinding_array < 0, 1).astype(int)
+        self.social_dist_counts = sum(occupied[1 + dx:1 + dx + shape[0], 1 + dy:1 + dy + shape[1]]
+                                      for (dx, dy) in NEIGHBOUR_OFFSETS)
+        self.social_dist_array = np.where((self.pathfinding_array > 0) & (self.social_dist_counts > 0), 0,
+                                          self.pathfinding_array)
+
+    def update_social_distancing_array(self, location, change):
+        """Add (change of 1) or remove (change of -1) the bubble of a person at a location from the social distancing
+        array, updating only the cells around them. The pathfinding array must already hold the location's value"""
+        window = (slice(max(location[0] - 1, 0), location[0] + 2), slice(max(location[1] - 1, 0), location[1] + 2))
+        self.social_dist_counts[window] += change
+        self.social_dist_counts[location] -= change  # a person's own cell is not in their bubble
+        self.social_dist_array[window] = np.where((self.pathfinding_array[window] > 0)
+                                                  & (self.social_dist_counts[window] > 0), 0,
+                                                  self.pathfinding_array[window])
@@ -8,15 +8,48 @@ April 2021
 This script contains a class that defines a person with constant and variable attributes used to model movement,
 interactions and Covid-19 transmission.
 
-Used by simulation.py.
+Used by population.py and simulation.py.
 """
 
 # External modules
-import random
 from pathfinding.core.diagonal_movement import DiagonalMovement
 from pathfinding.core.grid import Grid
 from pathfinding.finder.a_star import AStarFinder
 
+# Directory modules
+import covidsim.jump_point as jump_point
+
+# Number of cells along a blocked path searched for a cell to rejoin it, and the margin of cells around the blockage
+# searched for a detour
+REPAIR_LENGTH = 5
+REPAIR_MARGIN = 2
+# Pathfinders that may be selected with the 'Pathfinder' parameter
+A_STAR = 0
+JUMP_POINT_SEARCH = 1
+ZONE_GRAPH = 2
+
+
+def column_property(column):
+    """Returns a property that reads and writes a person's value in a column of their population"""
+    def get_value(self):
+        return getattr(self.population, column)[self.index]
+
+    def set_value(self, value):
+        getattr(self.population, column)[self.index] = value
+    return property(get_value, set_value)
+
+
+def location_property(column):
+    """Returns a property that reads and writes a person's coordinates in a column of their population"""
+    def get_location(self):
+        location = getattr(self.population, column)[self.index]
+        return int(location[0]), int(location[1])
+
+    def set_location(self, location):
+        getattr(self.population, column)[self.index] = location
+    return property(get_location, set_location)
+
+
 class Person:
     """A person will sit at their desk for a random duration, randomly allocate themselves a task across the room
     e.g. go to the printer, and then find a path and move to that task. After the task they will return to their desk
@@ -24,64 +57,127 @@ class Person:
     how they will move around other people, and their likelihood of catching coronavirus e.g. if they are wearing a
     mask.
 
+    The properties of a person are stored in their row of a Population, which assigns them, so that a person is a view
+    that can be used to read and update one person at a time.
+
     """
-    def __init__(self, ID, desks, params):
-        """Initialise person properties based on simulation inputs"""
-        # Personal properties
-        self.ID = ID
-        self.age = random.randint(params['Minimum Age'], params['Maximum Age'])
-        if random.random() < params['Mask Adherence']/100:
-            self.mask = True
-        else:
-            self.mask = False
-        if random.random() < params['Social Distancing Adherence']/100:
-            self.social_distancing = True
-        else:
-            self.social_distancing = False
-        self.infected = False
-        self.infected_time = 0
-        self.contagious = False
+    # Personal properties
+    age = column_property('age')
+    mask = column_property('mask')
+    social_distancing = column_property('social_distancing')
+    infected = column_property('infected')
+    infected_time = column_property('infected_time')
+    contagious = column_property('contagious')
 
-        # Transmission tree properties
-        self.infector_ID = ""
+    # Transmission tree properties
+    infector_ID = column_property('infector_ID')
 
-        # Position properties
-        self.desk_location = desks[ID-1]  # assign desk coordinates by ID
-        self.task_location = self.desk_location  # Initialise person at their desk
-        self.current_location = self.desk_location
+    # Position properties
+    desk_location = location_property('desk_locations')
+    task_location = location_property('task_locations')
+    current_location = location_property('current_locations')
 
-        # Task properties
-        self.task_duration = random.randint(1, 50) # How long person should stay at desk initially
-        self.task_progress = 0
+    # Task properties
+    task_duration = column_property('task_duration')
+    task_progress = column_property('task_progress')
+
+    def __init__(self, ID, population):
+        """Initialise a view of a person's row of the population"""
+        self.ID = ID
+        self.index = ID - 1
+        self.population = population
+        self.path = []  # Planned path to the task location, kept between time steps
 
     def get_task(self, locations):
         """Assign a random task location and task duration. Possible task 
             locations are determined by the selected office floorplan. If a 
             person has just completed a task, they will return to their desk 
             for a random duration. If they are at their desk, they will move 
-            to a task location.
+            to a task location. Random choices are drawn from the movement stream
+            of the population.
         """
+        rng = self.population.streams.movement
+        self.path = []  # Planned path no longer leads to the task location
         if self.current_location == self.desk_location:
-            self.task_location = locations[random.randint(0, len(locations)-1)]
-            self.task_duration = random.randint(1, 10)
+            self.task_location = locations[rng.integers(len(locations))]
+            self.task_duration = rng.integers(1, 10, endpoint=True)
         else:
             self.task_location = self.desk_location
-            self.task_duration = random.randint(50, 100)
+            self.task_duration = rng.integers(50, 100, endpoint=True)
 
-    def get_path(self, array):
+    def get_path(self, array, start_location=None, end_location=None):
         """Generates a path between the current location and destination location of the person, through the
-        populated office space, using imported pathfinding."""
+        populated office space, using imported pathfinding or Jump Point Search (see jump_point.py) as selected for
+        the population. Jump Point Search is also used to search near people planning on a zone graph (see zones.py).
+        Other start and end locations may optionally be given."""
+        if start_location is None:
+            start_location = self.current_location
+        if end_location is None:
+            end_location = self.task_location
+        if self.population.pathfinder in [JUMP_POINT_SEARCH, ZONE_GRAPH]:
+            return jump_point.find_path(array, start_location, end_location)
 
         # Load the office space to be navigated and add start (current) and end locations
         grid = Grid(matrix=array)
-        start = grid.node(self.current_location[1], self.current_location[0])
-        end = grid.node(self.task_location[1], self.task_location[0])
+        start = grid.node(start_location[1], start_location[0])
+        end = grid.node(end_location[1], end_location[0])
         finder = AStarFinder(diagonal_movement=DiagonalMovement.always)  # allow for diagonal movement
 
         # Generate the path
         path, runs = finder.find_path(start, end, grid)
         return path
 
+    def get_cached_path(self, array):
+        """Returns the remaining planned path of the person if its next cell is not blocked in the array, otherwise an
+        empty list. The planned path is kept if it is blocked, so that it can be repaired."""
+        # Drop the cells of the planned path that have already been moved through
+        current_cell = (self.current_location[1], self.current_location[0])
+        if current_cell in self.path:
+            self.path = self.path[self.path.index(current_cell):]
+        else:
+            self.path = []  # Person has been moved off their path
+        if len(self.path) > 1 and array[self.path[1][1], self.path[1][0]] > 0:
+            return self.path
+        return []
+
+    def repair_path(self, array):
+        """Re-splices the planned path of the person around cells blocked in the array, by generating a detour to the
+        first unblocked cell further along the path within a small window of the office. Returns the repaired path,
+        or an empty list if the path cannot be repaired."""
+        rejoin = None
+        for index in range(2, min(len(self.path), REPAIR_LENGTH + 2)):
+            if array[self.path[index][1], self.path[index][0]] > 0:
+                rejoin = index
+                break
+        if rejoin is None:
+            self.path = []
+            return self.path
+
+        # Search for a detour within a window around the blockage
+        (start_y, start_x), (end_y, end_x) = self.path[0], self.path[rejoin]
+        min_x = max(min(start_x, end_x) - REPAIR_MARGIN, 0)
+        min_y = max(min(start_y, end_y) - REPAIR_MARGIN, 0)
+        max_x = min(max(start_x, end_x) + REPAIR_MARGIN + 1, array.shape[0])
+        max_y = min(max(start_y, end_y) + REPAIR_MARGIN + 1, array.shape[1])
+        detour = self.get_path(array[min_x:max_x, min_y:max_y],
+                               (start_x - min_x, start_y - min_y),
+                               (end_x - min_x, end_y - min_y))
+        if len(detour) == 0:
+            self.path = []
+            return self.path
+        self.path = [(y + min_y, x + min_x) for (y, x) in detour] + self.path[rejoin + 1:]
+        return self.path
+
+    def get_flow_path(self, flow_field, array):
+        """Generates the first step of a path between the current location and destination location of the person,
+        using a flow field precomputed for the destination by the office. The path is empty if the step is blocked in
+        the array, in which case a full path must be generated with get_path."""
+        next_location = tuple(int(value) for value in flow_field[self.current_location])
+        if next_location[0] < 0 or array[next_location] <= 0:
+            return []
+        # Return path in the same (column, row) format as get_path
+        return [(self.current_location[1], self.current_location[0]), (next_location[1], next_location[0])]
+
     def move(self, path):
         """"Move person along their path"""
         self.current_location = (path[1][1], path[1][0])
@@ -0,0 +1,114 @@
+"""
+
+population.py
+
+This script contains a class that stores everyone in the office as columns of numpy arrays, so that the properties of
+all people can be checked and updated at once rather than person by person.
+
+Used by simulation.py, transmission.py and snapshot.py.
+"""
+
+# External modules
+import numpy as np
+
+# Directory modules
+from covidsim.person import Person, A_STAR
+
+# Columns of the arrays of a population, which hold everything about people that changes during a simulation
+COLUMNS = ['age', 'mask', 'social_distancing', 'infected', 'infected_time', 'contagious', 'infector_ID',
+           'desk_locations', 'task_locations', 'current_locations', 'task_duration', 'task_progress']
+
+
+class Population:
+    """A population stores the constant and variable attributes of people as numpy arrays, where the row of each person
+    is their ID - 1. It:
+
+        1. Assigns personal properties
+
+            Age, mask wearing and social distancing are assigned randomly based on simulation inputs, and each person is
+            given their own desk at which they start the simulation. The random number streams of the simulation are
+            stored with the population, for use as people move and interact.
+
+        2. Provides person views
+
+            The population behaves like a dictionary of Person objects keyed by ID. Each Person reads and writes their
+            own row of the arrays, so code that handles one person at a time keeps working alongside code that updates
+            whole columns at once.
+
+    """
+
+    def __init__(self, params, desks, streams):
+        """Initialise the properties of everyone in the office based on simulation inputs, drawing random properties
+        from the population stream of a RandomStreams"""
+        number_of_people = params['Number of People']
+        self.IDs = np.arange(1, number_of_people + 1)
+        self.streams = streams
+        rng = streams.population
+        # Pathfinder used by people to find paths (see person.py)
+        self.pathfinder = params.get('Pathfinder', A_STAR)
+
+        # Personal properties
+        self.age = rng.integers(params['Minimum Age'], params['Maximum Age'], size=number_of_people, endpoint=True)
+        self.mask = rng.random(number_of_people) < params['Mask Adherence'] / 100
+        self.social_distancing = rng.random(number_of_people) < params['Social Distancing Adherence'] / 100
+        self.infected = np.zeros(number_of_people, bool)
+        self.infected_time = np.zeros(number_of_people, int)
+        self.contagious = np.zeros(number_of_people, bool)
+
+        # Transmission tree properties (0 if not infected by anyone)
+        self.infector_ID = np.zeros(number_of_people, int)
+
+        # Position properties
+        self.desk_locations = np.array(desks[:number_of_people], int).reshape(-1, 2)  # assign desk coordinates by ID
+        self.task_locations = self.desk_locations.copy()  # Initialise people at their desks
+        self.current_locations = self.desk_locations.copy()
+
+        # Task properties, where people stay at their desk for a random duration initially
+        self.task_duration = rng.integers(1, 50, size=number_of_people, endpoint=True)
+        self.task_progress = np.zeros(number_of_people, int)
+
+        # Create a view of each person
+        self.people = {ID: Person(ID, self) for ID in self.IDs.tolist()}
+
+    @classmethod
+    def from_columns(cls, columns, streams, pathfinder=A_STAR):
+        """Returns a population with the arrays of a dictionary of columns keyed by name, e.g. loaded from a snapshot,
+        rather than assigning properties randomly"""
+        people = cls.__new__(cls)
+        people.pathfinder = pathfinder
+        for column in COLUMNS:
+            setattr(people, column, np.array(columns[column]))
+        people.IDs = np.arange(1, len(people.age) + 1)
+        people.streams = streams
+        people.people = {ID: Person(ID, people) for ID in people.IDs.tolist()}
+        return people
+
+    def __getitem__(self, ID):
+        return self.people[ID]
+
+    def __iter__(self):
+        return iter(self.people)
+
+    def __len__(self):
+        return len(self.people)
+
+    def keys(self):
+        return self.people.keys()
+
+    def values(self):
+        return self.people.values()
+
+    def items(self):
+        return self.people.items()
+
+    def at_task(self):
+        """Returns whether each person is at their task location"""
+        return (self.current_locations == self.task_locations).all(axis=1)
+
+    def get_total_infected(self):
+        """Returns the number of infected people"""
+        return int(np.count_nonzero(self.infected))
+
+    def get_total_contagious(self):
+        """Returns the number of contagious people"""
+        return int(np.count_nonzero(self.contagious))
@@ -0,0 +1,154 @@
+"""
+
+scheduler.py
+
+This script contains a class that steps a simulation in an event-driven way. Most people spend most of the simulation
+sitting at their desk or doing a task, and nothing about them changes until their task is complete. Rather than check
+every person in every time step, the scheduler keeps a priority queue of the time step at which each person doing a
+task next needs to move, so that only people moving between tasks and people finishing a task are processed.
+
+Interactions between people who have not moved are unchanged, so only the interactions around the people who moved are
+found again, and the interactions of everyone else are carried over from the previous time step. Likewise, the social
+distancing array of the office is updated around people as they move, so it is not rebuilt in every time step. Once
+nobody is moving and nobody could be infected, nothing can change until the next person completes their task, so
+run_simulation skips straight to that time step, recording every idle time step in between at once.
+
+Most of the time of a simulation goes on searching for paths, and most searches fail when people block every way to a
+task, e.g. by standing in a corridor, after searching every cell they can reach. People are stalled until the way is
+clear, so event-driven simulations check whether a path could exist before searching for one (see
+Office.is_reachable), and stalled people move aside without searching.
+
+An event-driven simulation gives identical results to a simulation stepped by step_people in simulation.py, as people
+are moved in the same order and random numbers are drawn in the same order.
+
+Used by simulation.py.
+"""
+
+# External modules
+import heapq
+import numpy as np
+
+# Directory modules
+from covidsim.office import sort_interactions
+import covidsim.simulation as simulation
+import covidsim.transmission as transmission
+
+# Interactions are found for everyone rather than only around the people who moved once more than 1 in this many
+# people moved, as it is then quicker
+MOVER_FRACTION = 4
+
+
+class EventScheduler:
+    """Steps the people of an office by processing only the people who are moving between tasks or whose task is
+    complete. The time step at which each person doing a task completes it is kept in a priority queue, and people
+    moving between tasks are kept in a set until they reach their task.
+
+    The task progress of people doing a task is not counted up in each time step. It is brought up to date when they
+    complete their task, or for everyone by update_task_progress.
+
+    """
+
+    def __init__(self, people, time=0):
+        """Schedule the people of a population from their current tasks, at the start of a time step"""
+        at_task = people.at_task()
+        # Time steps at which people doing a task will complete it, as a heap of (time step, ID)
+        remaining = np.maximum(people.task_duration - people.task_progress, 0)
+        self.wake_ups = [(time + int(ticks), ID) for ID, ticks in zip(people.IDs[at_task].tolist(),
+                                                                         remaining[at_task].tolist())]
+        heapq.heapify(self.wake_ups)
+        # People moving between tasks
+        self.moving = set(people.IDs[~at_task].tolist())
+        # Interactions of the previous time step, and whether any of them could infect someone
+        self.interactions = np.zeros((0, 3))
+        self.contagious = False
+        self.started = False
+
+    def get_next_event(self):
+        """Returns the next time step at which someone completes their task, or None if nobody is doing a task"""
+        return self.wake_ups[0][0] if self.wake_ups else None
+
+    def get_idle_ticks(self, time, end):
+        """Returns the number of time steps from a time step, up to an end time step, in which nothing can change"""
+        if not self.is_idle(time):
+            return 0
+        next_event = self.get_next_event()
+        return (end if next_event is None else min(next_event, end)) - time
+
+    def is_idle(self, time):
+        """Returns whether nothing can change in a time step: nobody is moving or completes their task, and none of
+        the interactions carried over could infect anyone"""
+        next_event = self.get_next_event()
+        return (self.started and not self.moving and not self.contagious
+                and (next_event is None or next_event > time))
+
+    def update_task_progress(self, people, time):
+        """Bring the task progress of people doing a task up to date, at the start of a time step"""
+        for wake_up, ID in self.wake_ups:
+            people.task_progress[ID - 1] = people.task_duration[ID - 1] - (wake_up - time)
+
+    def step(self, params, office, people, time, ticks=1):
+        """Advance the people of an office by one time step, in the same way as simulation.step_people, or by a number
+        of time steps in which nothing can change (see get_idle_ticks). The interactions of the time step are stored
+        in the office, and infection events are added to the office."""
+        instrumentation = office.instrumentation
+        if self.is_idle(time):
+            office.interactions = self.interactions
+            instrumentation.count('Interactions', ticks * len(office.interactions))
+            return
+        # People who complete their task start moving, along with people already moving, in order of ID
+        completing = []
+        while self.wake_ups and self.wake_ups[0][0] <= time:
+            completing.append(heapq.heappop(self.wake_ups)[1])
+        movers = sorted(self.moving.union(completing))
+        instrumentation.lap('Tasks')
+        # The social distancing array is kept up to date as people move, so it is only built in the first time step
+        if not self.started:
+            office.build_social_distancing_array()
+            instrumentation.lap('Social Distancing')
+        if movers:
+            completing = set(completing)
+            for person in movers:
+                if person in completing:  # task complete, find new task and start moving
+                    people.task_progress[person - 1] = people.task_duration[person - 1]
+                    simulation.start_moving(people[person], office)
+                else:  # between tasks, keep moving
+                    simulation.update_location(people[person], office)
+            # People who reach their task complete it after its duration
+            for person in movers:
+                if people[person].current_location == people[person].task_location:
+                    self.moving.discard(person)
+                    heapq.heappush(self.wake_ups, (time + 1 + int(people.task_duration[person - 1]), person))
+                else:
+                    self.moving.add(person)
+            instrumentation.lap('Movement')
+
+        # Find interactions again around people who moved, keeping the interactions between everyone else
+        if movers or not self.started:
+            self.interactions = self.find_interactions(office, people, movers)
+            self.started = True
+        office.interactions = self.interactions
+        instrumentation.count('Interactions', len(office.interactions))
+        instrumentation.lap('Interactions')
+
+        was_infected = people.infected.copy()
+        transmission.step_transmission(people, office.interactions, params['Virality'])
+        # record infections in this time step with their infectors
+        for ID in people.IDs[people.infected & ~was_infected].tolist():
+            office.infection_events.append([time + 1, ID, int(people.infector_ID[ID - 1])])
+            instrumentation.count('Infections')
+        # Interactions that could not infect anyone now will not be able to until someone moves, as the infected are
+        # never contagious during a simulation
+        self.contagious = (len(self.interactions) > 0
+                           and len(transmission.get_contagious_interactions(people, self.interactions)) > 0)
+
+    def find_interactions(self, office, people, movers):
+        """Returns the interactions of everyone in the office, finding only those of the people who moved, or everyone
+        in the first time step or if most people moved"""
+        if not self.started or len(movers) * MOVER_FRACTION >= len(people):
+            return office.find_all_interactions(office.pathfinding_array, people.current_locations)
+        moved = np.zeros(len(people) + 1, bool)  # indexed by ID
+        moved[movers] = True
+        kept = self.interactions[~(moved[-self.interactions[:, 0].astype(int)]
+                                   | moved[-self.interactions[:, 1].astype(int)])]
+        found = office.find_interactions_near(office.pathfinding_array, people.current_locations[np.array(movers) - 1])
+        return sort_interactions(np.concatenate((kept, found)))
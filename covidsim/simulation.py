@@ -30,34 +30,63 @@ NOTE: external modules must be installed.
 """
 
 # External modules
-import itertools
-import random
-import matplotlib.pyplot as plt
+import functools
 import sys
 import numpy as np
-import imageio
-import os
-import shutil
-from joblib import Parallel, delayed
 
 # Directory modules
-from covidsim.person import Person
+from covidsim.population import Population
+from covidsim.person import ZONE_GRAPH
+from covidsim.streams import RandomStreams
 from covidsim.office import Office
+from covidsim.floorplan import load_floorplan
+from covidsim.generator import generate_floorplan, OPEN_PLAN
+from covidsim.frames import StateRecorder, STATE_COLOURS, get_states
+from covidsim.contacts import ContactStore
+from covidsim.export import FrameExporter, PlotRenderer
+import covidsim.scheduler as scheduler
 import covidsim.transmission as transmission
+import covidsim.metrics as metrics
 import covidsim.track_and_trace as track_and_trace
 
 
-def main(parameters):
-    """Entry point from GUI or command line interface"""
-    check_inputs(parameters)  # Validate inputs o.k.
-    selected_office = Office(parameters['Office Plan'])  # initialise office space
-    selected_people = instantiate_people(parameters, selected_office)  # initialise people in office space
-    display_frames = run_simulation(parameters, selected_office, selected_people)  # run the simulation
+def main(parameters, exporter=None, headless=False, instrumentation=None, frame_directory=None, event_driven=False,
+         checkpoint=None):
+    """Entry point from GUI or command line interface. Frames are added to an exporter as they are produced, if given.
+
+    If headless is True, no display frames are built and no progress bar or track and trace tree is printed, and a
+    dictionary of metrics (see metrics.py) is returned instead of the display frames. If an Instrumentation is given,
+    the timings and counts of the simulation are recorded in it. If a frame directory is given, the display frames are
+    recorded to a frame store in it as the simulation runs (see frames.py), rather than in memory. If event_driven is
+    True, only people who are moving or have completed their task are processed in each time step (see scheduler.py).
+    If a Checkpoint is given, snapshots of the simulation are saved as it runs (see snapshot.py).
+
+    """
+    check_inputs(parameters, quiet=headless)  # Validate inputs o.k.
+    selected_office = Office(get_floorplan(parameters))  # initialise office space
+    streams = RandomStreams(parameters.get('Seed'))  # seed random numbers, from fresh entropy if no seed is given
+    selected_people = instantiate_people(parameters, selected_office, streams)  # initialise people in office space
+    display_frames = run_simulation(parameters, selected_office, selected_people, display=not headless,
+                                    exporter=exporter, instrumentation=instrumentation,
+                                    frame_directory=frame_directory, event_driven=event_driven,
+                                    checkpoint=checkpoint)  # run the simulation
+    if headless:
+        return metrics.get_metrics(parameters, selected_office, selected_people)
     return display_frames
 
 
-def check_inputs(parameters):
-    """Inputs are checked to exist in the right format, as a dictionary of integers within pre-specified ranges"""
+# Office plan of generated offices, whose size, layout (0 open plan or 1 cellular) and seed are given by parameters
+GENERATED_OFFICE_PLAN = 4
+GENERATED_OFFICE_PARAMETERS = ['Office Rows', 'Office Columns', 'Office Layout', 'Office Seed']
+# Parameters that do not need to be included in inputs
+OPTIONAL_PARAMETERS = ['Seed', 'Pathfinder'] + GENERATED_OFFICE_PARAMETERS
+# Floorplans of generated offices, keyed by their parameters
+generated_floorplans = {}
+
+
+def check_inputs(parameters, quiet=False):
+    """Inputs are checked to exist in the right format, as a dictionary of integers within pre-specified ranges. Only
+    errors are printed if quiet is True, e.g. for headless runs"""
     # Check excel file exists
     try:
         file = open('office_array.xls')
@@ -75,18 +104,25 @@ def check_inputs(parameters):
         raise SystemExit
 
     # Load expected parameters for subsequent checks based on number of desks on floor, which must be an integer
-    if type(parameters['Office Plan']) == int and 0 <= parameters['Office Plan'] <=3:
+    if type(parameters['Office Plan']) == int and 0 <= parameters['Office Plan'] <= GENERATED_OFFICE_PLAN:
+        check_generated_office(parameters)
         expected_parameters = get_expected_parameters(parameters)
     else:
-        print('Error: ', 'Office Plan', ' must be an integer and between 0 and 3.')
+        print('Error: ', 'Office Plan', ' must be an integer and between 0 and ' + str(GENERATED_OFFICE_PLAN) + '.')
         print('See README.txt for valid input formatting.')
         raise SystemExit
 
-    # Check right number of input parameters
-    if len(expected_parameters.keys()) != len(parameters.keys()):
+    # Check right number of input parameters, where optional parameters may be left out
+    required_parameters = [name for name in expected_parameters if name not in OPTIONAL_PARAMETERS]
+    if not len(required_parameters) <= len(parameters.keys()) <= len(expected_parameters.keys()):
         print('Error: incorrect number of input parameters.')
         print('See README.txt for valid input formatting.')
         raise SystemExit
+    for parameter in required_parameters:
+        if parameter not in parameters.keys():
+            print('Error: ', parameter, ' must be included as a variable.')
+            print('See README.txt for valid input formatting.')
+            raise SystemExit
 
     # Check number of parameters and individual keys match expected dictionary, and that values are within range
     for parameter in parameters:
@@ -113,7 +149,40 @@ def check_inputs(parameters):
         print('See README.txt for valid input formatting.')
         raise SystemExit
 
-    print('Inputs validated')
+    if not quiet:
+        print('Inputs validated')
+
+
+def check_generated_office(parameters):
+    """The size of generated offices is checked before the office is generated to count its desks"""
+    if parameters['Office Plan'] != GENERATED_OFFICE_PLAN:
+        return
+    limits = {'Office Rows': [16, 1000], 'Office Columns': [16, 1000]}
+    for parameter, (minimum, maximum) in limits.items():
+        if parameter not in parameters.keys():
+            print('Error: ', parameter, ' must be included as a variable for generated offices.')
+            print('See README.txt for valid input formatting.')
+            raise SystemExit
+        if type(parameters[parameter]) != int or not minimum <= parameters[parameter] <= maximum:
+            print('Error: ', parameter, 'must be an integer between', minimum, 'and', maximum)
+            print('See README.txt for valid input formatting.')
+            raise SystemExit
+    if parameters.get('Office Layout', 0) not in [0, 1]:
+        print('Error: ', 'Office Layout', 'must be 0 (open plan) or 1 (cellular)')
+        print('See README.txt for valid input formatting.')
+        raise SystemExit
+    seed = parameters.get('Office Seed', 0)
+    if type(seed) != int or not 0 <= seed <= 2 ** 32 - 1:
+        print('Error: ', 'Office Seed', 'must be an integer between', 0, 'and', 2 ** 32 - 1)
+        print('See README.txt for valid input formatting.')
+        raise SystemExit
+    # Generate the office now, so that an office that cannot be generated is reported as an input error
+    try:
+        get_floorplan(parameters)
+    except ValueError as error:
+        print('Error: ', error)
+        print('See README.txt for valid input formatting.')
+        raise SystemExit
 
 
 def get_expected_parameters(parameters):
@@ -122,46 +191,63 @@ def get_expected_parameters(parameters):
                                'Minimum Age': [16, 120],
                                'Mask Adherence': [0, 100],
                                'Social Distancing Adherence': [0, 100],
-                               'Office Plan': [0, 3],
+                               'Office Plan': [0, GENERATED_OFFICE_PLAN],  # 4 for a generated office
                                'Virality': [0, 100],
                                'Number of People': [1, get_desk_no(parameters)],  # Floor must have enough desks for people
                                'Number of Infected': [1, get_desk_no(parameters)],
-                               'Simulation Duration': [1, 500]}
+                               'Simulation Duration': [1, 5000],  # long simulations are best run event-driven
+                               'Seed': [0, 2 ** 32 - 1],  # Optional, simulations with the same seed are identical
+                               'Pathfinder': [0, 2],  # Optional, 0 A* (default), 1 Jump Point Search, 2 zone graph
+                               'Office Rows': [16, 1000],  # Optional, size, layout and seed of generated offices
+                               'Office Columns': [16, 1000],
+                               'Office Layout': [0, 1],
+                               'Office Seed': [0, 2 ** 32 - 1]}
 
     return expected_parameters
 
 
 def get_desk_no(parameters):
     """Retrieves number of desks that can seat people on the selected office floor"""
-    office = Office(parameters['Office Plan'])
-    desk_no = len(office.desk_locations)
+    floorplan = get_floorplan(parameters)
+    desk_no = floorplan.desk_count
     return desk_no
 
 
-def instantiate_people(params, office):
-    """Create people objects according to input parameters"""
+def get_floorplan(parameters):
+    """Retrieves the floorplan of the selected office floor, generating it (once) if it is a generated office"""
+    if parameters['Office Plan'] != GENERATED_OFFICE_PLAN:
+        return load_floorplan(parameters['Office Plan'])
+    key = (parameters['Office Rows'], parameters['Office Columns'], parameters.get('Office Layout', OPEN_PLAN),
+           parameters.get('Office Seed', 0))
+    if key not in generated_floorplans:
+        generated_floorplans[key] = generate_floorplan(*key)
+    return generated_floorplans[key]
+
+
+def instantiate_people(params, office, streams=None):
+    """Create a population of people according to input parameters, using the random streams of the simulation (seeded
+    by the 'Seed' parameter if streams are not given)"""
+    if streams is None:
+        streams = RandomStreams(params.get('Seed'))
     number_of_people = params['Number of People']
-    # Populate a list of people with Person objects each with a unique desk 
-    # location
-    people = {}
+    # Populate the office with people each with a unique desk location
     # Randomise desk order so that desks are not assigned sequentially
-    desks = random.sample(office.desk_locations, k=len(office.desk_locations))
-    for ID in range(1, number_of_people + 1):
-        people[ID] = Person(ID, desks, params)
+    desks = [office.desk_locations[index] for index in streams.population.permutation(len(office.desk_locations))]
+    people = Population(params, desks, streams)
+    for ID in people:
         # Update dictionary of people locations stored in Office object
         office.people_locations[ID] = people[ID].current_location
         # Set person location in pathfinding array to be not traversable
         set_array_value(people[ID].current_location[0],
                         people[ID].current_location[1],
                         office.pathfinding_array, - ID)
-    infected_IDs = random.sample(range(1, number_of_people + 1), params['Number of Infected'])
+    infected_indices = streams.population.choice(number_of_people, params['Number of Infected'], replace=False)
     # Set people's infected and contagious status
-    for ID in infected_IDs:
-        people[ID].infected = True
-        people[ID].contagious = True
+    people.infected[infected_indices] = True
+    people.contagious[infected_indices] = True
 
-    # Save dict of people to office object
-    office.people = people.copy()
+    # Save population to office object
+    office.people = people
     return people
 
 
@@ -169,18 +255,18 @@ def update_location(person, office):
     """Moves people that are moving between their desk and their next task, attempting to socially distance only if
     possible """
     set_array_value(person.current_location[0], person.current_location[1], office.pathfinding_array, 1)
+    # Remove person's bubble from the social distancing array, so they do not distance from themselves
+    office.update_social_distancing_array(person.current_location, -1)
     if person.social_distancing:
-        # Generate array for pathfinding whilst socially distancing
-        social_dist_array = office.fill_social_distancing_array(person.ID, office.people_locations)
         # Generate path through array
         # NOTE: when path generation fails, it returns an empty list
-        path = person.get_path(social_dist_array)
+        path = find_path(person, office, office.social_dist_array)
         if len(path) > 0:
             # Socially distanced path generation successful, move along path
             person.move(path)
         else:
             # Find path without socially distancing
-            path = person.get_path(office.pathfinding_array)
+            path = find_path(person, office, office.pathfinding_array)
             if len(path) > 0:
                 # Path without socially distancing generation successful, move along path
                 person.move(path)
@@ -190,7 +276,7 @@ def update_location(person, office):
     else:
         # Generate path through array
         # NOTE: when path generation fails, it returns an empty list
-        path = person.get_path(office.pathfinding_array)
+        path = find_path(person, office, office.pathfinding_array)
     if len(path) > 0:
         # Path without socially distancing generation successful, move along path and
         person.move(path)
@@ -202,10 +288,45 @@ def update_location(person, office):
     set_array_value(person.current_location[0],
                     person.current_location[1],
                     office.pathfinding_array, - person.ID)
+    # Add person's bubble at their new location to the social distancing array
+    office.update_social_distancing_array(person.current_location, 1)
     # Store people locations in office object
     office.people_locations[person.ID] = person.current_location
 
 
+def find_path(person, office, array):
+    """Generates a path for a person through an array. The planned path of the person is reused while its next cell is
+    clear, and repaired locally when it is blocked. Otherwise the person steps along the flow field of the office
+    towards their task, only searching for a full path when people block the way"""
+    # Follow planned path
+    path = person.get_cached_path(array)
+    if len(path) > 0:
+        office.path_counts['Cache hits'] += 1
+        return path
+    # Planned path is blocked, attempt to detour around blockage
+    if len(person.path) > 0:
+        path = office.instrumentation.time_search(person.repair_path, array, 'Repair')
+        if len(path) > 0:
+            office.path_counts['Repairs'] += 1
+            return path
+    # No planned path, step along flow field
+    path = person.get_flow_path(office.get_flow_field(person.task_location), array)
+    if len(path) > 0:
+        office.path_counts['Flow steps'] += 1
+        return path
+    # Flow field step is blocked, search for a path around people and plan to follow it, unless people are blocking
+    # every way to the task, when the search would fail after searching everywhere it can reach
+    if office.skip_unreachable and person.population.pathfinder != ZONE_GRAPH and not office.is_reachable(
+            array, person.current_location, person.task_location):
+        office.instrumentation.count('Skipped Searches')
+        person.path = []
+        return person.path
+    path = office.instrumentation.time_search(functools.partial(office.get_path, person), array)
+    person.path = path
+    office.path_counts['Replans'] += 1
+    return path
+
+
 def input2disp(array):
     """Processes input array based on input excel file array"""
     display_array = np.zeros((array.shape[0], array.shape[1], 3), int)
@@ -219,14 +340,8 @@ def path2disp(array, people):
     """Processes input array based on pathfinding array (people in office space without desks and tasks)"""
     display_array = input2disp(array)
 
-    for person in people:
-
-        if people[person].contagious:
-            display_array[people[person].current_location] = [177, 0, 30]  # red = contagious
-        elif people[person].infected:
-            display_array[people[person].current_location] = [237, 71, 5] # orange = infected
-        else:
-            display_array[people[person].current_location] = [22, 152, 66]  # green = healthy
+    # Colour people red if contagious, orange if infected and green if healthy
+    display_array[people.current_locations[:, 0], people.current_locations[:, 1]] = STATE_COLOURS[get_states(people)]
     return display_array
 
 
@@ -239,13 +354,14 @@ def start_moving(person, office):
     """Assign a task to a person and start moving"""
     person.task_progress = 0
     # Assign a task
-    person.get_task(office.task_locations)
+    office.assign_task(person)
     # Begin movement along path
     update_location(person, office)
 
 
 def move_somewhere(person, office):
     """Move person somewhere adjacent to avoid blockages in narrow spaces"""
+    office.instrumentation.count('Move Somewhere Fallbacks')
     # Get available, adjacent cells that can be moved into i.e. not a wall or another person
     avail_cells = office.adj_finder(office.pathfinding_array,
                                     person.current_location)
@@ -254,18 +370,15 @@ def move_somewhere(person, office):
                     person.current_location[1],
                     office.pathfinding_array, 1)
     # Move person to an available cell
-    person.current_location = avail_cells[random.randint(0, len(avail_cells) - 1)]
-
-
-def record_interactions(office, people):
-    """Checks for interactions in the office and stores them to simulate transmissions"""
-    interactions = []
-    # Detect interactions between people
-    for person in people:
-        interactions.extend(office.find_interactions(office.pathfinding_array, people[person].current_location))
-    # Remove duplicate interactions
-    interactions.sort()
-    interactions = list(interactions for interactions, _ in itertools.groupby(interactions))
+    person.current_location = avail_cells[person.population.streams.movement.integers(len(avail_cells))]
+
+
+def record_interactions(office, people, present=None):
+    """Checks for interactions in the office and stores them to simulate transmissions. If a boolean array of the
+    people present in the office is given, only their interactions are checked"""
+    locations = people.current_locations if present is None else people.current_locations[present]
+    # Detect interactions between everyone in the office at once
+    interactions = office.find_all_interactions(office.pathfinding_array, locations)
     return interactions
 
 
@@ -274,38 +387,13 @@ def save_plot(frame, timestamp):
     Export plot as .png to ./Plots folder. Takes inputs of a 3D numpy array for
     each frame and an integer timestamp for that frame.
 
+    The frame is plotted with matplotlib on a figure of its own rather than the
+    global pyplot figure, so plots can be saved from parallel processes. This is
+    slower than the raster frames of an animation, but gives publication quality
+    stills.
+
     """
-    # Get number of people who are infected or contagious based on number of 
-    # array cells in red and orange
-    infected_no = np.count_nonzero(frame == 177) + np.count_nonzero(frame == 237)
-    # Add number of healthy people to infected and contagious people to get 
-    # total population.
-    # This is necessary as the simulation only outputs display frames without
-    # explicit infection data
-    people_no = infected_no + np.count_nonzero(frame == 22)
-    plt.imshow(frame)
-    plt.axis('off')
-    # Set title to show timestamp and number of people infected/ total population
-    plt.title('Time: ' + str(timestamp) 
-               +'          Number of Infected: ' 
-               + str(infected_no) 
-               + '/' + str(people_no))
-    plt.savefig('./Plots/' + str(timestamp))
-    
-    
-def save_animation():
-    """Generate simulation gif from output files"""
-    # Store plot paths in list in chronological order
-    num_files = len([name for name in os.listdir('./Plots') if os.path.isfile(os.path.join('./Plots', name))])
-    files = ['./Plots/' + str(f) + '.png' for f in range(num_files)]
-    # Generate and save gif
-    with imageio.get_writer('./Plots/animation.gif', mode='I') as writer:
-        for filename in files:
-            image = imageio.imread(filename)
-            writer.append_data(image)
-    # Print output location in command window
-    output_path = os.path.dirname(os.path.realpath('./Plots/animation.gif'))
-    print('Plots and animation saved to ' + output_path)
+    PlotRenderer().save(frame, timestamp, './Plots/' + str(timestamp))
 
 
 def progress_setup():
@@ -328,61 +416,148 @@ def progress_update(it, duration, next_bar):
     return next_bar
 
 
-def save_outputs(display_frames):
-    """Save plots and create simulation gif"""
-    print('Saving plots...')
-    # Delete existing plots and simulation gif
-    if os.path.exists('./Plots'):
-        shutil.rmtree('./Plots')
-    os.mkdir('./Plots')
-    # Save plots in parallel using number of cpu cores - 2
-    Parallel(n_jobs=os.cpu_count() - 2)(delayed(save_plot)(display_frames[i], i) for i in range(len(display_frames)))
-    # Generate simulation gif
-    save_animation()
+def save_outputs(display_frames, save_plots=False, file_name='animation.gif', progress=None):
+    """Save simulation animation (.gif or .mp4) and optionally plots, streaming each frame into the animation. If a
+    progress function is given, it is called with the number of frames saved and the total after each frame."""
+    print('Saving animation...')
+    with FrameExporter(file_name=file_name, save_plots=save_plots) as exporter:
+        for timestamp, frame in enumerate(display_frames):
+            exporter.add(frame, timestamp)
+            if progress is not None:
+                progress(timestamp + 1, len(display_frames))
+
 
+def step_people(params, office, people, time, present=None):
+    """Advance the people of an office by one time step: everyone progresses their task, or finishes it and starts
+    moving towards their next task, or carries on moving, and then interactions and transmission are found.
 
-def run_simulation(params, office, people):
+    The interactions of the time step are stored in the office, and a [tick, ID, infector ID] event is added to the
+    infection events of the office for each infection. If a boolean array of the people present in the office is
+    given, everyone else is left as they are e.g. while they are on another floor of a building (see building.py).
+
+    """
+    instrumentation = office.instrumentation
+    # Rebuild social distancing array for this time step
+    office.build_social_distancing_array()
+    instrumentation.lap('Social Distancing')
+    # People with an incomplete task keep doing their task
+    at_task = people.at_task()
+    doing_task = at_task & (people.task_progress < people.task_duration)
+    moving = ~doing_task
+    if present is not None:
+        doing_task &= present
+        moving &= present
+    people.task_progress[doing_task] += 1
+    instrumentation.lap('Tasks')
+    for person in people.IDs[moving].tolist():  # move people as necessary
+        if at_task[person - 1]:  # task complete, find new task and start moving
+            start_moving(people[person], office)
+
+        else:  # between tasks, keep moving
+            update_location(people[person], office)
+    instrumentation.lap('Movement')
+
+    # record interactions
+    office.interactions = record_interactions(office, people, present)
+    instrumentation.count('Interactions', len(office.interactions))
+    instrumentation.lap('Interactions')
+
+    was_infected = people.infected.copy()
+    transmission.step_transmission(people, office.interactions, params['Virality'])  # TRANSMISSION - ALEX
+    # record infections in this time step with their infectors
+    for ID in people.IDs[people.infected & ~was_infected].tolist():
+        office.infection_events.append([time + 1, ID, int(people.infector_ID[ID - 1])])
+        instrumentation.count('Infections')
+
+
+def run_simulation(params, office, people, display=True, exporter=None, instrumentation=None, frame_directory=None,
+                   event_driven=False, checkpoint=None, resume=False):
     """Core sequence of logic of the simulation. Formatted to record results in 'frames' for each time step.
 
     In each time step, everyone will progress a task, finish a task and move towards another task, or carry on moving
     between tasks. If they come into contact with each other they will potentially transmit coronavirus.
 
+    The number of infected and contagious people and of interactions at each time step are recorded in the office,
+    along with a [tick, ID, infector ID] event for each infection and every contact in a ContactStore (see
+    contacts.py). If display is False, no progress bar, track and trace tree or display frames are output and None is
+    returned, e.g. for batches of runs. If an exporter is given, each display frame is added to it as soon as it is
+    recorded. If an Instrumentation is given, the time of each phase of each time step and counts of path searches,
+    interactions and infections are recorded in it (see instrumentation.py). If a frame directory is given, display
+    frames are recorded to a frame store in it rather than in memory. If event_driven is True, people are stepped by an
+    EventScheduler, which gives identical results faster: time steps in which nothing can change are skipped and
+    recorded all at once, and paths are not searched for when people block every way to a task.
+
+    If a Checkpoint is given, a snapshot of the simulation is saved whenever it is due (see snapshot.py). If resume is
+    True, the simulation carries on from the time step after the last one recorded in the office, e.g. when it has
+    been loaded from a snapshot, keeping what has been recorded so far. Display frames are recorded only for the time
+    steps that are run.
+
     """
 
-    # Initialise lists to record results
+    # Initialise lists to record results, unless carrying on from the time steps already recorded
     sim_duration = params['Simulation Duration']
+    if not resume:
+        office.contacts = ContactStore(len(people))
+        office.infected_counts = []
+        office.contagious_counts = []
+        office.interaction_counts = []
+        office.infection_events = []
+    start = len(office.infected_counts)
     # used to store locations for each time tick, for running through in GUI
-    display_frames = []
-    office.interaction_frames = []
-    # Initiate progress bar
-    next_bar = progress_setup()
+    if display:
+        recorder = StateRecorder(input2disp(office.input_array), len(people), sim_duration - start, frame_directory)
+        # Initiate progress bar
+        next_bar = progress_setup()
+    if instrumentation is not None:
+        office.instrumentation = instrumentation
+    instrumentation = office.instrumentation
+    office.skip_unreachable = event_driven
+    event_scheduler = scheduler.EventScheduler(people, start) if event_driven else None
     # For each time step, perform actions for each person in office
-    for time in range(sim_duration):
-        for person in people:  # move people as necessary
-            if people[person].current_location == people[person].task_location:
-                if people[person].task_progress < people[person].task_duration:  # task incomplete, keep doing task
-                    people[person].task_progress += 1
-
-                else:  # task complete, find new task and start moving
-                    start_moving(people[person], office)
-
-            else:  # between tasks, keep moving
-                update_location(people[person], office)
-
-        # record interactions
-        office.interactions = record_interactions(office, people)
-        office.interaction_frames.append(office.interactions)  
-
-        transmission.step_transmission(people, office.interactions, params['Virality'])  # TRANSMISSION - ALEX
-        display_frame = path2disp(office.input_array.copy(), people)
-        # record people locations in office as numpy array
-        display_frames.append(display_frame.copy())  
-        # Update progress bar
-        next_bar = progress_update(time, sim_duration, next_bar)
+    time = start
+    while time < sim_duration:
+        instrumentation.start_tick()
+        if event_scheduler is None:
+            ticks = 1
+            step_people(params, office, people, time)
+        else:
+            # Skip straight past time steps in which nothing can change, up to the next snapshot if one is due sooner
+            end = sim_duration if checkpoint is None else checkpoint.get_next_due(time, sim_duration)
+            ticks = max(event_scheduler.get_idle_ticks(time, end), 1)
+            event_scheduler.step(params, office, people, time, ticks)
+        office.contacts.add(time + 1, office.interactions, ticks)
+        # record number of infected and contagious people, and of interactions
+        office.interaction_counts += [len(office.interactions)] * ticks
+        office.infected_counts += [people.get_total_infected()] * ticks
+        office.contagious_counts += [people.get_total_contagious()] * ticks
+        instrumentation.lap('Transmission')
+        if display:
+            # record people locations and health states in office
+            recorder.record(people, ticks)
+            # Update progress bar
+            next_bar = progress_update(time + ticks - 1 - start, sim_duration - start, next_bar)
+            instrumentation.lap('Recording')
+            if exporter is not None:
+                for tick in range(time, time + ticks):
+                    exporter.add(recorder.get_frames()[tick - start], tick)
+                instrumentation.lap('Export')
+        instrumentation.end_tick(time, ticks)
+        time += ticks
+        if checkpoint is not None and checkpoint.is_due(time, sim_duration):
+            # Bring the task progress of people skipped by the scheduler up to date before saving it
+            if event_scheduler is not None:
+                event_scheduler.update_task_progress(people, time)
+            checkpoint.save(params, office, people)
+    if event_scheduler is not None:
+        event_scheduler.update_task_progress(people, sim_duration)
+    office.contacts.compact()
+    if not display:
+        return None
     # Print completion message
     sys.stdout.write("\nDone \n")
     # Print track and trace tree diagram
     track_and_trace.track_and_trace(people)
-    # Save display_frames to office object
-    office.display_frames = display_frames.copy()
+    # Save display_frames, rendered from the records when accessed, to office object
+    display_frames = recorder.get_frames()
+    office.display_frames = display_frames
     return display_frames
@@ -0,0 +1,187 @@
+"""
+
+snapshot.py
+
+This script contains functions that save the full state of a simulation part way through to a snapshot file, and load
+it again, so that a simulation can be resumed after a crash, or several scenarios can be forked from a shared warm-up
+rather than each repeating it from the start.
+
+A snapshot is a compressed .npz file holding:
+
+    1. The population             # every column of the population arrays, and the planned path of each person
+    2. The office                 # the floorplan and the pathfinding array, with the locations of people
+    3. The random streams         # the state of the population, movement and transmission generators
+    4. The history                # the time series, contacts and infection events of every time step run so far
+
+along with the parameters of the simulation, the number of time steps run and the version of the snapshot format.
+Everything else, such as flow fields and the social distancing array, is rebuilt from these as it is needed. A
+simulation resumed from a snapshot gives identical results to one run without stopping, and scenarios forked from a
+snapshot share its random number streams, so they differ only by the parameters changed.
+
+Used by run_covid_simulation.py.
+"""
+
+# External modules
+import json
+import os
+import numpy as np
+from joblib import Parallel, delayed
+
+# Directory modules
+from covidsim.office import Office
+from covidsim.floorplan import Floorplan
+from covidsim.population import Population, COLUMNS
+from covidsim.person import A_STAR
+from covidsim.streams import RandomStreams
+from covidsim.contacts import ContactStore
+import covidsim.simulation as simulation
+import covidsim.metrics as metrics
+
+# Version of the snapshot format, which is increased whenever the contents of snapshots change
+SNAPSHOT_VERSION = 2
+STREAMS = ['population', 'movement', 'transmission']
+# Parameters that only take effect as the simulation runs, and so may be changed when forking from a snapshot
+FORK_PARAMETERS = ['Virality', 'Simulation Duration']
+
+
+def snapshot_error(message):
+    """Print a snapshot error and exit"""
+    print('Error:', message)
+    print('See README.txt for valid input formatting.')
+    raise SystemExit
+
+
+class Checkpoint:
+    """Saves a snapshot of a simulation to a file every interval time steps and at the end of the simulation,
+    replacing the previous snapshot"""
+
+    def __init__(self, file_name, interval):
+        """Initialise a checkpoint saving to a .npz file"""
+        self.file_name = file_name
+        self.interval = interval
+
+    def is_due(self, ticks, duration):
+        """Returns whether a snapshot is due once a number of time steps of a simulation have been run"""
+        return ticks % self.interval == 0 or ticks == duration
+
+    def get_next_due(self, ticks, duration):
+        """Returns the number of time steps of a simulation after which the next snapshot is due, once a number of
+        time steps have been run"""
+        return min((ticks // self.interval + 1) * self.interval, duration)
+
+    def save(self, params, office, people):
+        """Save a snapshot of a simulation"""
+        save_snapshot(self.file_name, params, office, people)
+
+
+def save_snapshot(file_name, params, office, people):
+    """Save the state of a simulation at the end of the last time step recorded in the office to a .npz file. The
+    snapshot is written to a temporary file first, so that a crash while saving leaves the previous snapshot intact."""
+    header = {'Version': SNAPSHOT_VERSION,
+              'Ticks': len(office.infected_counts),
+              'Parameters': dict(params),
+              'Random States': {name: getattr(people.streams, name).bit_generator.state for name in STREAMS},
+              'Path Counts': office.path_counts}
+    paths = [people[ID].path for ID in people]
+    contact_offsets, contact_first, contact_second, contact_distance_codes = office.contacts.get_columns()
+    arrays = {column: getattr(people, column) for column in COLUMNS}
+    arrays.update({'header': np.array(json.dumps(header)),
+                   'path_lengths': np.array([len(path) for path in paths], int),
+                   'path_cells': np.array([cell for path in paths for cell in path], int).reshape(-1, 2),
+                   'floor_grid': office.floor_grid,
+                   'office_desk_locations': np.array(office.desk_locations, int).reshape(-1, 2),
+                   'office_task_locations': np.array(office.task_locations, int).reshape(-1, 2),
+                   'pathfinding_array': office.pathfinding_array,
+                   'infected_counts': np.array(office.infected_counts, int),
+                   'contagious_counts': np.array(office.contagious_counts, int),
+                   'interaction_counts': np.array(office.interaction_counts, int),
+                   'infection_events': np.array(office.infection_events, int).reshape(-1, 3),
+                   'contact_offsets': contact_offsets,
+                   'contact_first': contact_first,
+                   'contact_second': contact_second,
+                   'contact_distance_codes': contact_distance_codes})
+    with open(file_name + '.tmp', 'wb') as file:
+        np.savez_compressed(file, **arrays)
+    os.replace(file_name + '.tmp', file_name)
+
+
+def load_snapshot(file_name):
+    """Returns the parameters, office and people of a simulation saved to a snapshot, ready to be resumed with
+    simulation.run_simulation(..., resume=True)"""
+    if not os.path.exists(file_name):
+        snapshot_error(file_name + ' not found.')
+    with np.load(file_name) as data:
+        header = json.loads(str(data['header']))
+        if header['Version'] != SNAPSHOT_VERSION:
+            snapshot_error('snapshot version ' + str(header['Version']) + ' cannot be loaded, only version '
+                           + str(SNAPSHOT_VERSION) + '.')
+        params = header['Parameters']
+
+        # Restore the random streams, which are seeded from the simulation seed then moved on to their saved state
+        streams = RandomStreams(params.get('Seed'))
+        for name in STREAMS:
+            getattr(streams, name).bit_generator.state = header['Random States'][name]
+
+        # Restore people and their planned paths
+        people = Population.from_columns(data, streams, params.get('Pathfinder', A_STAR))
+        path_cells = [tuple(cell) for cell in data['path_cells'].tolist()]
+        ends = np.cumsum(data['path_lengths']).tolist()
+        for ID, start, end in zip(people, [0] + ends, ends):
+            people[ID].path = path_cells[start:end]
+
+        # Restore the office, with people where they were
+        office = Office(Floorplan(data['floor_grid'], data['office_desk_locations'],
+                                  data['office_task_locations']))
+        office.pathfinding_array = data['pathfinding_array'].copy()
+        office.people_locations = {ID: people[ID].current_location for ID in people}
+        office.people = people
+        office.path_counts = header['Path Counts']
+
+        # Restore the history of the time steps run so far
+        office.infected_counts = data['infected_counts'].tolist()
+        office.contagious_counts = data['contagious_counts'].tolist()
+        office.interaction_counts = data['interaction_counts'].tolist()
+        office.infection_events = data['infection_events'].tolist()
+        office.contacts = ContactStore.from_columns(len(people), data['contact_offsets'], data['contact_first'],
+                                                    data['contact_second'], data['contact_distance_codes'])
+        office.interactions = office.contacts.get_interactions(office.contacts.get_ticks())
+    return params, office, people
+
+
+def check_changes(params, changes, ticks):
+    """Changes to the parameters of a snapshot are checked to only be to parameters that take effect as the
+    simulation runs, and to leave time steps still to run"""
+    for parameter in changes:
+        if parameter not in FORK_PARAMETERS:
+            snapshot_error(str(parameter) + ' cannot be changed from a snapshot, only ' + ', '.join(FORK_PARAMETERS)
+                           + '.')
+    simulation.check_inputs(dict(params, **changes), quiet=True)
+    if dict(params, **changes)['Simulation Duration'] <= ticks:
+        snapshot_error('Simulation Duration must be longer than the ' + str(ticks) + ' time steps of the snapshot.')
+
+
+def resume_simulation(file_name, changes=None, headless=True, event_driven=False, checkpoint=None):
+    """Resume a simulation from a snapshot until the end of its duration, with a dictionary of changes to its
+    parameters if given. Returns a dictionary of metrics of the whole simulation (see metrics.py) if headless is True,
+    otherwise the display frames of the time steps run after the snapshot."""
+    params, office, people = load_snapshot(file_name)
+    changes = changes or {}
+    check_changes(params, changes, len(office.infected_counts))
+    params = dict(params, **changes)
+    display_frames = simulation.run_simulation(params, office, people, display=not headless,
+                                               event_driven=event_driven, checkpoint=checkpoint, resume=True)
+    if headless:
+        return metrics.get_metrics(params, office, people)
+    return display_frames
+
+
+def fork_simulation(file_name, branches, event_driven=False, n_jobs=-1):
+    """Resume a branch of a simulation from a snapshot for each dictionary of changes to its parameters in a list of
+    branches, in parallel using n_jobs processes (all cpu cores by default). Returns a list of the metrics of each
+    branch."""
+    params, office, people = load_snapshot(file_name)
+    # Check every branch before running any of them
+    for changes in branches:
+        check_changes(params, changes, len(office.infected_counts))
+    return Parallel(n_jobs=n_jobs)(delayed(resume_simulation)(file_name, changes, event_driven=event_driven)
+                                   for changes in branches)
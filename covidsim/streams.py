@@ -0,0 +1,37 @@
+"""
+
+streams.py
+
+This script contains a class that creates the random number generators used by a simulation from a single seed, so
+that simulations with the same seed give identical results.
+
+Independent streams are spawned from the seed for setting up the population, for the movement of people and for
+transmission, so that a change to how one of these uses random numbers does not change the others.
+
+Used by simulation.py, ensemble.py and sweep.py.
+"""
+
+# External modules
+import numpy as np
+
+
+class RandomStreams:
+    """Independent numpy random number generators for each part of a simulation, spawned from one seed. The seed may
+    be an integer, a numpy SeedSequence, or None to seed from fresh entropy."""
+
+    def __init__(self, seed=None):
+        """Spawn the random number generators of a simulation from a seed"""
+        if isinstance(seed, np.random.SeedSequence):
+            self.seed_sequence = seed
+        else:
+            self.seed_sequence = np.random.SeedSequence(seed)
+        population_seed, movement_seed, transmission_seed = self.seed_sequence.spawn(3)
+        self.population = np.random.default_rng(population_seed)  # personal properties, desks and initial infections
+        self.movement = np.random.default_rng(movement_seed)  # tasks and moves to avoid blockages
+        self.transmission = np.random.default_rng(transmission_seed)  # infections upon interaction
+
+
+def spawn_seeds(seed, number):
+    """Returns a number of independent seeds spawned from a seed e.g. for replicas of a simulation. The integer seeds
+    returned can be stored and passed to RandomStreams to repeat a replica."""
+    return [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(number)]
@@ -0,0 +1,207 @@
+"""
+
+sweep.py
+
+This script runs sweeps of simulations over grids of input parameters, e.g. every combination of a range of mask and
+social distancing adherences, with several replicas of each point of the grid. Replicas of all points are scheduled
+across parallel processes and each result is appended to an SQLite database as soon as it finishes.
+
+Results already in the database are skipped when a sweep is run again, so a sweep can be interrupted and resumed, or
+extended with new parameter values or more replicas, without repeating any simulations. The seed of each replica
+depends only on its point, its replica number and the root seed of the sweep. If no seed is given, the root seed is
+drawn once from the operating system and stored in the database, so every sweep into it shares the same seeds.
+
+Used by run_covid_simulation.py.
+"""
+
+# External modules
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import sqlite3
+import numpy as np
+from joblib import Parallel, delayed
+
+# Directory modules
+import covidsim.simulation as simulation
+from covidsim.ensemble import run_replica, get_attack_rate
+
+
+def get_sweep_points(params, grid):
+    """Returns a list of parameter dictionaries for every combination of the values in a grid, a dictionary of
+    parameter names and lists (or ranges) of values, with all other parameters taken from params"""
+    names = list(grid.keys())
+    points = []
+    for values in itertools.product(*[list(grid[name]) for name in names]):
+        point = dict(params)
+        point.update(zip(names, [int(value) for value in values]))
+        points.append(point)
+    return points
+
+
+def check_point(point):
+    """Validate the parameters of a sweep point, only printing the result of the checks if they fail"""
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            simulation.check_inputs(point)
+    except SystemExit:
+        print('Invalid sweep point:', point)
+        print(output.getvalue(), end='')
+        raise
+
+
+def get_point_key(point):
+    """Returns a string that uniquely identifies the parameters of a sweep point"""
+    return json.dumps(point, sort_keys=True)
+
+
+def get_seed(point_key, replica, seed):
+    """Returns the integer seed of a replica of a sweep point from the root seed of a sweep, which does not depend on
+    the other points of the sweep"""
+    point_hash = int(hashlib.sha1(point_key.encode()).hexdigest()[:8], 16)
+    return int(np.random.SeedSequence(seed, spawn_key=(point_hash, replica)).generate_state(1)[0])
+
+
+# Columns of the results table other than parameters
+RESULT_COLUMNS = ['point', 'replica', 'seed', 'final_infected', 'attack_rate', 'infected_counts', 'contagious_counts']
+
+
+def get_parameter_columns(point):
+    """Returns the names of the parameters of a sweep point that are stored in columns of their own. Parameters whose
+    names clash with other columns, such as 'Seed', are only stored in the point column, as SQLite column names are
+    not case sensitive"""
+    return sorted(name for name in point.keys() if name.lower() not in RESULT_COLUMNS)
+
+
+def connect(file_name, names):
+    """Connect to a results database, creating the results table with a column for each parameter if it does not
+    exist, and adding columns to it for parameters that earlier sweeps into the database did not have"""
+    database = sqlite3.connect(file_name)
+    parameter_columns = ''.join('"' + name + '" INTEGER, ' for name in names)
+    database.execute('CREATE TABLE IF NOT EXISTS results ('
+                     'point TEXT, replica INTEGER, seed INTEGER, ' + parameter_columns +
+                     'final_infected INTEGER, attack_rate REAL, infected_counts BLOB, contagious_counts BLOB, '
+                     'PRIMARY KEY (point, replica))')
+    # NOTE: SQLite column names are not case sensitive
+    columns = [row[1].lower() for row in database.execute('PRAGMA table_info(results)')]
+    for name in names:
+        if name.lower() not in columns:
+            database.execute('ALTER TABLE results ADD COLUMN "' + name + '" INTEGER')
+    # Settings of the sweeps into the database, such as the root seed
+    database.execute('CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT)')
+    database.commit()
+    return database
+
+
+def get_root_seed(database, seed=None):
+    """Returns the root seed of the sweeps into a database: the seed given, or otherwise entropy drawn from the
+    operating system by the first sweep into the database and stored in it"""
+    if seed is not None:
+        return seed
+    row = database.execute("SELECT value FROM settings WHERE name = 'entropy'").fetchone()
+    if row is None:
+        # NOTE: entropy is a 128 bit integer, which is too large for an SQLite integer
+        row = (str(np.random.SeedSequence().entropy),)
+        database.execute("INSERT INTO settings VALUES ('entropy', ?)", row)
+        database.commit()
+    return int(row[0])
+
+
+def run_point_replica(point, replica, seed):
+    """Run a replica of a sweep point and return its results along with the point and replica"""
+    infected_counts, contagious_counts = run_replica(point, seed)
+    return point, replica, seed, infected_counts, contagious_counts
+
+
+def run_sweep(params, grid, replicas, file_name='sweep_results.db', seed=None, n_jobs=-1):
+    """Run replicas of every point of a parameter grid in parallel using n_jobs processes (all cpu cores by default),
+    appending results to an SQLite database and skipping replicas that are already stored in it. Replicas are seeded
+    from the seed given, or the 'Seed' parameter if no seed is given, or otherwise the root seed stored in the
+    database. Returns the number of replicas run"""
+    if seed is None:
+        seed = params.get('Seed')
+    points = get_sweep_points(params, grid)
+    for point in points:
+        check_point(point)
+    names = get_parameter_columns(points[0] if points else params)
+    database = connect(file_name, names)
+    seed = get_root_seed(database, seed)
+    done = set(database.execute('SELECT point, replica FROM results').fetchall())
+    jobs = []
+    for point in points:
+        point_key = get_point_key(point)
+        for replica in range(replicas):
+            if (point_key, replica) not in done:
+                jobs.append((point, replica, get_seed(point_key, replica, seed)))
+    print('Sweep of', len(points), 'points:', len(jobs), 'replicas to run,', len(points) * replicas - len(jobs),
+          'already stored')
+
+    results = Parallel(n_jobs=n_jobs, return_as='generator_unordered')(delayed(run_point_replica)(*job)
+                                                                       for job in jobs)
+    # Columns are named, as the table may have columns for parameters of other sweeps, which are left empty
+    columns = RESULT_COLUMNS[:3] + ['"' + name + '"' for name in names] + RESULT_COLUMNS[3:]
+    insert = ('INSERT INTO results (' + ', '.join(columns) + ') VALUES (' + ', '.join(['?'] * len(columns)) + ')')
+    try:
+        for point, replica, replica_seed, infected_counts, contagious_counts in results:
+            attack_rate = get_attack_rate(point, int(infected_counts[-1]))
+            database.execute(insert, [get_point_key(point), replica, replica_seed]
+                             + [point[name] for name in names]
+                             + [int(infected_counts[-1]), float(attack_rate),
+                                infected_counts.astype(np.int16).tobytes(),
+                                contagious_counts.astype(np.int16).tobytes()])
+            # Commit each result so that an interrupted sweep keeps every finished replica
+            database.commit()
+    finally:
+        database.close()
+    return len(jobs)
+
+
+def load_results(file_name='sweep_results.db', **conditions):
+    """Returns a list of the stored results of every replica whose parameters match the conditions, given as parameter
+    names with spaces replaced by underscores e.g. load_results(Mask_Adherence=50)"""
+    database = sqlite3.connect(file_name)
+    database.row_factory = sqlite3.Row
+    query = 'SELECT * FROM results'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join('"' + name.replace('_', ' ') + '" = ?' for name in conditions)
+    try:
+        rows = database.execute(query, list(conditions.values())).fetchall()
+    finally:
+        database.close()
+    results = []
+    for row in rows:
+        result = dict(row)
+        result['infected_counts'] = np.frombuffer(row['infected_counts'], np.int16)
+        result['contagious_counts'] = np.frombuffer(row['contagious_counts'], np.int16)
+        results.append(result)
+    return results
+
+
+def summarise_results(file_name='sweep_results.db', points=None):
+    """Returns a list of the parameters of each stored sweep point, with the number of replicas and the mean and
+    variance of their attack rates. If a list of sweep points is given, only those points are summarised, e.g. the
+    points of one sweep of a database shared by sweeps over different parameters"""
+    database = sqlite3.connect(file_name)
+    database.row_factory = sqlite3.Row
+    try:
+        rows = database.execute('SELECT point, COUNT(*) AS replicas, AVG(attack_rate) AS attack_rate_mean, '
+                                'AVG(attack_rate * attack_rate) AS attack_rate_square_mean '
+                                'FROM results GROUP BY point ORDER BY point').fetchall()
+    finally:
+        database.close()
+    keys = None if points is None else set(get_point_key(point) for point in points)
+    summary = []
+    for row in rows:
+        if keys is not None and row['point'] not in keys:
+            continue
+        point = json.loads(row['point'])
+        point['Replicas'] = row['replicas']
+        point['Attack Rate Mean'] = row['attack_rate_mean']
+        # Sample variance of the attack rate, from the means of the attack rate and its square
+        variance = row['attack_rate_square_mean'] - row['attack_rate_mean'] ** 2
+        point['Attack Rate Variance'] = max(variance, 0) * row['replicas'] / max(row['replicas'] - 1, 1)
+        summary.append(point)
+    return summary
@@ -4,92 +4,82 @@ Created on Tues Apr 6 12:25:03 2021
 
 Author: Alex Straw
 Description:
-    This piece of code receives the 'people' object and interactions for a given step.
+    This piece of code receives the 'people' object and interactions for a given step, as an array of
+    [ID, ID, distance] rows, and processes every interaction at once using numpy arrays.
     Contagious interactions where one individual has COVID-19 and the other does not are
     extracted from this data.  Transmission chance is found from mask adherence, distance for
     a given interaction, and virality (acquired via GUI). Where an infection has taken
     place, a person's infection state is set to True.
 """
 
-import random
+import numpy as np
 
 
-def get_type(person_status):
-    """Determine the 'type' of individual --> further explanation within get_contagious_interactions"""
-    if person_status[0] == person_status[1]:
-        if person_status[0]:
-            person_type = 1
-        else:
-            person_type = 3
-    else:
-        person_type = 2
+# Transmission chance factor for the number of people in an interaction wearing a mask (0, 1 or 2)
+MASK_FACTORS = np.array([1, 0.5, 0.1])
 
-    return person_type
+
+def get_types(people):
+    """Determine the 'type' of each individual --> further explanation within get_contagious_interactions"""
+    return np.where(people.infected == people.contagious, np.where(people.infected, 1, 3), 2)
 
 
 def get_contagious_interactions(people, interactions):
     """
-    This function determines contagious interactions from the full list of interactions
-    (plural) for a step
+    This function determines contagious interactions from the full array of interactions
+    (plural) for a step. Returns an array of [infector ID, non infected ID, distance] rows,
+    in the order of the interactions.
     """
-    contagious_interactions = []
-
-    for i in range(0, len(interactions)):
-        person_1_ID = abs(int(interactions[i][0]))  # Acquiring IDs for people involved in interaction 'i' of step
-        person_2_ID = abs(int(interactions[i][1]))  # Question this -1 as unsure if mistake - 06.04.2021 - Alex
-        distance = interactions[i][2]
+    interactions = np.asarray(interactions, float).reshape(-1, 3)
+    person_1_IDs = np.abs(interactions[:, 0]).astype(int)  # Acquiring IDs for people involved in each interaction
+    person_2_IDs = np.abs(interactions[:, 1]).astype(int)
+    distances = interactions[:, 2]
 
-        person_1_type = get_type([people[person_1_ID].infected, people[person_1_ID].contagious])
-        person_2_type = get_type([people[person_2_ID].infected, people[person_2_ID].contagious])
+    types = get_types(people)
+    person_1_types = types[person_1_IDs - 1]
+    person_2_types = types[person_2_IDs - 1]
 
-        #  3 types of individuals:
-        #  Type 1: [infected = True, contagious = True]     --> All initial infected
-        #  Type 2: [infected = True, contagious = False]    --> Those infected during simulation.py
-        #  Type 3: [infected = False, contagious = False]   --> Those not infected
-        #  A contagious interaction is an interaction be    tween a Type 1 and Type 3
+    #  3 types of individuals:
+    #  Type 1: [infected = True, contagious = True]     --> All initial infected
+    #  Type 2: [infected = True, contagious = False]    --> Those infected during simulation.py
+    #  Type 3: [infected = False, contagious = False]   --> Those not infected
+    #  A contagious interaction is an interaction between a Type 1 and Type 3
 
-        # Room for optimisation here
+    person_1_infector = (person_1_types == 1) & (person_2_types == 3)
+    person_2_infector = (person_1_types == 3) & (person_2_types == 1)
+    contagious = person_1_infector | person_2_infector
 
-        if person_1_type == 1 and person_2_type == 3:
-            contagious_interaction_IDs = [person_1_ID, person_2_ID, distance]
-            contagious_interactions.append(contagious_interaction_IDs)
+    infector_IDs = np.where(person_1_infector, person_1_IDs, person_2_IDs)
+    non_infected_IDs = np.where(person_1_infector, person_2_IDs, person_1_IDs)
+    return np.column_stack((infector_IDs, non_infected_IDs, distances))[contagious]
 
-        elif person_1_type == 3 and person_2_type == 1:
-            contagious_interaction_IDs = [person_2_ID, person_1_ID, distance]
-            contagious_interactions.append(contagious_interaction_IDs)
 
-    return contagious_interactions
+def get_distance_factors(distances):
+    """Infection rate is inversely proportional the square of the distance separating two individuals"""
+    distances = np.asarray(distances, float)
+    with np.errstate(divide='ignore'):
+        inverse_square = 1 / (distances ** 2)  # Inverse square law
+    return np.where(distances < 1, 1, np.where(distances > 2, 0.25, inverse_square))
 
 
-def get_transmission_chance(interaction, people, virality):
+def get_transmission_chance(interactions, people, virality):
     """
-    get_transmission_chance calculates the transmission chance for an interaction (singular)
+    get_transmission_chance calculates the transmission chance for each interaction
     based on: mask adherence and the distance between two individuals.
 
-    :param interaction: An array of IDs for two individuals involved in an interaction
-    :param people: People is the full list of individuals in the simulation (Person Class)
+    :param interactions: An array of [ID, ID, distance] rows for the individuals involved in each interaction
+    :param people: People is the population of individuals in the simulation (Population Class)
     :param virality: A factor associated with the 'contagiousness' of the virus (set in GUI)
-    :return: returns A transmission chance --> this is a number between 0 and 1.
+    :return: returns an array of transmission chances --> numbers between 0 and 1.
     """
-    person_1_number = interaction[0]
-    person_2_number = interaction[1]
-    distance = interaction[2]
-
-    if people[person_1_number].mask and people[person_2_number].mask:  # AND GATE (2 MASKS)
-        mask_transmission_chance = 0.1
-    elif people[person_1_number].mask != people[person_2_number].mask:  # XOR GATE (1 MASK)
-        mask_transmission_chance = 0.5
-    else:  # (0 MASKS)
-        mask_transmission_chance = 1
-
-    #  Infection rate is inversely proportional the square of the distance separating two individuals
-
-    if distance < 1:
-        distance_transmission_chance = 1
-    elif distance > 2:
-        distance_transmission_chance = 0.25
-    else:
-        distance_transmission_chance = 1 / (distance ** 2)  # Inverse square law
+    interactions = np.asarray(interactions, float).reshape(-1, 3)
+    person_1_indices = interactions[:, 0].astype(int) - 1
+    person_2_indices = interactions[:, 1].astype(int) - 1
+
+    # 0, 1 or 2 masks
+    mask_transmission_chance = MASK_FACTORS[people.mask[person_1_indices].astype(int)
+                                            + people.mask[person_2_indices].astype(int)]
+    distance_transmission_chance = get_distance_factors(interactions[:, 2])
 
     transmission_chance = mask_transmission_chance * distance_transmission_chance * virality * 0.01
 
@@ -97,40 +87,32 @@ def get_transmission_chance(interaction, people, virality):
 
 
 def get_total_infected(people):
-    """"Iterate through people (person objects) and calculate total number of infected people"""
-    infected = 0
-    for person in people:
-        if people[person].infected:
-            infected += 1
-        else:
-            pass
-    return infected
+    """"Count the infected people in the population"""
+    return people.get_total_infected()
 
 
 def get_total_contagious(people):
-    """"Iterate through people (person objects) and calculate total number of contagious people"""
-    contagious = 0
-    for person in people:
-        if people[person].contagious:
-            contagious += 1
-        else:
-            pass
-    return contagious
-
-
-def determine_infection(contagious_interactions, people,virality):
-    """determine_infection calculates whether an infection has taken place and updates the people class"""
-    infection_occurred_step = False
-    for n in range(0, len(contagious_interactions)):
-        transmission_random_number = random.uniform(0, 1)
-        non_infected_id = abs(int(contagious_interactions[n][1]))
-
-        interaction_transmission_chance = get_transmission_chance(contagious_interactions[n], people,virality)
-
-        if transmission_random_number < interaction_transmission_chance:
-            people[non_infected_id].infected = True
-            people[non_infected_id].infector_ID = contagious_interactions[n][0]  # Infector ID for tree building
-            infection_occurred_step = True
+    """"Count the contagious people in the population"""
+    return people.get_total_contagious()
+
+
+def determine_infection(contagious_interactions, people, virality):
+    """
+    determine_infection calculates whether an infection has taken place for every contagious
+    interaction at once and updates the population. If a non infected individual is infected in
+    more than one interaction, their infector is the infector of the last of those interactions.
+    """
+    contagious_interactions = np.asarray(contagious_interactions, float).reshape(-1, 3)
+    transmission_random_numbers = people.streams.transmission.random(len(contagious_interactions))
+    interaction_transmission_chances = get_transmission_chance(contagious_interactions, people, virality)
+    transmissions = contagious_interactions[transmission_random_numbers < interaction_transmission_chances]
+
+    # Keep the last transmission to each non infected individual
+    non_infected_IDs, last = np.unique(transmissions[::-1, 1].astype(int), return_index=True)
+    infector_IDs = transmissions[::-1, 0].astype(int)[last]
+    people.infected[non_infected_IDs - 1] = True
+    people.infector_ID[non_infected_IDs - 1] = infector_IDs  # Infector ID for tree building
+    infection_occurred_step = len(transmissions) > 0
     return infection_occurred_step
 
 
@@ -139,7 +121,7 @@ def step_transmission(people, interactions, virality):
     if len(interactions) > 0:  # Checking if any general interactions have happened in the step
         contagious_interactions = get_contagious_interactions(people, interactions)
         if len(contagious_interactions) > 0:  # Checking if any contagious interactions have happened in the step
-            infection_occurred_step = determine_infection(contagious_interactions, people,virality)
+            infection_occurred_step = determine_infection(contagious_interactions, people, virality)
 
             if infection_occurred_step:
                 infected = get_total_infected(people)
@@ -0,0 +1,195 @@
+"""
+
+zones.py
+
+This script contains a class that plans long paths across large offices on a graph of zones, rather than searching
+the whole office grid for each path. The office is split into square zones, and an entrance is placed on each open
+stretch of the border between two zones, in the way of hierarchical pathfinding (HPA*). The graph links the two sides of
+each entrance, and every pair of entrances of a zone that can reach each other within the zone, by the length of the
+shortest path between them. It is built once for each office, from its walls only.
+
+To find a path, the start and end are linked to the entrances of their zones and the path is planned on the zone
+graph, which has a few nodes for each zone rather than a node for each cell. Only the first part of the planned path,
+near the person, is then searched for on the office grid, around the people in the way, within the zones it passes
+through. Once the person has followed it they plan again from where they are, so people who block cells further along
+the route are taken into account as the person reaches them.
+
+Paths are near-shortest rather than shortest, as they pass through entrances. If no path can be planned on the zone
+graph or found near the person, e.g. as people block every way out of a zone, the whole office grid is searched
+instead, so a path is found whenever one exists.
+
+Used by office.py and benchmark.py.
+"""
+
+# External modules
+import heapq
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+
+# Directory modules
+from covidsim.floorplan import WALL
+import covidsim.office as office
+import covidsim.jump_point as jump_point
+
+# Width and height of each zone, in cells
+ZONE_SIZE = 16
+# Open stretches of border at least this long have an entrance at each end rather than one in the middle
+LONG_ENTRANCE = 6
+
+
+class ZoneGraph:
+    """A graph of the entrances between the zones of an office, with the length of the shortest path along each edge,
+    used to plan paths across the office"""
+
+    def __init__(self, floor_grid, zone_size=ZONE_SIZE):
+        """Build the zone graph of an office from its floor grid"""
+        self.floor = floor_grid != WALL
+        self.zone_size = zone_size
+        self.shape = self.floor.shape
+        # Entrance cells, the node number of each entrance cell and the entrances of each zone
+        self.cells = []
+        self.nodes = {}
+        self.zone_nodes = {}
+        # Edges of each node, as lists of (node, length) pairs
+        self.edges = []
+        self.add_entrances()
+        # Graph of the floor cells of each zone, and the lengths of paths between its entrances within it
+        self.zone_graphs = {}
+        for zone in self.zone_nodes:
+            self.link_zone(zone)
+        self.cell_array = np.array(self.cells, int).reshape(-1, 2)
+
+    def get_zone(self, location):
+        """Returns the zone of a (row, column) location, as the (row, column) of the zone"""
+        return location[0] // self.zone_size, location[1] // self.zone_size
+
+    def get_zone_window(self, zone):
+        """Returns the rows and columns of the office covered by a zone, as slices"""
+        row, column = zone[0] * self.zone_size, zone[1] * self.zone_size
+        return slice(row, min(row + self.zone_size, self.shape[0])), slice(column, min(column + self.zone_size,
+                                                                                       self.shape[1]))
+
+    def add_node(self, cell):
+        """Returns the node of an entrance cell, adding it to its zone if it is new"""
+        if cell not in self.nodes:
+            self.nodes[cell] = len(self.cells)
+            self.cells.append(cell)
+            self.edges.append([])
+            self.zone_nodes.setdefault(self.get_zone(cell), []).append(self.nodes[cell])
+        return self.nodes[cell]
+
+    def add_entrances(self):
+        """Add an entrance for each open stretch of the border between two zones, made of pairs of cells on either side
+        of the border that are both floor, linking the two sides of each entrance"""
+        rows, columns = self.shape
+        # Borders between zones side by side, where each pair is (row, column - 1) and (row, column)...
+        borders = [((row, column - 1), (row, column)) for column in range(self.zone_size, columns, self.zone_size)
+                   for row in range(rows)]
+        # ... and between zones one above the other
+        borders += [((row - 1, column), (row, column)) for row in range(self.zone_size, rows, self.zone_size)
+                    for column in range(columns)]
+        stretch = []
+        for pair in borders + [None]:
+            # A stretch ends at a blocked pair, at the corner of a zone, or where the border ends
+            continues = (pair is not None and stretch and self.get_zone(pair[0]) == self.get_zone(stretch[-1][0])
+                         and abs(pair[0][0] - stretch[-1][0][0]) + abs(pair[0][1] - stretch[-1][0][1]) == 1)
+            if not continues and stretch:
+                ends = [stretch[len(stretch) // 2]] if len(stretch) < LONG_ENTRANCE else [stretch[0], stretch[-1]]
+                for first, second in ends:
+                    first_node, second_node = self.add_node(first), self.add_node(second)
+                    self.edges[first_node].append((second_node, 1.0))
+                    self.edges[second_node].append((first_node, 1.0))
+                stretch = []
+            if pair is not None and self.floor[pair[0]] and self.floor[pair[1]]:
+                stretch.append(pair)
+
+    def link_zone(self, zone):
+        """Link every pair of entrances of a zone that can reach each other within the zone"""
+        rows, columns = self.get_zone_window(zone)
+        graph = office.get_grid_graph(self.floor[rows, columns])
+        self.zone_graphs[zone] = graph
+        nodes = self.zone_nodes[zone]
+        lengths = dijkstra(graph, directed=False, indices=[self.get_zone_cell(self.cells[node]) for node in nodes])
+        for node, node_lengths in zip(nodes, lengths):
+            for other in nodes:
+                length = node_lengths[self.get_zone_cell(self.cells[other])]
+                if other != node and np.isfinite(length):
+                    self.edges[node].append((other, float(length)))
+
+    def get_zone_cell(self, location):
+        """Returns the number of the cell of a location within the graph of its zone"""
+        rows, columns = self.get_zone_window(self.get_zone(location))
+        return (location[0] - rows.start) * (columns.stop - columns.start) + location[1] - columns.start
+
+    def get_entrance_lengths(self, location):
+        """Returns the entrances of the zone of a location that can be reached from it within the zone, as (node,
+        length) pairs, and the lengths of paths to every cell of the zone"""
+        zone = self.get_zone(location)
+        lengths = dijkstra(self.zone_graphs[zone], directed=False, indices=self.get_zone_cell(location))
+        entrances = [(node, float(lengths[self.get_zone_cell(self.cells[node])])) for node in self.zone_nodes[zone]]
+        return [(node, length) for node, length in entrances if np.isfinite(length)], lengths
+
+    def plan_route(self, start_location, end_location):
+        """Returns the cells of a near-shortest route from a start to an end location through the entrances of the
+        zone graph, ignoring people, or an empty list if there is none"""
+        if self.get_zone(start_location) not in self.zone_graphs or self.get_zone(end_location) not in self.zone_graphs:
+            return []
+        # Link the start and end to the entrances of their zones, as two extra nodes
+        start, end = len(self.cells), len(self.cells) + 1
+        start_edges, start_lengths = self.get_entrance_lengths(start_location)
+        end_edges = dict(self.get_entrance_lengths(end_location)[0])
+        if self.get_zone(start_location) == self.get_zone(end_location):
+            direct = start_lengths[self.get_zone_cell(end_location)]
+            if np.isfinite(direct):
+                start_edges = start_edges + [(end, float(direct))]
+        cells = self.cells + [start_location, end_location]
+        # Length of the shortest path from each node to the end, ignoring walls, found for every node at once
+        offsets = np.abs(np.concatenate((self.cell_array, [start_location, end_location])) - end_location)
+        estimates = ((jump_point.SQRT2 - 1) * offsets.min(axis=1) + offsets.max(axis=1)).tolist()
+
+        # A* search of the zone graph
+        costs = {start: 0.0}
+        parents = {start: None}
+        open_list = [(0.0, start)]
+        closed = set()
+        while open_list:
+            _, node = heapq.heappop(open_list)
+            if node in closed:
+                continue
+            if node == end:
+                route = [end]
+                while parents[route[-1]] is not None:
+                    route.append(parents[route[-1]])
+                return [cells[node] for node in reversed(route)]
+            closed.add(node)
+            edges = start_edges if node == start else self.edges[node]
+            if node in end_edges:
+                edges = edges + [(end, end_edges[node])]
+            for other, length in edges:
+                cost = costs[node] + length
+                if other not in closed and cost < costs.get(other, np.inf):
+                    costs[other] = cost
+                    parents[other] = node
+                    heapq.heappush(open_list, (cost + estimates[other], other))
+        return []
+
+    def find_path(self, array, start_location, end_location):
+        """Returns a path from a start location towards an end location through a pathfinding array, in the format of
+        jump_point.find_path. The path follows the route planned on the zone graph, and leads to the first entrance
+        of the route at least a zone away, or to the end location if it is nearer."""
+        route = self.plan_route(start_location, end_location)
+        if route:
+            # Search for a path to the first cell of the route a zone away, within the zones the route passes through
+            target = next((index for index, cell in enumerate(route) if max(abs(cell[0] - start_location[0]),
+                                                                             abs(cell[1] - start_location[1]))
+                           >= self.zone_size), len(route) - 1)
+            zones = np.array([self.get_zone(cell) for cell in route[:target + 1]])
+            top, left = zones.min(axis=0) * self.zone_size
+            bottom, right = (zones.max(axis=0) + 1) * self.zone_size
+            path = jump_point.find_path(array[top:bottom, left:right],
+                                        (start_location[0] - top, start_location[1] - left),
+                                        (route[target][0] - top, route[target][1] - left))
+            if len(path) > 0:
+                return [(column + left, row + top) for column, row in path]
+        # No route, or people block the way near the person, so search the whole office
+        return jump_point.find_path(array, start_location, end_location)
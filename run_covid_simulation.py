@@ -10,34 +10,248 @@ Commands:
     
 Inputs: <simulation_inputs.txt>    When no commands used, a text file containing a valid dictionary of parameter 
                                    values can be input to run the simulation without a GUI, potentially for batch tests. 
+                                   The animation is saved to ./Plots/animation.gif as the simulation runs.
+
+        <simulation_inputs.txt> [--mp4] [--plots]
+                                   --mp4 saves the animation as ./Plots/animation.mp4 (requires imageio-ffmpeg) and
+                                   --plots also saves a .png plot of each frame.
+
+        <simulation_inputs.txt> --headless [metrics.json | metrics.csv]
+                                   Run the simulation without display frames, plots, animation or printed output,
+                                   saving the number of infected, contagious and susceptible people and interactions
+                                   at each time step, and each infection with its infector, to a .json file
+                                   (metrics.json by default) or to .csv files of time series and infection events.
+
+        <simulation_inputs.txt> --ensemble <N>
+                                   Run N replicas of the simulation with the parameters in the text file in parallel,
+                                   saving statistics of the number of infected people at each time step to
+                                   ensemble_results.csv instead of plots.
+
+        <simulation_inputs.txt> [--headless ...] --events
+                                   Step the simulation event-driven, processing only people who are moving or have
+                                   finished their task in each time step, and not searching for paths that people
+                                   blocking the way make impossible. Results are identical and long simulations run
+                                   faster. Simulations run with or without display, --headless, --checkpoint, --resume
+                                   or --fork can be stepped event-driven.
+
+        <simulation_inputs.txt> [--headless ...] --profile
+                                   Also record the time spent in each phase of the simulation and counts of path
+                                   searches, interactions and infections, printing a report and saving the timings and
+                                   counts of each time step to profile_trace.jsonl. Only simulations run with or
+                                   without display, --headless or --checkpoint can be profiled.
+
+        <simulation_inputs.txt> --checkpoint <N> [snapshot.npz] [metrics.json | metrics.csv]
+                                   Run the simulation as with --headless, also saving a snapshot of its full state to
+                                   snapshot.npz every N time steps and at the end, so it can be resumed after a crash
+                                   or used as a warm-up to fork scenarios from.
+
+        <snapshot.npz> --resume [metrics.json | metrics.csv]
+                                   Resume a simulation from a snapshot until the end of its duration, saving the
+                                   metrics of the whole simulation as with --headless.
+
+        <snapshot.npz> --fork <branches.txt> [fork_metrics.json | fork_metrics.csv]
+                                   Resume a branch of a simulation from a snapshot for each dictionary of parameter
+                                   changes in a list in the text file e.g. [{'Virality': 10}, {'Virality': 90}], in
+                                   parallel. Only 'Virality' and 'Simulation Duration' may be changed. The metrics of
+                                   each branch are saved to fork_metrics_1.json, fork_metrics_2.json and so on.
+
+        --benchmark [--quick] [benchmark_results.json] [baseline.json]
+                                   Benchmark the simulation on each office plan and on larger generated floors, saving
+                                   the results to a .json file and a scaling report to a _report.txt file. --quick runs
+                                   smaller sweeps. If the results of a baseline are given, speeds are compared with it.
+
+        <building_inputs.txt> --building [building_metrics.json | building_metrics.csv]
+                                   Run a simulation of a building of several floors, with 'Floors' and 'People per
+                                   Floor' lists in place of 'Office Plan' and 'Number of People', and optionally a
+                                   'Shared Floor' visited by lift from every floor. Each floor runs in a process of its
+                                   own. The metrics of the building are saved as with --headless.
+
+        <sweep_inputs.txt> --sweep <N>
+                                   Run N replicas of every combination of parameter values in the text file, where
+                                   parameters may be given as lists of values e.g. 'Mask Adherence': [0, 50, 100].
+                                   Results are appended to sweep_results.db and points already stored are skipped.
 """
 
+EXPORT_OPTIONS = ['--mp4', '--plots']
+
+
+def read_parameters(file_name):
+    """Reads a dictionary of parameters from a text file"""
+    file = open(file_name, 'r')
+    contents = file.read()
+    try:
+        # Import parameters from text file as dictionary
+        parameters = ast.literal_eval(contents)
+    except SyntaxError:
+        print('Error: dictionary syntax invalid.')
+        raise SystemExit
+    finally:
+        file.close()
+    return parameters
+
+
+def save_profile(instrumentation, file_name='profile_trace.jsonl'):
+    """Prints the report of an instrumented simulation and saves its trace"""
+    print(instrumentation.get_report())
+    instrumentation.save_trace(file_name)
+    print('Profile trace saved to ' + os.path.realpath(file_name))
+
+
+def check_not_profiled(instrumentation, mode):
+    """Exits with an error if timings were requested for a mode that does not record them"""
+    if instrumentation is not None:
+        print('Error: --profile cannot be used with ' + mode + '. Use --help for program explanation.')
+        raise SystemExit
+
+
+def check_not_event_driven(event_driven, mode):
+    """Exits with an error if event-driven stepping was requested for a mode that does not use it"""
+    if event_driven:
+        print('Error: --events cannot be used with ' + mode + '. Use --help for program explanation.')
+        raise SystemExit
+
 
 def main(*arguments):
     """Checks commands valid and selects either GUI or .txt for simulation."""
-    if len(arguments) > 1:
+    # Record timings of .txt simulations if requested
+    instrumentation = Instrumentation() if '--profile' in arguments else None
+    # Step .txt simulations event-driven if requested
+    event_driven = '--events' in arguments
+    arguments = [argument for argument in arguments if argument not in ['--profile', '--events']]
+    if len(arguments) == 3 and arguments[0].endswith('txt') and arguments[1] == '--ensemble':
+        # Run replicas of the simulation in parallel and save statistics of their results
+        check_not_profiled(instrumentation, '--ensemble')
+        check_not_event_driven(event_driven, '--ensemble')
+        if not arguments[2].isdigit() or int(arguments[2]) < 1:
+            print('Error: number of replicas must be a positive integer.')
+            raise SystemExit
+        parameters = read_parameters(arguments[0])
+        statistics = ensemble.run_ensemble(parameters, int(arguments[2]))
+        statistics.save('ensemble_results.csv')
+        for name, value in statistics.summary().items():
+            print(name + ':', round(value, 4))
+        print('Ensemble statistics saved to ' + os.path.realpath('ensemble_results.csv'))
+    elif len(arguments) in [2, 3] and arguments[0].endswith('txt') and arguments[1] == '--headless':
+        # Run the simulation without display and save its metrics only
+        file_name = arguments[2] if len(arguments) == 3 else 'metrics.json'
+        if not file_name.endswith(('.json', '.csv')):
+            print('Error: metrics file must be a .json or .csv file.')
+            raise SystemExit
+        parameters = read_parameters(arguments[0])
+        metrics.save_metrics(simulation.main(parameters, headless=True, instrumentation=instrumentation,
+                                             event_driven=event_driven), file_name)
+        print('Metrics saved to ' + os.path.realpath(file_name))
+        if instrumentation is not None:
+            save_profile(instrumentation)
+    elif len(arguments) in [3, 4, 5] and arguments[0].endswith('txt') and arguments[1] == '--checkpoint':
+        # Run the simulation without display, saving snapshots as it runs, and save its metrics
+        if not arguments[2].isdigit() or int(arguments[2]) < 1:
+            print('Error: snapshot interval must be a positive integer.')
+            raise SystemExit
+        # The snapshot and metrics files are both optional, and told apart by their extensions
+        options = arguments[3:]
+        snapshot_file = options.pop(0) if options and options[0].endswith('.npz') else 'snapshot.npz'
+        file_name = options.pop(0) if options else 'metrics.json'
+        if options or not file_name.endswith(('.json', '.csv')):
+            print('Error: snapshot file must be a .npz file and metrics file must be a .json or .csv file.')
+            raise SystemExit
+        parameters = read_parameters(arguments[0])
+        checkpoint = snapshot.Checkpoint(snapshot_file, int(arguments[2]))
+        metrics.save_metrics(simulation.main(parameters, headless=True, instrumentation=instrumentation,
+                                             event_driven=event_driven, checkpoint=checkpoint), file_name)
+        print('Snapshot saved to ' + os.path.realpath(snapshot_file))
+        print('Metrics saved to ' + os.path.realpath(file_name))
+        if instrumentation is not None:
+            save_profile(instrumentation)
+    elif len(arguments) in [2, 3] and arguments[0].endswith('.npz') and arguments[1] == '--resume':
+        # Resume a simulation from a snapshot and save its metrics
+        check_not_profiled(instrumentation, '--resume')
+        file_name = arguments[2] if len(arguments) == 3 else 'metrics.json'
+        if not file_name.endswith(('.json', '.csv')):
+            print('Error: metrics file must be a .json or .csv file.')
+            raise SystemExit
+        metrics.save_metrics(snapshot.resume_simulation(arguments[0], event_driven=event_driven), file_name)
+        print('Metrics saved to ' + os.path.realpath(file_name))
+    elif len(arguments) in [3, 4] and arguments[0].endswith('.npz') and arguments[1] == '--fork':
+        # Fork branches of a simulation from a snapshot and save the metrics of each branch
+        check_not_profiled(instrumentation, '--fork')
+        file_name = arguments[3] if len(arguments) == 4 else 'fork_metrics.json'
+        if not file_name.endswith(('.json', '.csv')):
+            print('Error: metrics file must be a .json or .csv file.')
+            raise SystemExit
+        branches = read_parameters(arguments[2])
+        if not isinstance(branches, list) or not all(isinstance(changes, dict) for changes in branches):
+            print('Error: branches must be a list of dictionaries of parameter changes.')
+            raise SystemExit
+        root, extension = os.path.splitext(file_name)
+        for branch, branch_metrics in enumerate(snapshot.fork_simulation(arguments[0], branches,
+                                                                         event_driven=event_driven), 1):
+            metrics.save_metrics(branch_metrics, root + '_' + str(branch) + extension)
+            print('Metrics of branch', branch, 'saved to ' + os.path.realpath(root + '_' + str(branch) + extension))
+    elif len(arguments) in [2, 3] and arguments[0].endswith('txt') and arguments[1] == '--building':
+        # Run a simulation of a building with a process for each floor and save its metrics
+        check_not_profiled(instrumentation, '--building')
+        check_not_event_driven(event_driven, '--building')
+        file_name = arguments[2] if len(arguments) == 3 else 'building_metrics.json'
+        if not file_name.endswith(('.json', '.csv')):
+            print('Error: metrics file must be a .json or .csv file.')
+            raise SystemExit
+        parameters = read_parameters(arguments[0])
+        metrics.save_metrics(building.main(parameters), file_name)
+        print('Building metrics saved to ' + os.path.realpath(file_name))
+    elif len(arguments) == 3 and arguments[0].endswith('txt') and arguments[1] == '--sweep':
+        # Run replicas of every point of a grid of parameters and store their results
+        check_not_profiled(instrumentation, '--sweep')
+        check_not_event_driven(event_driven, '--sweep')
+        if not arguments[2].isdigit() or int(arguments[2]) < 1:
+            print('Error: number of replicas must be a positive integer.')
+            raise SystemExit
+        inputs = read_parameters(arguments[0])
+        parameters = {name: value for name, value in inputs.items() if not isinstance(value, list)}
+        grid = {name: value for name, value in inputs.items() if isinstance(value, list)}
+        sweep.run_sweep(parameters, grid, int(arguments[2]))
+        for point in sweep.summarise_results(points=sweep.get_sweep_points(parameters, grid)):
+            print(', '.join(name + ': ' + str(point[name]) for name in list(grid) + ['Replicas']),
+                  '- Attack Rate Mean:', round(point['Attack Rate Mean'], 4))
+        print('Sweep results saved to ' + os.path.realpath('sweep_results.db'))
+    elif arguments and arguments[0].endswith('txt') and all(argument in EXPORT_OPTIONS for argument in arguments[1:]):
+        # Read in text file input parameters and run the simulation without GUI
+        parameters = read_parameters(arguments[0])
+
+        # Run simulation, saving outputs as each frame is produced
+        file_name = 'animation.mp4' if '--mp4' in arguments else 'animation.gif'
+        print('Saving animation while running...')
+        with export.FrameExporter(file_name=file_name, save_plots='--plots' in arguments) as exporter:
+            simulation.main(parameters, exporter, instrumentation=instrumentation, event_driven=event_driven)
+        if instrumentation is not None:
+            save_profile(instrumentation)
+    elif arguments and arguments[0] == '--benchmark':
+        # Benchmark the simulation and report how it scales
+        check_not_profiled(instrumentation, '--benchmark')
+        check_not_event_driven(event_driven, '--benchmark')
+        options = [argument for argument in arguments[1:] if argument != '--quick']
+        if len(options) > 2 or not all(option.endswith('.json') for option in options):
+            print('Error: benchmark results must be .json files. Use --help for program explanation.')
+            raise SystemExit
+        file_name = options[0] if options else 'benchmark_results.json'
+        baseline = benchmark.load_benchmarks(options[1]) if len(options) == 2 else None
+        results = benchmark.run_benchmarks(label=os.path.splitext(os.path.basename(file_name))[0],
+                                           quick='--quick' in arguments)
+        benchmark.save_benchmarks(results, file_name)
+        report = benchmark.get_report(results, baseline)
+        with open(os.path.splitext(file_name)[0] + '_report.txt', 'w') as file:
+            file.write(report + '\n')
+        print(report)
+        print('Benchmark results saved to ' + os.path.realpath(file_name))
+    elif len(arguments) > 1:
         print('Error: only one input allowed. Use --help for program explanation.')
     elif not arguments or arguments[0] == '--help':
         print(PROGRAM_EXPLANATION)
     elif len(arguments) == 1 and arguments[0] == '--GUI':
         # Run the simulation through the GUI interface
+        check_not_profiled(instrumentation, '--GUI')
+        check_not_event_driven(event_driven, '--GUI')
         GUI.GUI()
-    elif len(arguments) == 1 and arguments[0].endswith('txt'):
-        # Read in text file input parameters and run the simulation without GUI
-        file = open(arguments[0], 'r')
-        contents = file.read()
-        try:
-            # Import parameters from text file as dictionary
-            parameters = ast.literal_eval(contents)
-        except SyntaxError:
-            print('Error: dictionary syntax invalid.')
-            raise SystemExit
-        finally:
-            file.closed
-
-        # Run simulation and save outputs
-        sim = simulation.main(parameters)
-        simulation.save_outputs(sim)
     else:
         print(PROGRAM_EXPLANATION)
 
@@ -49,10 +263,19 @@ if __name__ == "__main__":
     # External modules
     import sys
     import ast
+    import os
 
     # Directory modules
     import covidsim.simulation as simulation
     import covidsim.GUI as GUI
+    import covidsim.ensemble as ensemble
+    import covidsim.sweep as sweep
+    import covidsim.export as export
+    import covidsim.metrics as metrics
+    import covidsim.benchmark as benchmark
+    import covidsim.building as building
+    import covidsim.snapshot as snapshot
+    from covidsim.instrumentation import Instrumentation
     
     arguments = sys.argv[1:]
     main(*arguments)